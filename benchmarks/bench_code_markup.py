@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+程式碼區塊標記大小比較：`torchlight_markup = 'full'` 與 `'compact'`
+
+將文件集 (預設為 `corpus.py` 產生的仿 Laravel 文件，或以 `--source` 指定 Laravel 文件的
+Markdown 目錄) 經過預處理後的每個程式碼區塊，分別以兩種 formatter 輸出，
+比較 HTML 大小 (原始與 deflate 壓縮後，EPUB 以 deflate 封裝)、每行的元素數量，
+並確認每個區塊的輸出都是格式正確的 XHTML (有錯誤時以非零狀態結束)。
+
+執行方式：
+
+    python3 benchmarks/bench_code_markup.py [--source source] [--files 100]
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import xml.etree.ElementTree as ElementTree
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'bin'))
+sys.path.insert(0, os.path.join(ROOT, 'sphinx_extensions'))
+
+from processors import markdown_scanner
+from processors.markdown_scanner import Fence
+from processors.pipeline import run_pipeline
+
+import torchlight
+from corpus import generate_corpus
+from run_benchmarks import _lexer
+
+XHTML_NAMESPACE = 'http://www.w3.org/1999/xhtml'
+
+
+def collect_blocks(source_dir: str) -> list[tuple[str, str]]:
+    """回傳所有程式碼區塊的 (語言, 內容)。"""
+    blocks = []
+    for filename in sorted(os.listdir(source_dir)):
+        if not filename.endswith('.md'):
+            continue
+        with open(os.path.join(source_dir, filename), 'r', encoding='utf-8') as f:
+            content = run_pipeline(f.read(), os.devnull, {})
+        for segment in markdown_scanner.scan(content):
+            if isinstance(segment, Fence):
+                blocks.append((segment.language or 'text', segment.body))
+    return blocks
+
+
+def measure(formatter_class, blocks) -> dict:
+    total = {'bytes': 0, 'deflated': 0, 'elements': 0, 'invalid': 0}
+    pages = []
+    for language, body in blocks:
+        out = io.StringIO()
+        formatter_class(style='friendly_grayscale').format(_lexer(language).get_tokens(body), out)
+        html = out.getvalue()
+        total['bytes'] += len(html.encode('utf-8'))
+        total['elements'] += html.count('<span')
+        try:
+            ElementTree.fromstring(f'<div xmlns="{XHTML_NAMESPACE}">{html}</div>')
+        except ElementTree.ParseError as e:
+            total['invalid'] += 1
+            print(f"  invalid XHTML ({formatter_class.__name__}, {language}): {e}")
+        pages.append(html)
+    # 以整份輸出一起壓縮，較接近 EPUB 內每個頁面的壓縮情形
+    total['deflated'] = len(zlib.compress(''.join(pages).encode('utf-8'), 6))
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', help='Laravel 文件的 Markdown 目錄 (預設產生仿 Laravel 文件)')
+    parser.add_argument('--files', type=int, default=100, help='產生的文件數量 (預設 100)')
+    parser.add_argument('--seed', type=int, default=1, help='亂數種子 (預設 1)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_dir = args.source
+        if source_dir is None:
+            source_dir = os.path.join(temp_dir, 'corpus')
+            generate_corpus(source_dir, args.files, args.seed)
+        blocks = collect_blocks(source_dir)
+
+    code_bytes = sum(len(body.encode('utf-8')) for _, body in blocks)
+    lines = sum(body.count('\n') + (not body.endswith('\n')) for _, body in blocks if body)
+    print(f"blocks={len(blocks)} lines={lines} code={code_bytes / 1024:.1f} KB")
+
+    results = {mode: measure(formatter_class, blocks) for mode, formatter_class in torchlight.FORMATTERS.items()}
+    for mode, total in results.items():
+        print(f"{mode:<8}: {total['bytes'] / 1024:9.1f} KB ({total['bytes'] / code_bytes:.1f}x code), "
+              f"deflated {total['deflated'] / 1024:8.1f} KB, {total['elements'] / lines:.1f} elements/line")
+
+    full, compact = results['full'], results['compact']
+    print(f"compact saves {(full['bytes'] - compact['bytes']) / 1024:.1f} KB "
+          f"({(1 - compact['bytes'] / full['bytes']) * 100:.0f}%), "
+          f"{(full['deflated'] - compact['deflated']) / 1024:.1f} KB deflated "
+          f"({(1 - compact['deflated'] / full['deflated']) * 100:.0f}%)")
+
+    invalid = sum(total['invalid'] for total in results.values())
+    if invalid:
+        print(f"FAILED: {invalid} blocks are not well-formed XHTML")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
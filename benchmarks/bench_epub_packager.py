@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+EPUB 封裝比較：Sphinx 內建的封裝 (zipfile 逐一 deflate 所有檔案) 與 `epub_packager`
+
+以 Sphinx 建置完成的 EPUB 輸出目錄 (例如執行 `bin/build.sh` 後的 `build/color`、`build/grayscale`) 中的檔案，
+依與 Sphinx 相同的順序 (mimetype、container.xml、content.opf、toc.ncx、manifest 中的檔案) 分別以兩種方式封裝，
+量測時間 (多次取最佳值) 與 EPUB 大小。`epub_packager` 以數種壓縮層級與 thread 數量量測。
+
+每個輸出都會確認：ZIP 的 CRC 正確、mimetype 為第一個且未壓縮、檔案順序與內容與內建封裝相同，有錯誤時以非零狀態結束。
+
+執行方式 (於專案根目錄)：
+
+    python3 benchmarks/bench_epub_packager.py [--epub-dir build/color ...] [--levels 1,6,9] [-j auto] [--repeat 3]
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import tempfile
+import time
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'sphinx_extensions'))
+
+from epub_packager import Entry, write_epub
+
+OPF_ITEM_HREF = re.compile(r'<item\s[^>]*?href="([^"]+)"')
+# Sphinx 的 build_epub 先寫入的檔案，其餘檔案依 manifest 的順序
+FIRST_FILES = ('mimetype', 'META-INF/container.xml', 'content.opf', 'toc.ncx')
+
+
+def epub_files(epub_dir: str) -> list[str]:
+    with open(os.path.join(epub_dir, 'content.opf'), 'r', encoding='utf-8') as f:
+        hrefs = OPF_ITEM_HREF.findall(f.read())
+    return list(dict.fromkeys([*FIRST_FILES, *(href for href in hrefs if href not in FIRST_FILES)]))
+
+
+def stock_package(epub_dir: str, names: list[str], path: str) -> None:
+    """與 Sphinx 的 EpubBuilder.build_epub 相同。"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as epub:
+        epub.write(os.path.join(epub_dir, 'mimetype'), 'mimetype', zipfile.ZIP_STORED)
+        for name in names[1:]:
+            epub.write(os.path.join(epub_dir, name), name, zipfile.ZIP_DEFLATED)
+
+
+def _best(function, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def verify(path: str, reference: str) -> list[str]:
+    """回傳與內建封裝的差異 (空清單表示正確)。"""
+    errors = []
+    with zipfile.ZipFile(path) as epub, zipfile.ZipFile(reference) as stock:
+        bad = epub.testzip()
+        if bad is not None:
+            errors.append(f"bad CRC in {bad}")
+        infos = epub.infolist()
+        if infos[0].filename != 'mimetype' or infos[0].compress_type != zipfile.ZIP_STORED:
+            errors.append("mimetype is not the first, stored entry")
+        if [info.filename for info in infos] != stock.namelist():
+            errors.append("entry order differs")
+        errors.extend(f"content of {name} differs" for name in stock.namelist() if epub.read(name) != stock.read(name))
+    return errors
+
+
+def bench(epub_dir: str, levels: list[int], jobs: int, repeat: int) -> int:
+    names = epub_files(epub_dir)
+    size = sum(os.path.getsize(os.path.join(epub_dir, name)) for name in names)
+    print(f"{epub_dir}: {len(names)} files, {size / 1024:.1f} KB")
+    failures = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stock_path = os.path.join(temp_dir, 'stock.epub')
+        seconds = _best(lambda: stock_package(epub_dir, names, stock_path), repeat)
+        stock_size = os.path.getsize(stock_path)
+        print(f"  {'stock (zipfile)':<28}: {seconds * 1000:8.1f} ms, {stock_size / 1024:9.1f} KB")
+
+        entries = [Entry(name, os.path.join(epub_dir, name)) for name in names]
+        for level in levels:
+            for threads in dict.fromkeys((1, jobs)):
+                path = os.path.join(temp_dir, f"packager-{level}-{threads}.epub")
+                seconds_packager = _best(lambda: write_epub(path, entries, level, threads), repeat)
+                packaged = os.path.getsize(path)
+                label = f"packager level {level}, {threads} thread{'s' if threads > 1 else ''}"
+                print(f"  {label:<28}: {seconds_packager * 1000:8.1f} ms, {packaged / 1024:9.1f} KB "
+                      f"({seconds / seconds_packager:.1f}x faster, {(packaged - stock_size) / 1024:+.1f} KB)")
+                for error in verify(path, stock_path):
+                    print(f"    FAILED: {error}")
+                    failures += 1
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--epub-dir', action='append',
+                        help='Sphinx 的 EPUB 輸出目錄 (可重複指定，預設為 build 下所有含 content.opf 的目錄)')
+    parser.add_argument('--levels', default='1,6,9', help='epub_packager 的壓縮層級 (預設 1,6,9)')
+    parser.add_argument('-j', '--jobs', default='auto', help="壓縮的 thread 數量，'auto' 為 CPU 數 (預設 auto)")
+    parser.add_argument('--repeat', type=int, default=3, help='重複次數，取最佳值 (預設 3)')
+    args = parser.parse_args()
+
+    epub_dirs = args.epub_dir or sorted(os.path.dirname(path)
+                                        for path in glob.glob(os.path.join(ROOT, 'build', '*', 'content.opf')))
+    if not epub_dirs:
+        print("Error: No EPUB output directory found, run bin/build.sh first or pass --epub-dir")
+        sys.exit(1)
+    jobs = (os.cpu_count() or 1) if args.jobs == 'auto' else int(args.jobs)
+    levels = [int(level) for level in args.levels.split(',')]
+    print(f"cpus={os.cpu_count()} threads={jobs}")
+
+    failures = sum(bench(epub_dir, levels, jobs, args.repeat) for epub_dir in epub_dirs)
+    if failures:
+        print(f"FAILED: {failures} errors")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
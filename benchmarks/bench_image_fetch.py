@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+驗收測試：同時下載圖片的總時間應接近最慢的單一請求
+
+以本地 stub 伺服器模擬有延遲的圖片來源，比較逐一下載與 `fetch_images` 同時下載的時間。
+
+執行方式：
+
+    python3 benchmarks/bench_image_fetch.py [--images 24] [--max-overhead 1.5]
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'bin'))
+
+from processors.image_handler import fetch_images
+from processors.image_cache import ImageCache
+from stub_server import stub_server
+
+
+def timed_fetch(urls: list[str], max_workers: int) -> float:
+    # 每次使用全新的快取，確保真的經由網路下載
+    with tempfile.TemporaryDirectory() as image_output_dir, tempfile.TemporaryDirectory() as cache_dir, \
+         redirect_stdout(io.StringIO()):
+        cache = ImageCache(cache_dir)
+        start = time.perf_counter()
+        replacements = fetch_images(urls, image_output_dir, max_workers, cache)
+        elapsed = time.perf_counter() - start
+    if len(replacements) != len(set(urls)):
+        raise SystemExit(f"FAILED: only {len(replacements)} of {len(set(urls))} images downloaded")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=24, help='不重複的圖片數量 (預設 24)')
+    parser.add_argument('--max-overhead', type=float, default=1.5,
+                        help='同時下載總時間允許為最慢單一請求的幾倍 (預設 1.5)')
+    args = parser.parse_args()
+
+    with stub_server() as server:
+        # 延遲介於 0.1 ~ 0.4 秒，且每張圖片被三個頁面引用
+        latencies = [0.1 + 0.3 * i / max(1, args.images - 1) for i in range(args.images)]
+        urls = [f"{server.base_url}/img/shot-{i}.png?latency={latency:.3f}" for i, latency in enumerate(latencies)]
+        references = urls * 3
+        slowest = max(latencies)
+
+        serial = timed_fetch(references, max_workers=1)
+        concurrent = timed_fetch(references, max_workers=args.images)
+
+    print(f"images={args.images} references={len(references)}")
+    print(f"slowest single fetch : {slowest * 1000:8.1f} ms")
+    print(f"serial (1 worker)    : {serial * 1000:8.1f} ms")
+    print(f"concurrent           : {concurrent * 1000:8.1f} ms  ({concurrent / slowest:.2f}x slowest)")
+
+    if concurrent > slowest * args.max_overhead:
+        print("FAILED: concurrent fetch is not close to the slowest single fetch")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+平行建置測試：確認 `sphinx-build -j` 的輸出與單一行程完全相同，並量測速度
+
+1. 以 `-j 1` 與 `-j <N>` 各建置一次同一個版本 (停用高亮快取，讓每個程式碼區塊都實際經過 formatter)，
+   逐一比對輸出的檔案，有任何差異時以非零狀態結束。
+2. 從 doctree 取出所有程式碼區塊，分別以單一行程與 N 個行程重新高亮，
+   比對結果是否相同 (每個區塊的 `[tl! ...]` 狀態必須互相獨立)，並量測高亮階段的加速比。
+
+`book` 需為 template 的設定 (原始 Markdown 由 preprocess 擴充套件在建置時複製並處理，預設為 `source`)。
+執行方式 (於專案根目錄)：
+
+    python3 benchmarks/bench_parallel_build.py [--book-dir book] [--variant grayscale] [-j auto]
+"""
+
+import argparse
+import filecmp
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 內含建置時間 (conf.py 的 release) 或為壓縮檔，無法逐位元組比對
+UNCOMPARABLE = {'.buildinfo', '.doctrees', 'epub-cover.xhtml'}
+
+
+def sphinx_build(book_dir: str, outdir: str, variant: str, jobs: str) -> float:
+    command = [
+        sys.executable, '-m', 'sphinx', '-q', '-E', '-a', '-b', 'epub', '--conf-dir', '.',
+        '-j', jobs,
+        '-D', 'torchlight_cache_dir=',
+        '-D', 'image_optimizer_enabled=0',
+        '-D', 'release=benchmark',
+        '_source', outdir,
+    ]
+    env = {**os.environ, 'SPHINX_CUSTOM_CONFIG': variant, 'SOURCE_DATE_EPOCH': '0'}
+    start = time.perf_counter()
+    subprocess.run(command, cwd=book_dir, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def compare_trees(left: str, right: str) -> list[str]:
+    """回傳兩個輸出目錄中內容不同 (或只存在一邊) 的檔案。"""
+    differences = []
+    comparison = filecmp.dircmp(left, right, ignore=list(UNCOMPARABLE))
+    pending = [('', comparison)]
+    while pending:
+        prefix, current = pending.pop()
+        differences.extend(os.path.join(prefix, name) for name in current.left_only + current.right_only)
+        for name in current.common_files:
+            if name.endswith('.epub'):
+                continue
+            if not filecmp.cmp(os.path.join(current.left, name), os.path.join(current.right, name), shallow=False):
+                differences.append(os.path.join(prefix, name))
+        pending.extend((os.path.join(prefix, name), sub) for name, sub in current.subdirs.items())
+    return sorted(differences)
+
+
+def collect_blocks(doctree_dir: str) -> list[tuple]:
+    """從 doctree 取出 (程式碼, 語言, 高亮參數) 的清單。"""
+    from docutils import nodes
+
+    blocks = []
+    for filename in sorted(os.listdir(doctree_dir)):
+        if not filename.endswith('.doctree'):
+            continue
+        with open(os.path.join(doctree_dir, filename), 'rb') as f:
+            doctree = pickle.load(f)
+        for node in doctree.findall(nodes.literal_block):
+            if node.rawsource != node.astext():
+                continue  # 與 Sphinx 相同，已被處理過的區塊不再高亮
+            # 與 HTML writer (visit_literal_block) 傳給 highlight_block 的參數相同
+            options = dict(node.get('highlight_args', {}))
+            options['force'] = node.get('force', False)
+            linenos = 'inline' if node.get('linenos', False) else False
+            blocks.append((node.rawsource, node.get('language', 'default'), linenos, options))
+    return blocks
+
+
+def _init_highlighter(book_dir: str, style: str, languages: set[str]) -> None:
+    global _highlighter
+    # 與建置時的 lexer_registry 相同，依 conf_common.py 的別名表註冊 blade / env / shell / php-line 等 lexer，
+    # 不認得的語言以純文字顯示
+    sys.path.insert(0, book_dir)
+    import conf_common
+    from lexer_registry import SPHINX_LANGUAGES, LexerRegistry
+    from sphinx.highlighting import PygmentsBridge, lexer_classes, lexers
+    from torchlight import TorchlightHtmlFormatter
+
+    registry = LexerRegistry(conf_common.lexer_registry_aliases)
+    for language in sorted(languages):
+        if language not in SPHINX_LANGUAGES and language not in lexer_classes:
+            lexers[language] = registry.lexer(language) or lexer_classes['none']()
+
+    _highlighter = PygmentsBridge('html', style)
+    _highlighter.formatter = TorchlightHtmlFormatter
+
+
+def _highlight_chunk(chunk: list[tuple]) -> list[str]:
+    results = []
+    for source, lang, linenos, options in chunk:
+        results.append(_highlighter.highlight_block(source, lang, opts={}, linenos=linenos, **options))
+    return results
+
+
+def highlight_all(blocks: list[tuple], jobs: int, book_dir: str, style: str) -> tuple[float, list[str]]:
+    # 區塊依序切成固定大小的工作，讓每個行程處理的區塊交錯，檢驗區塊之間沒有共用狀態
+    chunks = [blocks[i:i + 16] for i in range(0, len(blocks), 16)]
+    languages = {lang for _source, lang, _linenos, _options in blocks}
+    start = time.perf_counter()
+    if jobs == 1:
+        _init_highlighter(book_dir, style, languages)
+        results = [html for chunk in chunks for html in _highlight_chunk(chunk)]
+    else:
+        with ProcessPoolExecutor(jobs, initializer=_init_highlighter,
+                                 initargs=(book_dir, style, languages)) as executor:
+            results = [html for chunk in executor.map(_highlight_chunk, chunks) for html in chunk]
+    return time.perf_counter() - start, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--book-dir', default=os.path.join(ROOT, 'book'), help='含 conf.py 與 _source 的目錄 (預設 book)')
+    parser.add_argument('--variant', default='grayscale', help='要建置的版本 (預設 grayscale)')
+    parser.add_argument('-j', '--jobs', default='auto', help="平行行程數，或 'auto' 使用所有 CPU (預設 auto)")
+    args = parser.parse_args()
+
+    book_dir = os.path.abspath(args.book_dir)
+    jobs = (os.cpu_count() or 1) if args.jobs == 'auto' else int(args.jobs)
+    sys.path.insert(0, os.path.join(ROOT, 'sphinx_extensions'))
+    print(f"cpus={os.cpu_count()} jobs={jobs}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        serial_dir = os.path.join(temp_dir, 'serial')
+        parallel_dir = os.path.join(temp_dir, 'parallel')
+
+        serial_time = sphinx_build(book_dir, serial_dir, args.variant, '1')
+        parallel_time = sphinx_build(book_dir, parallel_dir, args.variant, str(jobs))
+        print(f"sphinx-build -j 1 : {serial_time:7.2f} s")
+        print(f"sphinx-build -j {jobs} : {parallel_time:7.2f} s  ({serial_time / parallel_time:.2f}x)")
+
+        differences = compare_trees(serial_dir, parallel_dir)
+        if differences:
+            print(f"FAILED: {len(differences)} files differ between -j 1 and -j {jobs}:")
+            for name in differences[:20]:
+                print(f"  {name}")
+            sys.exit(1)
+        print("identical: serial and parallel build output match byte for byte")
+
+        blocks = collect_blocks(os.path.join(serial_dir, '.doctrees'))
+
+    style = 'friendly_grayscale' if args.variant == 'grayscale' else 'monokai'
+    serial_time, serial_results = highlight_all(blocks, 1, book_dir, style)
+    parallel_time, parallel_results = highlight_all(blocks, jobs, book_dir, style)
+    print(f"highlight {len(blocks)} blocks, 1 process : {serial_time * 1000:8.1f} ms")
+    print(f"highlight {len(blocks)} blocks, {jobs} processes: {parallel_time * 1000:8.1f} ms  "
+          f"({serial_time / parallel_time:.2f}x)")
+    if serial_results != parallel_results:
+        mismatches = sum(1 for a, b in zip(serial_results, parallel_results) if a != b)
+        print(f"FAILED: {mismatches} highlighted blocks differ between 1 and {jobs} processes")
+        sys.exit(1)
+    print("identical: highlighted blocks match across processes")
+
+
+if __name__ == "__main__":
+    main()
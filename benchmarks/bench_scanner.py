@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+效能回歸測試：以惡意輸入驗證預處理管道的時間與輸入大小成線性關係
+
+輸入包含大量未閉合的 ```html / ```php 區塊與上萬行的文件，
+舊版的 `re.sub(r"```html(.*?)```", ..., re.DOTALL)` 在這類輸入會退化為平方時間。
+
+執行方式：
+
+    python3 benchmarks/bench_scanner.py [--max-ratio 3.0]
+
+若最大規模的「每行耗時」超過最小規模的 `--max-ratio` 倍，會以非零狀態結束。
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+
+from processors.pipeline import run_pipeline
+
+SCALES = (1, 2, 4, 8)
+BASE_LINES = 10_000
+
+
+def unclosed_fences(lines: int) -> str:
+    """每隔幾行就開一個永遠不會閉合的程式碼區塊。"""
+    chunks = []
+    for i in range(lines // 4):
+        chunks.append("```html\n" if i % 2 else "```php\n")
+        chunks.append(f"+ <div>{i}</div> <!-- [tl! add] -->\n")
+        chunks.append("see ``` inline ``` fences\n")
+        chunks.append(f"[link](/docs/{{{{version}}}}/page{i})\n")
+    return ''.join(chunks)
+
+
+def long_document(lines: int) -> str:
+    """一般的長文件：文字、連結、圖片與已閉合的程式碼區塊交錯。"""
+    chunks = []
+    for i in range(lines // 10):
+        chunks.append(f"## Section {i}\n\n")
+        chunks.append(f"See [docs](/docs/{{{{version}}}}/page{i}#anchor-{i}) and <img src=\"local-{i}.png\">\n\n")
+        chunks.append("```shell tab=Linux\nphp artisan serve\n```\n\n")
+    return ''.join(chunks)
+
+
+def measure(content: str, image_output_dir: str, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_pipeline(content, image_output_dir)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-ratio', type=float, default=3.0,
+                        help='允許的每行耗時成長倍數 (預設 3.0)')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as image_output_dir:
+        for name, generator in (('unclosed_fences', unclosed_fences), ('long_document', long_document)):
+            per_line = []
+            for scale in SCALES:
+                lines = BASE_LINES * scale
+                elapsed = measure(generator(lines), image_output_dir)
+                per_line.append(elapsed / lines)
+                print(f"{name:16} lines={lines:>7}  time={elapsed * 1000:9.2f} ms  "
+                      f"per_line={elapsed / lines * 1e6:6.2f} us")
+
+            ratio = per_line[-1] / per_line[0]
+            print(f"{name:16} per-line growth x{SCALES[-1]}: {ratio:.2f}\n")
+            if ratio > args.max_ratio:
+                failed = True
+
+    if failed:
+        print("FAILED: time does not grow linearly with input size")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
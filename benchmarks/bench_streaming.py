@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+記憶體用量比較：整份讀入的預處理 (`run_pipeline`) 與串流模式 (`preprocess_docs.py --stream`)
+
+將 `corpus.py` 產生的文件串接成一份很大的 Markdown (模擬合併成單一頁面的 API 參考，預設 100 MB)，
+分別以兩種方式在獨立的 process 中處理，量測各自的最大 RSS (扣除載入模組後的基準) 與時間，
+並確認兩者的輸出完全相同，不同時以非零狀態結束。
+
+執行方式 (於專案根目錄)：
+
+    python3 benchmarks/bench_streaming.py [--size 100] [--modes whole,stream]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'bin'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from corpus import _titles, generate_document, page_names, slugify
+
+MODES = ('whole', 'stream')
+
+
+def generate_large_document(path: str, size: int, seed: int = 1) -> int:
+    """將仿 Laravel 文件依序寫入同一個檔案，直到達到 size 位元組，回傳實際大小。"""
+    rng = random.Random(seed)
+    pages = page_names(95)
+    anchors = {name: [slugify(title) for title in _titles(name)] for name in pages}
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < size:
+            for name in pages:
+                text = generate_document(rng, name, pages, anchors, 'https://laravel.com')
+                f.write(text)
+                f.write('\n')
+                written += len(text.encode('utf-8')) + 1
+                if written >= size:
+                    break
+    return written
+
+
+def _max_rss() -> int:
+    # Linux 的 ru_maxrss 單位為 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def child(mode: str, source: str, output_dir: str) -> None:
+    """於獨立的 process 中處理一次，印出 JSON 結果。"""
+    from processors.manifest import write_if_changed
+    from processors.pipeline import run_pipeline
+    import preprocess_docs
+
+    baseline = _max_rss()
+    start = time.perf_counter()
+    filename = os.path.basename(source)
+    if mode == 'whole':
+        # 串流模式加入前的處理方式
+        with open(source, 'r', encoding='utf-8') as f:
+            content = f.read()
+        content = run_pipeline(content, os.path.join(output_dir, '_static', 'laravel'), {})
+        write_if_changed(os.path.join(output_dir, filename), content)
+    else:
+        preprocess_docs.process_file(os.path.dirname(source), output_dir, {}, filename, stream=True)
+    seconds = time.perf_counter() - start
+    print(json.dumps({'seconds': seconds, 'baseline': baseline, 'peak': _max_rss()}))
+
+
+def _digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100, help='文件大小 (MB，預設 100)')
+    parser.add_argument('--modes', default=','.join(MODES), help=f"要量測的方式 (預設 {','.join(MODES)})")
+    parser.add_argument('--child', nargs=3, metavar=('MODE', 'SOURCE', 'OUTPUT_DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_dir = os.path.join(temp_dir, 'source')
+        os.makedirs(source_dir)
+        source = os.path.join(source_dir, 'api-reference.md')
+        size = generate_large_document(source, args.size * 1024 * 1024)
+        print(f"{source}: {size / (1024 * 1024):.1f} MB")
+
+        digests = {}
+        for mode in args.modes.split(','):
+            output_dir = os.path.join(temp_dir, mode)
+            os.makedirs(os.path.join(output_dir, '_static', 'laravel'))
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, source, output_dir],
+                                       check=True, capture_output=True, text=True)
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            peak = result['peak'] - result['baseline']
+            print(f"  {mode:<8}: {result['seconds']:7.2f} s, peak RSS {result['peak'] / (1024 * 1024):8.1f} MB "
+                  f"(+{peak / (1024 * 1024):.1f} MB over the {result['baseline'] / (1024 * 1024):.1f} MB baseline, "
+                  f"{peak / size:.2f}x the file size)")
+            digests[mode] = _digest(os.path.join(output_dir, 'api-reference.md'))
+
+    if len(set(digests.values())) > 1:
+        print(f"FAILED: outputs differ {digests}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
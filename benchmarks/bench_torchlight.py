@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+微效能測試：`TorchlightHtmlFormatter` 的逐行處理
+
+以貼近 Laravel 文件的程式碼區塊 (含 `[tl! ...]` 標籤、空白行、hl_lines、docstring 等)
+預先完成詞法分析，只量測 formatter 的時間。
+
+指定 `--baseline <git-rev>` 時，會從 git 取出該版本的 `sphinx_extensions/torchlight.py`，
+比較兩者的時間，並逐一確認輸出的 HTML 完全相同 (有差異時以非零狀態結束)。
+
+執行方式：
+
+    python3 benchmarks/bench_torchlight.py [--baseline HEAD~1] [--repeat 20]
+"""
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'sphinx_extensions'))
+
+from pygments.lexers import get_lexer_by_name
+from pygments.lexers.templates import HtmlPhpLexer
+from pygments.lexers.configs import IniLexer
+from pygments.lexers.shell import BashLexer
+from pygments.lexers.php import PhpLexer
+
+import torchlight
+
+SAMPLES = {
+    'php': '''<?php
+
+namespace App\\Http\\Controllers;
+
+use App\\Models\\User;
+use Illuminate\\View\\View;
+
+class UserController extends Controller
+{
+    /**
+     * Show the profile for a given user.
+     */
+    public function show(string $id): View
+    {
+        return view('user.profile', [
+            'user' => User::findOrFail($id), // [tl! add]
+        ]);
+    }
+
+    protected function setUp(): void// [tl! add:start]
+    {
+        parent::setUp();
+
+        $this->withoutVite();
+    }// [tl! add:end]
+}
+''',
+    'php-line': '''use Illuminate\\Support\\Facades\\Route;
+
+Route::get('/greeting', function () {
+    return 'Hello World'; // [tl! remove]
+    return view('greeting', ['name' => 'James']); // [tl! add]
+});
+
+Route::middleware(['auth'])->group(function () { // [tl! remove:start]
+    Route::get('/', fn () => 'x');
+}); // [tl! remove:end]
+''',
+    'js': '''import { defineConfig } from 'vite';
+import laravel from 'laravel-vite-plugin';
+
+export default defineConfig({
+    plugins: [
+        laravel([
+            'resources/css/app.css', // [tl! remove]
+            'resources/js/app.js',
+        ]),
+    ],
+});
+''',
+    'json': '''"scripts": {
+     "dev": "vite",
+     "build": "vite build" // [tl! remove]
+     "build": "vite build && vite build --ssr" // [tl! add]
+}
+''',
+    'blade': '''<div>
+    @if ($user->isAdmin())
+        {{ $user->name }}
+    @endif
+
+    <x-alert type="error" :message="$message" />
+</div>
+''',
+    'shell': '''composer require laravel/sail --dev
+
+php artisan sail:install
+./vendor/bin/sail up -d
+''',
+    'env': '''APP_NAME=Laravel
+APP_ENV=local
+
+DB_CONNECTION=mysql
+DB_HOST=127.0.0.1
+''',
+    'python': '''def handler(event):
+    """
+        Indented docstring lines.
+    """
+    return   event  # [tl! add]
+''',
+    'javascript': '''let a = 1; // [tl! add:end]
+let b = 2; // [tl! add] // [tl! add]
+	let tabbed = true;
+// [tl! remove:start]
+let c = 3;
+''',
+    'yaml': '''services:
+    laravel.test:
+        build:
+            context: ./vendor/laravel/sail/runtimes/8.3
+''',
+    'diff': '''- use App\\Http\\Controllers\\PostController;
++ use App\\Http\\Controllers\\ArticleController;
+''',
+}
+
+# Sphinx 自訂的 lexer (與 conf_common.py 相同)
+CUSTOM_LEXERS = {
+    'blade': HtmlPhpLexer(),
+    'env': IniLexer(),
+    'shell': BashLexer(),
+    'php-line': PhpLexer(startinline=True),
+}
+
+# 每個區塊都會以下列 formatter 參數各跑一次 (hl_lines 對應 emphasize-lines)
+FORMATTER_ARGS = ({}, {'hl_lines': [2, 3]})
+
+
+def load_formatter(rev: str | None):
+    """取得目前或指定 git 版本的 TorchlightHtmlFormatter。"""
+    if rev is None:
+        return torchlight.TorchlightHtmlFormatter
+    source = subprocess.run(['git', 'show', f'{rev}:sphinx_extensions/torchlight.py'],
+                            cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    module = types.ModuleType(f'torchlight_{rev}')
+    module.__file__ = torchlight.__file__
+    exec(compile(source, f'{rev}:torchlight.py', 'exec'), module.__dict__)
+    return module.TorchlightHtmlFormatter
+
+
+def build_corpus(scale: int) -> list[tuple[list, dict]]:
+    """預先完成詞法分析，回傳 (token 清單, formatter 參數) 的清單。"""
+    corpus = []
+    for lang, code in SAMPLES.items():
+        lexer = CUSTOM_LEXERS.get(lang) or get_lexer_by_name(lang)
+        for size in range(1, scale + 1):
+            tokens = list(lexer.get_tokens(code * size))
+            for args in FORMATTER_ARGS:
+                corpus.append((tokens, args))
+    return corpus
+
+
+def render_all(formatter_class, corpus) -> tuple[float, list[str]]:
+    outputs = []
+    start = time.perf_counter()
+    for tokens, args in corpus:
+        out = io.StringIO()
+        formatter_class(style='friendly_grayscale', **args).format(iter(tokens), out)
+        outputs.append(out.getvalue())
+    return time.perf_counter() - start, outputs
+
+
+def best_of(formatter_class, corpus, repeat: int) -> tuple[float, list[str]]:
+    best, outputs = render_all(formatter_class, corpus)
+    for _ in range(repeat - 1):
+        best = min(best, render_all(formatter_class, corpus)[0])
+    return best, outputs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', help='要比較的 git 版本 (例如 HEAD~1)')
+    parser.add_argument('--scale', type=int, default=8, help='每個範例重複的最大倍數 (預設 8)')
+    parser.add_argument('--repeat', type=int, default=5, help='重複量測次數，取最佳值 (預設 5)')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.scale)
+    lines = sum(sum(value.count('\n') for _, value in tokens) for tokens, _ in corpus)
+
+    current_time, current_outputs = best_of(load_formatter(None), corpus, args.repeat)
+    print(f"blocks={len(corpus)} lines={lines}")
+    print(f"current : {current_time * 1000:8.2f} ms  ({current_time / lines * 1e6:.2f} us/line)")
+
+    if args.baseline:
+        baseline_time, baseline_outputs = best_of(load_formatter(args.baseline), corpus, args.repeat)
+        print(f"baseline: {baseline_time * 1000:8.2f} ms  ({baseline_time / lines * 1e6:.2f} us/line)")
+        print(f"speedup : {baseline_time / current_time:.2f}x")
+
+        mismatches = sum(1 for a, b in zip(current_outputs, baseline_outputs) if a != b)
+        if mismatches:
+            print(f"FAILED: {mismatches} of {len(corpus)} blocks differ from {args.baseline}")
+            sys.exit(1)
+        print(f"identical: all {len(corpus)} blocks match {args.baseline} byte for byte")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+以固定亂數種子產生仿 Laravel 文件的 Markdown 測試資料
+
+產生的文件包含 Laravel 文件常見的寫法：
+-   `<a name="...">` 錨點與標題、頁首的章節目錄
+-   `/docs/{{version}}/page#anchor` 形式的內部連結 (目標頁面與錨點皆存在)
+-   `<img src="...">` 外部圖片 (未閉合的 `<img>` 標籤)
+-   `shell tab=Linux` 等 tab 程式碼區塊
+-   含 `<!-- [tl! add] -->` 的 `html` 區塊 (會被轉為 diff)
+-   沒有 `<?php` 的 `php` 區塊、含 `// [tl! add]` 標籤的 `php` / `js` 區塊、blade、json、yaml 等
+
+前 95 份文件使用 Laravel 文件的真實檔名 (與 `template/12.x/_source` 的目錄相同)，其餘為 `page-00095` 之類的名稱。
+相同的種子與數量永遠產生位元組完全相同的文件。
+
+執行方式：
+
+    python3 benchmarks/corpus.py <輸出目錄> [--files 100] [--seed 1] [--image-base https://laravel.com]
+"""
+
+import argparse
+import os
+import random
+
+LARAVEL_PAGES = (
+    'artisan authentication authorization blade broadcasting cache cashier-paddle cashier-stripe collections '
+    'concurrency configuration console-tests container context contracts contributions controllers csrf database '
+    'database-testing deployment dusk eloquent eloquent-collections eloquent-factories eloquent-mutators '
+    'eloquent-relationships eloquent-resources eloquent-serialization encryption envoy errors events facades '
+    'filesystem folio fortify frontend hashing helpers homestead horizon http-client http-tests installation '
+    'lifecycle localization logging mail middleware migrations mix mocking mongodb notifications octane packages '
+    'pagination passport passwords pennant pint precognition processes prompts providers pulse queries queues '
+    'rate-limiting redis releases requests responses reverb routing sail sanctum scheduling scout seeding session '
+    'socialite starter-kits strings structure telescope testing upgrade urls valet validation verification views '
+    'vite'
+).split()
+
+WORDS = (
+    'application request response route controller middleware model query queue event listener job cache '
+    'session database migration schema factory seeder test view component directive collection helper '
+    'config environment service provider container facade contract package command schedule mail notification '
+    'the a of to and in is you your will may be can with for this that when using'
+).split()
+
+SECTION_TITLES = (
+    'Introduction', 'Installation', 'Configuration', 'Basic Usage', 'Defining Routes', 'Route Parameters',
+    'Writing Tests', 'Available Methods', 'Customizing the Output', 'Events', 'Queued Jobs', 'Testing',
+    'Creating Components', 'Passing Data', 'Retrieving Results', 'Error Handling', 'Upgrading', 'Deployment',
+)
+
+
+def page_names(count: int) -> list[str]:
+    names = list(LARAVEL_PAGES[:count])
+    names.extend(f"page-{i:05d}" for i in range(len(names), count))
+    return names
+
+
+def slugify(title: str) -> str:
+    return '-'.join(''.join(c if c.isalnum() else ' ' for c in title.lower()).split())
+
+
+def _sentence(rng: random.Random, words: int = 14) -> str:
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def _link(rng: random.Random, pages: list[str], anchors: dict[str, list[str]]) -> str:
+    target = rng.choice(pages)
+    label = rng.choice(WORDS)
+    if rng.random() < 0.5:
+        return f"[{label}](/docs/{{{{version}}}}/{target}#{rng.choice(anchors[target])})"
+    return f"[{label}](/docs/{{{{version}}}}/{target})"
+
+
+def _paragraph(rng: random.Random, pages: list[str], anchors: dict[str, list[str]]) -> str:
+    parts = [_sentence(rng) for _ in range(rng.randint(2, 4))]
+    parts.insert(rng.randint(0, len(parts)), f"See the {_link(rng, pages, anchors)} documentation.")
+    if rng.random() < 0.4:
+        parts.append(f"Call the `{rng.choice(WORDS)}` method.")
+    return ' '.join(parts) + '\n\n'
+
+
+def _fence(rng: random.Random, index: int) -> str:
+    kind = rng.randrange(8)
+    if kind == 0:
+        # tab 語法 (同一組 tab 連續出現)
+        return (
+            "```shell tab=Linux\n./vendor/bin/sail up -d\n```\n\n"
+            "```shell tab=macOS\n./vendor/bin/sail up -d\n```\n\n"
+            "```shell tab=Windows\nvendor\\bin\\sail up -d\n```\n\n"
+        )
+    if kind == 1:
+        # 含 tl 註解標籤的 html 區塊 (轉為 diff)
+        return (
+            "```html\n<head>\n"
+            f"    <link rel=\"stylesheet\" href=\"/css/app-{index}.css\"> <!-- [tl! remove] -->\n"
+            "    @vite(['resources/css/app.css', 'resources/js/app.js']) <!-- [tl! add] -->\n"
+            "</head>\n```\n\n"
+        )
+    if kind == 2:
+        # 沒有 <?php 的 php 區塊 (改為 php-line)
+        return (
+            "```php\n"
+            f"Route::get('/user/{{id}}', function (string $id) {{\n"
+            f"    return 'User '.$id.' #{index}';\n"
+            "});\n```\n\n"
+        )
+    if kind == 3:
+        return (
+            "```php\n<?php\n\nnamespace App\\Http\\Controllers;\n\n"
+            "use Illuminate\\Http\\Request;\n\n"
+            f"class Controller{index} extends Controller\n{{\n"
+            "    public function store(Request $request): void // [tl! add:start]\n    {\n"
+            "        $validated = $request->validate([\n"
+            "            'title' => 'required|unique:posts|max:255',\n"
+            "        ]);\n    } // [tl! add:end]\n}\n```\n\n"
+        )
+    if kind == 4:
+        return (
+            "```js\nimport { defineConfig } from 'vite';\nimport laravel from 'laravel-vite-plugin';\n\n"
+            "export default defineConfig({\n    plugins: [\n        laravel([\n"
+            "            'resources/css/app.css', // [tl! remove]\n"
+            f"            'resources/js/app-{index}.js', // [tl! add]\n"
+            "        ]),\n    ],\n});\n```\n\n"
+        )
+    if kind == 5:
+        return (
+            "```blade\n<div>\n    @foreach ($users as $user)\n"
+            f"        <x-user-card :user=\"$user\" index=\"{index}\" />\n"
+            "    @endforeach\n</div>\n```\n\n"
+        )
+    if kind == 6:
+        return (
+            "```json\n\"scripts\": {\n    \"dev\": \"vite\",\n"
+            f"    \"build\": \"vite build --mode {index}\"\n}}\n```\n\n"
+        )
+    return (
+        "```yaml\nservices:\n    laravel.test:\n        build:\n"
+        f"            context: ./vendor/laravel/sail/runtimes/8.{index % 5}\n```\n\n"
+    )
+
+
+def _titles(name: str) -> list[str]:
+    # 每份文件的章節固定由名稱決定，讓其他文件在產生前就能連到它的錨點
+    rng = random.Random(name)
+    count = rng.randint(4, 10)
+    titles = ['Introduction'] + rng.sample(SECTION_TITLES[1:], count - 1)
+    return titles
+
+
+def generate_document(rng: random.Random, name: str, pages: list[str], anchors: dict[str, list[str]],
+                      image_base: str) -> str:
+    title = name.replace('-', ' ').title()
+    chunks = [f"# {title}\n\n"]
+    chunks.extend(f"- [{section}](#{anchor})\n" for anchor, section in zip(anchors[name], _titles(name)))
+    chunks.append('\n')
+
+    fence_index = 0
+    for anchor, section in zip(anchors[name], _titles(name)):
+        chunks.append(f'<a name="{anchor}"></a>\n## {section}\n\n')
+        for _ in range(rng.randint(1, 3)):
+            chunks.append(_paragraph(rng, pages, anchors))
+            if rng.random() < 0.25:
+                chunks.append(f"> [!NOTE]\n> {_sentence(rng)} {_link(rng, pages, anchors)}\n\n")
+            if rng.random() < 0.15:
+                chunks.append(f'<img src="{image_base}/img/docs/{name}-{fence_index}.png">\n\n')
+            for _ in range(rng.randint(0, 2)):
+                chunks.append(_fence(rng, fence_index))
+                fence_index += 1
+    return ''.join(chunks)
+
+
+def generate_corpus(output_dir: str, files: int, seed: int = 1, image_base: str = 'https://laravel.com') -> list[str]:
+    """產生 files 份文件至 output_dir，回傳檔名清單。"""
+    rng = random.Random(seed)
+    pages = page_names(files)
+    anchors = {name: [slugify(title) for title in _titles(name)] for name in pages}
+
+    os.makedirs(output_dir, exist_ok=True)
+    filenames = []
+    for name in pages:
+        filename = f"{name}.md"
+        with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(generate_document(rng, name, pages, anchors, image_base))
+        filenames.append(filename)
+    return filenames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_dir', help='輸出目錄')
+    parser.add_argument('--files', type=int, default=100, help='文件數量 (預設 100)')
+    parser.add_argument('--seed', type=int, default=1, help='亂數種子 (預設 1)')
+    parser.add_argument('--image-base', default='https://laravel.com', help='圖片 URL 的前綴 (預設 https://laravel.com)')
+    args = parser.parse_args()
+
+    filenames = generate_corpus(args.output_dir, args.files, args.seed, args.image_base)
+    size = sum(os.path.getsize(os.path.join(args.output_dir, filename)) for filename in filenames)
+    print(f"Generated {len(filenames)} files ({size / 1024:.1f} KB) in {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
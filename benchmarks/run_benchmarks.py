@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+效能測試套件：以 `corpus.py` 產生的仿 Laravel 文件量測各處理器、torchlight 與端對端建置的時間
+
+量測項目 (每個規模各一次，取多次量測的最佳值)：
+-   `bin/processors/` 內的每個函式 (scan / render / collect_image_urls / rewrite_images /
+    process_links / build_link_index / convert_diff_fence / convert_php_fence / convert_tab_fence / run_pipeline)
+-   `TorchlightHtmlFormatter` (預先完成詞法分析，只量測 formatter)
+-   `--e2e` 時，以本地 HTTPS 圖片 stub 伺服器建置兩個版本的 EPUB (`bin/build_epub.py`)，
+    分別量測快取全空與快取已建立的時間
+
+結果寫成 JSON (含 git commit、Python / Sphinx / Pygments 版本)，可用 `--compare` 與其他 commit 的結果比較。
+
+執行方式 (於專案根目錄)：
+
+    python3 benchmarks/run_benchmarks.py [--scales 10,100,1000] [--e2e] [--output results.json]
+    python3 benchmarks/run_benchmarks.py --compare benchmarks/results/<舊 commit>.json
+"""
+
+import argparse
+import copy
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'bin'))
+sys.path.insert(0, os.path.join(ROOT, 'sphinx_extensions'))
+
+import pygments
+import sphinx
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+
+from processors import markdown_scanner, image_handler, link_handler, diff_handler, php_tag_handler, tab_handler
+from processors.markdown_scanner import Fence, Prose
+from processors.link_index import build_link_index
+from processors.pipeline import run_pipeline
+
+import torchlight
+from corpus import generate_corpus
+from bench_torchlight import CUSTOM_LEXERS
+from stub_server import stub_server
+
+DEFAULT_SCALES = (10, 100, 1000)
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def _best(function, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _fresh_fences(fences: list[Fence], repeat: int) -> list[list[Fence]]:
+    # 區塊處理器會直接修改 Fence，每次量測都要用新的副本 (複製不計入時間)
+    return [[copy.copy(fence) for fence in fences] for _ in range(repeat)]
+
+
+def bench_processors(documents: list[str], repeat: int) -> dict[str, float]:
+    """量測每個處理器函式處理整個文件集的時間。"""
+    segments = [markdown_scanner.scan(content) for content in documents]
+    prose = [segment.text for doc in segments for segment in doc if isinstance(segment, Prose)]
+    fences = [segment for doc in segments for segment in doc if isinstance(segment, Fence)]
+    replacements = {
+        url: f"_static/laravel/{i:04d}.png"
+        for i, url in enumerate(dict.fromkeys(url for content in documents for url in image_handler.find_image_urls(content)))
+    }
+
+    results = {
+        'markdown_scanner.scan': _best(lambda: [markdown_scanner.scan(content) for content in documents], repeat),
+        'markdown_scanner.render': _best(lambda: [markdown_scanner.render(doc) for doc in segments], repeat),
+        'image_handler.collect_image_urls': _best(
+            lambda: [image_handler.collect_image_urls(content) for content in documents], repeat),
+        'image_handler.rewrite_images': _best(
+            lambda: [image_handler.rewrite_images(text, replacements) for text in prose], repeat),
+        'link_handler.process_links': _best(lambda: [link_handler.process_links(text) for text in prose], repeat),
+        'link_index.build_link_index': _best(
+            lambda: build_link_index({str(i): content for i, content in enumerate(documents)}).dangling(), repeat),
+    }
+
+    for name, handler in (('diff_handler.convert_diff_fence', diff_handler.convert_diff_fence),
+                          ('php_tag_handler.convert_php_fence', php_tag_handler.convert_php_fence),
+                          ('tab_handler.convert_tab_fence', tab_handler.convert_tab_fence)):
+        copies = iter(_fresh_fences(fences, repeat))
+        results[name] = _best(lambda: [handler(fence) for fence in next(copies)], repeat)
+
+    results['pipeline.run_pipeline'] = _best(
+        lambda: [run_pipeline(content, os.devnull, replacements) for content in documents], repeat)
+    return results
+
+
+def _lexer(language: str):
+    if language in CUSTOM_LEXERS:
+        return CUSTOM_LEXERS[language]
+    try:
+        return get_lexer_by_name(language)
+    except ClassNotFound:
+        return get_lexer_by_name('text')
+
+
+def bench_torchlight(documents: list[str], repeat: int) -> tuple[float, int]:
+    """量測 TorchlightHtmlFormatter 格式化所有 (經過預處理的) 程式碼區塊的時間，回傳 (秒, 區塊數)。"""
+    blocks = []
+    for content in documents:
+        for segment in markdown_scanner.scan(run_pipeline(content, os.devnull, {})):
+            if isinstance(segment, Fence):
+                blocks.append(list(_lexer(segment.language or 'text').get_tokens(segment.body)))
+
+    def render():
+        formatter_class = torchlight.TorchlightHtmlFormatter
+        for tokens in blocks:
+            formatter_class(style='friendly_grayscale').format(iter(tokens), io.StringIO())
+
+    return _best(render, repeat), len(blocks)
+
+
+def _make_workspace(workspace: str, corpus_dir: str) -> None:
+    """建立與專案相同結構的暫存工作目錄 (快取也在其中，因此第一次建置一定是冷快取)。"""
+    os.symlink(os.path.join(ROOT, 'sphinx_extensions'), os.path.join(workspace, 'sphinx_extensions'))
+    os.symlink(os.path.join(ROOT, 'bin'), os.path.join(workspace, 'bin'))
+    shutil.copytree(os.path.join(ROOT, 'template', '12.x'), os.path.join(workspace, 'book'))
+    shutil.copytree(corpus_dir, os.path.join(workspace, 'source'))
+
+
+def bench_end_to_end(files: int, seed: int, jobs: str) -> dict:
+    """以 stub 伺服器提供圖片，建置兩個版本的 EPUB 兩次 (冷快取 / 熱快取)。"""
+    with stub_server(tls=True) as server, tempfile.TemporaryDirectory() as workspace:
+        corpus_dir = os.path.join(workspace, 'corpus')
+        generate_corpus(corpus_dir, files, seed, server.base_url)
+        _make_workspace(workspace, corpus_dir)
+
+        env = {**os.environ, 'REQUESTS_CA_BUNDLE': server.ca_bundle}
+        command = [sys.executable, 'bin/build_epub.py', '--book-dir', 'book', '--output-dir', 'build', '-j', jobs]
+        timings = {}
+        for run in ('cold', 'warm'):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=workspace, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings[run] = time.perf_counter() - start
+
+        epubs = [os.path.join(root, name) for root, _dirs, names in os.walk(os.path.join(workspace, 'build'))
+                 for name in names if name.endswith('.epub')]
+        return {
+            'seconds_cold': timings['cold'],
+            'seconds_warm': timings['warm'],
+            'image_requests': server.request_count,
+            'image_transfers': server.transfer_count,
+            'epub_bytes': sum(os.path.getsize(path) for path in epubs),
+        }
+
+
+def _git_commit() -> str | None:
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def run(scales: list[int], seed: int, repeat: int, e2e_files: int | None, jobs: str) -> dict:
+    report = {
+        'commit': _git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'seed': seed,
+        'python': platform.python_version(),
+        'sphinx': sphinx.__version__,
+        'pygments': pygments.__version__,
+        'cpus': os.cpu_count(),
+        'results': [],
+    }
+
+    for files in scales:
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            filenames = generate_corpus(corpus_dir, files, seed)
+            documents = []
+            for filename in filenames:
+                with open(os.path.join(corpus_dir, filename), 'r', encoding='utf-8') as f:
+                    documents.append(f.read())
+        size = sum(len(content.encode('utf-8')) for content in documents)
+        print(f"--- {files} files ({size / 1024:.0f} KB)")
+
+        for name, seconds in bench_processors(documents, repeat).items():
+            report['results'].append({'name': name, 'files': files, 'bytes': size, 'seconds': seconds})
+            print(f"{name:38s} {seconds * 1000:10.2f} ms")
+
+        seconds, blocks = bench_torchlight(documents, repeat)
+        report['results'].append({'name': 'torchlight.TorchlightHtmlFormatter', 'files': files, 'bytes': size,
+                                  'blocks': blocks, 'seconds': seconds})
+        print(f"{'torchlight.TorchlightHtmlFormatter':38s} {seconds * 1000:10.2f} ms  ({blocks} blocks)")
+
+    if e2e_files:
+        print(f"--- end-to-end EPUB build, {e2e_files} files")
+        result = bench_end_to_end(e2e_files, seed, jobs)
+        for run_name in ('cold', 'warm'):
+            report['results'].append({
+                'name': f"build_epub.{run_name}", 'files': e2e_files, 'seconds': result[f'seconds_{run_name}'],
+                **{key: value for key, value in result.items() if not key.startswith('seconds')},
+            })
+            print(f"{'build_epub.' + run_name:38s} {result[f'seconds_{run_name}'] * 1000:10.2f} ms")
+        print(f"image requests={result['image_requests']} transfers={result['image_transfers']} "
+              f"epub={result['epub_bytes'] / 1024:.0f} KB")
+    return report
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """列出兩份結果中相同項目的時間比 (大於 1 代表變慢)。"""
+    previous = {(entry['name'], entry['files']): entry['seconds'] for entry in baseline['results']}
+    print(f"--- compared with {baseline.get('commit')} (ratio > 1.00 is slower)")
+    for entry in current['results']:
+        key = (entry['name'], entry['files'])
+        if key in previous and previous[key] > 0:
+            print(f"{entry['name']:38s} {entry['files']:>6d} files  {entry['seconds'] / previous[key]:6.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                        help='以逗號分隔的文件數量 (10 ~ 10000，預設 10,100,1000)')
+    parser.add_argument('--seed', type=int, default=1, help='測試資料的亂數種子 (預設 1)')
+    parser.add_argument('--repeat', type=int, default=3, help='重複量測次數，取最佳值 (預設 3)')
+    parser.add_argument('--e2e', action='store_true', help='同時量測端對端的 EPUB 建置')
+    parser.add_argument('--e2e-files', type=int, default=100, help='端對端建置的文件數量 (預設 100)')
+    parser.add_argument('-j', '--jobs', default='1', help='端對端建置的 Sphinx 行程數 (預設 1)')
+    parser.add_argument('--output', help='結果 JSON 的路徑 (預設 benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='與另一份結果 JSON 比較')
+    args = parser.parse_args()
+
+    scales = [int(value) for value in args.scales.split(',') if value]
+    report = run(scales, args.seed, args.repeat, args.e2e_files if args.e2e else None, args.jobs)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
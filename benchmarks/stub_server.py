@@ -0,0 +1,120 @@
+"""
+本地端的圖片 stub 伺服器，供效能測試使用
+
+每個請求會依路徑中的 `latency=` 參數 (秒) 延遲回應，回傳內容由路徑決定，
+同一路徑永遠回傳相同的位元組 (有效的 PNG 圖片)。回應帶有 ETag，`If-None-Match` 相符時回傳 304。
+
+`tls=True` 時以臨時產生的自簽憑證提供 HTTPS (需要 `openssl` 指令)，
+預處理只會下載 https 的圖片，端對端測試需使用此模式，並以 `REQUESTS_CA_BUNDLE` 指向 `server.ca_bundle`。
+"""
+
+import hashlib
+import os
+import ssl
+import struct
+import subprocess
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import time
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def image_bytes(path: str, size: int = 4096) -> bytes:
+    """依路徑產生固定內容的 PNG 圖片，未壓縮的像素資料約為 size 位元組。"""
+    seed = hashlib.sha256(path.encode('utf-8')).digest()
+    width = 32
+    height = max(1, size // (width * 3 + 1))
+    rows = b''.join(
+        b'\x00' + bytes(seed[(x + y) % len(seed)] for x in range(width * 3))
+        for y in range(height)
+    )
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(rows, 0)) + _png_chunk(b'IEND', b''))
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    default_latency = 0.0
+
+    def do_GET(self) -> None:
+        query = parse_qs(urlparse(self.path).query)
+        latency = float(query.get('latency', [self.default_latency])[0])
+        time.sleep(latency)
+
+        body = image_bytes(urlparse(self.path).path)
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        self.server.request_count += 1
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.server.transfer_count += 1
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    # 預設的 backlog (5) 在大量同時連線時會丟棄 SYN，造成約 1 秒的重送延遲
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def _self_signed_certificate(directory: str) -> tuple[str, str]:
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+        '-keyout', key_path, '-out', cert_path,
+    ], check=True, capture_output=True)
+    return cert_path, key_path
+
+
+@contextmanager
+def stub_server(latency: float = 0.0, tls: bool = False):
+    """
+    啟動 stub 伺服器並回傳伺服器物件。
+
+    `base_url` 為伺服器位址 (例如 `http://127.0.0.1:12345`)，
+    `request_count` / `transfer_count` 為收到的請求與實際傳輸內容的次數，
+    `ca_bundle` 為 TLS 模式下的憑證路徑 (否則為 None)。
+    """
+    handler = type('ImageHandler', (_ImageHandler,), {'default_latency': latency})
+    server = _StubServer(('127.0.0.1', 0), handler)
+    server.request_count = 0
+    server.transfer_count = 0
+    server.ca_bundle = None
+    with tempfile.TemporaryDirectory() as cert_dir:
+        scheme = 'http'
+        if tls:
+            cert_path, key_path = _self_signed_certificate(cert_dir)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(cert_path, key_path)
+            server.socket = context.wrap_socket(server.socket, server_side=True)
+            server.ca_bundle = cert_path
+            scheme = 'https'
+        server.base_url = f"{scheme}://127.0.0.1:{server.server_address[1]}"
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server
+        finally:
+            server.shutdown()
+            server.server_close()
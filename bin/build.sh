@@ -2,23 +2,12 @@
 # Exit immediately if a command exits with a non-zero status.
 set -e
 
-echo ">>> Cleaning previous builds..."
-rm -Rf build/color/*
-rm -Rf build/color/.buildinfo*
-rm -Rf build/color/.doctrees
-rm -Rf build/grayscale/*
-rm -Rf build/grayscale/.buildinfo*
-rm -Rf build/grayscale/.doctrees
-
-echo ">>> Pre processing source files..."
-python3 bin/preprocess_docs.py source book/_source
-
-cd book
-
-echo ">>> Building EPUB (color version) with Sphinx..."
-SPHINX_CUSTOM_CONFIG="color" sphinx-build -E -a -b epub  --conf-dir . _source ../build/color
-
-echo ">>> Building EPUB (grayscalebw version) with Sphinx..."
-SPHINX_CUSTOM_CONFIG="grayscale" sphinx-build -E -a -b epub --conf-dir .  _source ../build/grayscale
+# source 下的 Markdown 由 Sphinx 擴充套件 preprocess 在讀取時直接於記憶體中修正 (見 conf_common.py)，
+# 不需先執行 bin/preprocess_docs.py 產生 book/_source 的副本
+# 兩個版本共用同一次讀取階段，只有寫出 EPUB 時分開
+# 可重現建置：輸入 (source、book、處理器、擴充套件與工具版本) 與上次建置相同時直接略過；
+# 需要建置時會先清除舊的輸出。設定 SOURCE_DATE_EPOCH 可讓不同機器產生位元組完全相同的 EPUB
+# 建置後檢查 EPUB 的結構 (XHTML 格式、id、內部連結、manifest)，有問題時中止
+python3 bin/build_epub.py --book-dir book --output-dir build -j auto --reproducible --validate color grayscale
 
 echo ">>> Build complete! Check the 'output' directory."
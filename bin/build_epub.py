@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+以同一次讀取階段建置所有 EPUB 版本
+
+`sphinx-build` 每次只能建置一個版本，因此彩色與灰階版本各自要以 myst_parser 解析一次所有文件、
+解析一次所有參照，但兩者的 doctree 完全相同，差異只在樣式、CSS、封面與書名。
+
+本程式直接使用 Sphinx 的應用程式 API：
+1. 第一個版本以全新的環境 (等同 `-E -a`) 讀取並寫出，doctree 與環境存放於共用的 doctree 目錄。
+2. 其餘版本載入同一份環境，只寫出 EPUB。兩個版本之間只有 `VARIANT_CONFIG_KEYS` 列出的設定不同，
+   這些設定不影響 doctree，因此不會觸發重新讀取；若還有其他影響環境的設定不同，則照常重新讀取。
+
+`--reproducible` 為可重現建置：以所有輸入 (source、book 內的設定檔、樣板與檔案、設定檔引用的字型等 book 以外的檔案、
+處理器與擴充套件的程式碼、工具版本) 的雜湊作為版本識別 (release)，並與輸出目錄中上次建置的戳記比對，完全相同時略過整個 Sphinx 建置。
+需要建置時會先清除舊的輸出，建置時間取自 `SOURCE_DATE_EPOCH` (未設定時為目前時間)，EPUB 內的檔案
+也以固定的時間與權限重新封裝，相同的輸入與 `SOURCE_DATE_EPOCH` 會產生位元組完全相同的 EPUB。
+
+`--validate` 於建置完成後以 `validate_epub.py` 的結構檢查驗證每個 EPUB，有問題時以非零狀態結束。
+
+執行方式 (於專案根目錄)：
+
+    python3 bin/build_epub.py [--book-dir book] [--output-dir build] [-j auto] [--report build-report.json]
+                              [--reproducible] [--validate] [--source-dir source] [color grayscale]
+
+本程式授權採用 MIT License
+Copyright (c) 2025 Pigo Chu
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import time
+
+from sphinx.application import Sphinx
+from sphinx.config import eval_config_file
+from sphinx.environment import CONFIG_OK
+from sphinx.util.tags import Tags
+from sphinx.util.docutils import docutils_namespace, patch_docutils
+
+from processors.build_stamp import input_digest, is_up_to_date, load_stamp, normalize_zip, save_stamp, tool_versions
+from processors.manifest import load_staged
+from validate_epub import validate_epubs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VARIANTS = ('color', 'grayscale')
+
+# 各版本設定檔中會不同、且 Sphinx 標記為影響環境 (rebuild='env') 的設定。
+# 它們只決定封面、書名與打包時排除的封面圖檔，不會改變任何 doctree。
+VARIANT_CONFIG_KEYS = {
+    'project',
+    'exclude_patterns',
+    'epub_cover',
+    'epub_exclude_files',
+}
+
+
+def _env_config_changes(previous, current) -> set[str]:
+    """回傳兩份設定中，會影響環境且值不同的設定名稱。"""
+    changed = set()
+    for name, option in current._options.items():
+        if option.rebuild != 'env':
+            continue
+        if previous[name] != current[name]:
+            changed.add(name)
+    return changed
+
+
+def read_config(confdir: str, variant: str) -> dict:
+    """
+    與建置時相同，以 SPHINX_CUSTOM_CONFIG 執行 conf.py 並回傳其中的設定。
+
+    執行時匯入的設定檔模組 (conf_common 等) 不會保留，建置時才會以當時的環境變數
+    (例如 EPUB_BUILD_ID) 重新產生 release 等設定。
+    """
+    modules, path = set(sys.modules), list(sys.path)
+    previous = os.environ.get('SPHINX_CUSTOM_CONFIG')
+    os.environ['SPHINX_CUSTOM_CONFIG'] = variant
+    try:
+        # conf.py 會印出載入的版本
+        with contextlib.redirect_stdout(io.StringIO()):
+            return eval_config_file(os.path.join(confdir, 'conf.py'), Tags())
+    finally:
+        for name in set(sys.modules) - modules:
+            filename = getattr(sys.modules[name], '__file__', None) or ''
+            if os.path.abspath(filename).startswith(os.path.join(confdir, '')):
+                del sys.modules[name]
+        sys.path[:] = path
+        if previous is None:
+            os.environ.pop('SPHINX_CUSTOM_CONFIG', None)
+        else:
+            os.environ['SPHINX_CUSTOM_CONFIG'] = previous
+
+
+def config_input_paths(config: dict) -> list[str]:
+    """設定中引用的輸入檔案與目錄 (相對於 book)：嵌入的字型、樣板、靜態檔案與原始 Markdown 目錄。"""
+    paths = [font['path'] for font in config.get('font_subsetter_fonts') or []]
+    paths.extend(config.get('templates_path') or [])
+    paths.extend(config.get('html_static_path') or [])
+    if config.get('preprocess_source_dir'):
+        paths.append(config['preprocess_source_dir'])
+    return paths
+
+
+def reproducible_inputs(source_dir: str, confdir: str, variants: list[str]) -> str:
+    """
+    可重現建置的輸入雜湊 (建置時下載的圖片不計入，圖片由 Markdown 中的網址決定)。
+
+    各版本設定檔引用、位於 book 以外的檔案 (例如 `../fonts` 中的字型) 也一併計入。
+    """
+    roots = {
+        'source': source_dir,
+        'book': confdir,
+        'processors': os.path.join(ROOT, 'bin', 'processors'),
+        'sphinx_extensions': os.path.join(ROOT, 'sphinx_extensions'),
+        'build_epub': os.path.abspath(__file__),
+    }
+    hashed = [source_dir, confdir]
+    for variant in variants:
+        for path in config_input_paths(read_config(confdir, variant)):
+            path = os.path.abspath(os.path.join(confdir, path))
+            if not any(os.path.commonpath([path, root]) == root for root in hashed):
+                # 以相對於 book 的路徑區分，不存在的檔案不計入內容，之後加入時雜湊即會改變
+                roots[f"config:{os.path.relpath(path, confdir)}"] = path
+                hashed.append(path)
+    srcdir = os.path.join(confdir, '_source')
+    excluded = {os.path.join(srcdir, '_static', 'laravel')}
+    # Sphinx 擴充套件 preprocess 複製進文件目錄的原始 Markdown 已計入 source
+    excluded.update(os.path.join(srcdir, filename) for filename in load_staged(srcdir))
+    # 明確指定的 SOURCE_DATE_EPOCH 會寫入 EPUB 的日期，也視為輸入
+    extra = {'tools': tool_versions(), 'source_date_epoch': os.environ.get('SOURCE_DATE_EPOCH')}
+    return input_digest(roots, excluded, extra)
+
+
+def clean_outputs(output_dir: str, variants: list[str]) -> None:
+    """移除上次建置的輸出與環境，避免已刪除的頁面殘留在輸出目錄而被打包進 EPUB。"""
+    for name in (*variants, '.doctrees'):
+        shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+
+
+def build_variant(variant: str, srcdir: str, confdir: str, outdir: str, doctreedir: str,
+                  parallel: int, previous_config, report: str | None = None,
+                  incremental: bool = False, overrides: dict | None = None) -> Sphinx:
+    """
+    建置單一版本並回傳 Sphinx 應用程式，其設定 (app.config) 供下一個版本比對。
+
+    incremental 為 True 時沿用 doctree 目錄中既有的環境，只重新讀取與寫出有變動的文件
+    (監看模式使用)；否則第一個版本 (previous_config 為 None) 以全新的環境讀取並寫出所有文件。
+    overrides 為覆寫設定檔的設定 (build_matrix.py 使用)。
+    """
+    os.environ['SPHINX_CUSTOM_CONFIG'] = variant
+    fresh = previous_config is None and not incremental
+    confoverrides = dict(overrides or {})
+    # 計時報告寫在各版本的輸出目錄中 (sphinx_extensions/build_report.py)
+    if report:
+        confoverrides['build_report_path'] = report
+
+    with patch_docutils(confdir), docutils_namespace():
+        app = Sphinx(srcdir, confdir, outdir, doctreedir, 'epub',
+                     confoverrides=confoverrides, freshenv=fresh, parallel=parallel)
+
+        if previous_config is not None:
+            changed = _env_config_changes(previous_config, app.config)
+            if changed <= VARIANT_CONFIG_KEYS:
+                # 只有版本專屬的設定不同，沿用已讀取的 doctree
+                app.env.config_status = CONFIG_OK
+            else:
+                print(f"  - Settings {sorted(changed - VARIANT_CONFIG_KEYS)} differ, re-reading sources")
+
+        app.build(force_all=not incremental)
+
+    return app
+
+
+def main() -> None:
+    """主函式：解析命令列參數並依序建置各個版本"""
+    parser = argparse.ArgumentParser(description="Build every EPUB variant from a single Sphinx read phase")
+    parser.add_argument('variants', nargs='*', default=list(VARIANTS),
+                        help="Variants to build, the first one reads the sources (default: color grayscale)")
+    parser.add_argument('--book-dir', default='book',
+                        help="Directory containing conf.py and the preprocessed _source (default: book)")
+    parser.add_argument('--output-dir', default='build',
+                        help="Each variant is written to <output-dir>/<variant> (default: build)")
+    parser.add_argument('-j', '--jobs', default='1',
+                        help="Number of Sphinx processes, or 'auto' for the number of CPUs (default: 1)")
+    parser.add_argument('--report', metavar='NAME',
+                        help="Write a JSON timing report with this name into each variant's output directory")
+    parser.add_argument('--reproducible', action='store_true',
+                        help="Derive the release from a hash of all inputs, skip the build when the previous "
+                             "build stamp matches, and write byte-identical EPUBs for identical inputs")
+    parser.add_argument('--validate', action='store_true',
+                        help="Check the structure of every built EPUB and fail when an issue is found")
+    parser.add_argument('--source-dir', default='source',
+                        help="Raw Markdown directory included in the input hash of --reproducible and used by "
+                             "--validate to map issues back to their source (default: source)")
+    args = parser.parse_args()
+
+    for variant in args.variants:
+        if variant not in VARIANTS:
+            parser.error(f"unknown variant '{variant}' (choose from {', '.join(VARIANTS)})")
+
+    jobs = (os.cpu_count() or 1) if args.jobs == 'auto' else int(args.jobs)
+    confdir = os.path.abspath(args.book_dir)
+    srcdir = os.path.join(confdir, '_source')
+    output_dir = os.path.abspath(args.output_dir)
+    doctreedir = os.path.join(output_dir, '.doctrees')
+
+    if not os.path.isdir(srcdir):
+        print(f"Error: Source directory '{srcdir}' does not exist")
+        sys.exit(1)
+
+    variants = list(dict.fromkeys(args.variants))
+    if args.reproducible:
+        inputs = reproducible_inputs(os.path.abspath(args.source_dir), confdir, variants)
+        if is_up_to_date(load_stamp(output_dir), output_dir, inputs, variants):
+            print(f">>> Inputs unchanged ({inputs[:12]}), EPUBs are up to date, skipping the build")
+            return
+        # conf_common.py 以此作為 release，並以 SOURCE_DATE_EPOCH 作為建置日期 (Sphinx 的 EPUB 日期亦同)
+        os.environ['EPUB_BUILD_ID'] = inputs[:12]
+        os.environ.setdefault('SOURCE_DATE_EPOCH', str(int(time.time())))
+        clean_outputs(output_dir, variants)
+
+    config = None
+    epubs = {}
+    for variant in variants:
+        print(f">>> Building EPUB ({variant} version) with Sphinx...")
+        start = time.perf_counter()
+        outdir = os.path.join(output_dir, variant)
+        app = build_variant(variant, srcdir, confdir, outdir, doctreedir, jobs, config, args.report)
+        if app.statuscode:
+            print(f"Error: Building the {variant} version failed")
+            sys.exit(app.statuscode)
+        config = app.config
+        epubs[variant] = os.path.join(variant, f"{app.config.epub_basename}.epub")
+        print(f"  - {variant} version built in {time.perf_counter() - start:.1f}s")
+
+    if args.reproducible:
+        for path in epubs.values():
+            normalize_zip(os.path.join(output_dir, path), int(os.environ['SOURCE_DATE_EPOCH']))
+        save_stamp(output_dir, inputs, epubs)
+        print(f">>> Build stamp {inputs[:12]} written to {output_dir}")
+
+    if args.validate:
+        paths = [os.path.join(output_dir, path) for path in epubs.values()]
+        if validate_epubs(paths, os.path.abspath(args.source_dir), jobs):
+            print("Error: EPUB validation failed")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
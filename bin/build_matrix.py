@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+以相依圖同時建置多個 Laravel 版本、多種語系的所有 EPUB
+
+`bin/build.sh` 只能以一份 `source` 與 `book` 建置一本書的兩個版本。本程式讀取建置矩陣 (預設為 `matrix.json`)，
+每本書由「樣板 (template/<版本>)、原始 Markdown 目錄 (語系)、要建置的版本 (color、grayscale)」組成：
+
+    {
+      "books": [
+        {"name": "12.x-zh_TW", "template": "template/12.x", "source": "source", "variants": ["color", "grayscale"]},
+        {"name": "12.x-en", "template": "template/12.x", "source": "source-en", "variants": ["color"],
+         "overrides": {"language": "en", "epub_language": "en"}}
+      ]
+    }
+
+路徑相對於矩陣檔所在目錄，overrides 為覆寫該書設定檔的設定。矩陣展開為以下工作的相依圖：
+
+1. `preprocess:<source>`：每份原始 Markdown 目錄只預處理一次 (同 `preprocess_docs.py`，含圖片下載與連結檢查)，
+   結果存放於 `<output-dir>/.matrix/sources`，依清單增量處理，使用同一份的書共用。
+2. `sphinx:<book>:<variant>`：第一個版本讀取並寫出，其餘版本複製它的 doctree 後只寫出 EPUB (同 `build_epub.py`)，
+   因此同一本書的其餘版本可以同時建置。樣板直接作為設定檔目錄使用，文件目錄由樣板的 `_source` 與預處理結果組成。
+3. `validate:<book>:<variant>` (`--validate`)：以 `validate_epub.py` 檢查 EPUB 的結構。
+
+前置工作都完成的工作會立即在新的 process 中執行，最多同時執行 `-j` 個 (預設為 CPU 數)，並優先執行位於關鍵路徑上的工作
+(以上次的耗時估計)。所有工作共用專案根目錄 `.cache` 下的圖片、程式碼高亮與圖片最佳化快取。
+每個工作的輸出寫入 `<output-dir>/.matrix/logs`，結束時印出各工作的耗時與關鍵路徑。
+
+EPUB 輸出於 `<output-dir>/<book>/<variant>`。
+
+執行方式 (於專案根目錄)：
+
+    python3 bin/build_matrix.py [matrix.json] [--output-dir build] [-j auto] [--only 12.x-zh_TW] [--offline] [--validate]
+
+本程式授權採用 MIT License
+Copyright (c) 2025 Pigo Chu
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+from build_epub import VARIANTS, build_variant
+from preprocess_docs import convert_content
+from processors.image_cache import ImageCache
+from processors.job_graph import Job, load_timings, run_jobs, save_timings
+from processors.epub_validator import validate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(ROOT, '.cache')
+
+# 沒有上次耗時紀錄時，各種工作的估計耗時 (相對大小)
+ESTIMATED_COSTS = {'preprocess': 1.0, 'read': 4.0, 'write': 2.0, 'validate': 0.2}
+# 工作失敗時印出的記錄檔行數
+LOG_TAIL_LINES = 20
+
+
+def load_matrix(path: str) -> list[dict]:
+    """讀取建置矩陣，將路徑轉為絕對路徑並檢查每本書的設定。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        matrix = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    books = []
+    for entry in matrix.get('books', []):
+        template = os.path.join(base_dir, entry['template'])
+        book = {
+            'name': entry.get('name') or f"{os.path.basename(template)}-{os.path.basename(entry['source'])}",
+            'template': template,
+            'source': os.path.join(base_dir, entry['source']),
+            'variants': list(dict.fromkeys(entry.get('variants', VARIANTS))),
+            'overrides': entry.get('overrides', {}),
+        }
+        for variant in book['variants']:
+            if variant not in VARIANTS:
+                raise ValueError(f"{book['name']}: unknown variant '{variant}' (choose from {', '.join(VARIANTS)})")
+        for directory in (book['template'], book['source']):
+            if not os.path.isdir(directory):
+                raise ValueError(f"{book['name']}: directory '{directory}' does not exist")
+        books.append(book)
+    names = [book['name'] for book in books]
+    if len(set(names)) != len(names):
+        raise ValueError("book names must be unique")
+    return books
+
+
+def source_key(source_dir: str) -> str:
+    """預處理結果的目錄名稱：目錄名稱加上完整路徑的雜湊，不同位置的同名目錄不會相衝。"""
+    digest = hashlib.sha256(os.path.abspath(source_dir).encode('utf-8')).hexdigest()[:8]
+    return f"{os.path.basename(os.path.normpath(source_dir))}-{digest}"
+
+
+def preprocess_job(source_dir: str, output_dir: str, offline: bool) -> int:
+    """預處理一份原始 Markdown 目錄 (依清單只處理有變動的檔案)，回傳 Markdown 檔數。"""
+    convert_content(source_dir, output_dir, image_cache=ImageCache(os.path.join(CACHE_DIR, 'images'), offline=offline))
+    return sum(1 for filename in os.listdir(output_dir) if filename.endswith('.md'))
+
+
+def _link(target: str, path: str) -> None:
+    """
+    目錄以符號連結放入文件目錄；檔案則使用硬連結 (不同檔案系統時改為複製)，
+    因為 myst 以檔案的實際路徑解析 `page.md` 連結，符號連結的文件會找不到彼此。
+    """
+    if os.path.isdir(target):
+        os.symlink(target, path, target_is_directory=True)
+        return
+    try:
+        os.link(target, path)
+    except OSError:
+        shutil.copy2(target, path)
+
+
+def stage_sources(template_dir: str, preprocessed_dir: str, srcdir: str) -> None:
+    """
+    以連結組成 Sphinx 的文件目錄：樣板 `_source` 中的目錄頁與 `_static`，加上預處理後的 Markdown 與圖片。
+    每次都重新建立，已刪除的頁面不會殘留。
+    """
+    shutil.rmtree(srcdir, ignore_errors=True)
+    os.makedirs(os.path.join(srcdir, '_static'))
+    template_source = os.path.join(template_dir, '_source')
+    for name in sorted(os.listdir(template_source)):
+        if name != '_static':
+            _link(os.path.join(template_source, name), os.path.join(srcdir, name))
+    template_static = os.path.join(template_source, '_static')
+    if os.path.isdir(template_static):
+        for name in sorted(os.listdir(template_static)):
+            _link(os.path.join(template_static, name), os.path.join(srcdir, '_static', name))
+    images = os.path.join(preprocessed_dir, '_static', 'laravel')
+    if os.path.isdir(images) and not os.path.lexists(os.path.join(srcdir, '_static', 'laravel')):
+        _link(images, os.path.join(srcdir, '_static', 'laravel'))
+    for name in sorted(os.listdir(preprocessed_dir)):
+        if name.endswith('.md') and not os.path.lexists(os.path.join(srcdir, name)):
+            _link(os.path.join(preprocessed_dir, name), os.path.join(srcdir, name))
+
+
+def sphinx_job(variant: str, confdir: str, srcdir: str, outdir: str, doctreedir: str, overrides: dict,
+               preprocessed_dir: str | None = None, previous: tuple | None = None) -> tuple:
+    """
+    建置一本書的一個版本，回傳 (設定, EPUB 路徑, doctree 目錄) 供同一本書的其他版本使用。
+
+    第一個版本 (提供 preprocessed_dir) 先組成文件目錄再以全新的環境讀取；
+    其餘版本 (提供 previous) 複製第一個版本的 doctree，只寫出 EPUB。
+    """
+    # 樣板的 conf_common.py 以自己的位置尋找擴充套件，樣板直接作為設定檔目錄時需另外加入
+    sys.path.insert(0, os.path.join(ROOT, 'sphinx_extensions'))
+    previous_config = None
+    if previous is not None:
+        previous_config, _, shared_doctreedir = previous
+        shutil.rmtree(doctreedir, ignore_errors=True)
+        shutil.copytree(shared_doctreedir, doctreedir)
+    else:
+        stage_sources(confdir, preprocessed_dir, srcdir)
+    shutil.rmtree(outdir, ignore_errors=True)
+
+    app = build_variant(variant, srcdir, confdir, outdir, doctreedir, 1, previous_config, overrides=overrides)
+    if app.statuscode:
+        raise RuntimeError(f"Sphinx exited with status {app.statuscode}")
+    return app.config, os.path.join(outdir, f"{app.config.epub_basename}.epub"), doctreedir
+
+
+def validate_job(source_dir: str, previous: tuple) -> int:
+    """檢查 EPUB 的結構，有問題時失敗 (問題列於記錄檔)。"""
+    report = validate(previous[1], source_dir)
+    for issue in report.issues:
+        print(f"  - {issue}")
+    if report.issues:
+        raise RuntimeError(f"{len(report.issues)} validation issues")
+    return report.pages
+
+
+def plan_jobs(books: list[dict], output_dir: str, offline: bool, validate_epubs: bool) -> list[Job]:
+    """將建置矩陣展開為工作的相依圖。"""
+    work_dir = os.path.join(output_dir, '.matrix')
+    jobs = []
+    preprocessed = {}
+    for book in books:
+        key = source_key(book['source'])
+        preprocessed_dir = os.path.join(work_dir, 'sources', key)
+        if key not in preprocessed:
+            preprocessed[key] = f"preprocess:{key}"
+            jobs.append(Job(preprocessed[key], preprocess_job, (book['source'], preprocessed_dir, offline),
+                            cost=ESTIMATED_COSTS['preprocess']))
+
+        srcdir = os.path.join(work_dir, 'books', book['name'], '_source')
+        overrides = {
+            # 已預處理，直接讀取文件目錄中的 Markdown
+            'preprocess_source_dir': None,
+            'html_static_path': [os.path.join(srcdir, '_static')],
+            'torchlight_cache_dir': os.path.join(CACHE_DIR, 'highlight'),
+            'image_optimizer_cache_dir': os.path.join(CACHE_DIR, 'image_optimizer'),
+            **book['overrides'],
+        }
+        first = None
+        for variant in book['variants']:
+            name = f"sphinx:{book['name']}:{variant}"
+            outdir = os.path.join(output_dir, book['name'], variant)
+            doctreedir = os.path.join(work_dir, 'doctrees', book['name'], variant)
+            if first is None:
+                first = name
+                jobs.append(Job(name, sphinx_job,
+                                (variant, book['template'], srcdir, outdir, doctreedir, overrides, preprocessed_dir),
+                                deps=(preprocessed[key],), cost=ESTIMATED_COSTS['read']))
+            else:
+                jobs.append(Job(name, sphinx_job,
+                                (variant, book['template'], srcdir, outdir, doctreedir, overrides, None),
+                                inputs=(first,), cost=ESTIMATED_COSTS['write']))
+            if validate_epubs:
+                jobs.append(Job(f"validate:{book['name']}:{variant}", validate_job, (book['source'],),
+                                inputs=(name,), cost=ESTIMATED_COSTS['validate']))
+    return jobs
+
+
+def print_result(result) -> None:
+    if result.status == 'ok':
+        print(f"  - [ok] {result.name} ({result.seconds:.1f}s)")
+        return
+    print(f"  - [{result.status}] {result.name}: {result.error}")
+    if result.log and os.path.isfile(result.log):
+        with open(result.log, 'r', encoding='utf-8', errors='replace') as f:
+            tail = f.readlines()[-LOG_TAIL_LINES:]
+        print(f"    (last {len(tail)} lines of {result.log})")
+        for line in tail:
+            print(f"    | {line.rstrip()}")
+
+
+def main() -> None:
+    """主函式：解析命令列參數、展開建置矩陣並執行所有工作"""
+    parser = argparse.ArgumentParser(description="Build every book of a version/locale/variant matrix concurrently")
+    parser.add_argument('matrix', nargs='?', default='matrix.json', help="Build matrix (default: matrix.json)")
+    parser.add_argument('--output-dir', default='build',
+                        help="Each book is written to <output-dir>/<book>/<variant> (default: build)")
+    parser.add_argument('-j', '--jobs', default='auto',
+                        help="Number of jobs run at the same time, or 'auto' for the number of CPUs (default: auto)")
+    parser.add_argument('--only', action='append', metavar='BOOK',
+                        help="Build only the named book (can be repeated)")
+    parser.add_argument('--offline', action='store_true',
+                        help="Do not access the network, build images entirely from the cache")
+    parser.add_argument('--validate', action='store_true',
+                        help="Check the structure of every built EPUB and fail when an issue is found")
+    args = parser.parse_args()
+
+    try:
+        books = load_matrix(args.matrix)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: Invalid build matrix '{args.matrix}': {e}")
+        sys.exit(1)
+    if args.only:
+        unknown = set(args.only) - {book['name'] for book in books}
+        if unknown:
+            parser.error(f"unknown book {', '.join(sorted(unknown))}")
+        books = [book for book in books if book['name'] in args.only]
+
+    workers = (os.cpu_count() or 1) if args.jobs == 'auto' else int(args.jobs)
+    output_dir = os.path.abspath(args.output_dir)
+    work_dir = os.path.join(output_dir, '.matrix')
+    os.makedirs(work_dir, exist_ok=True)
+    # 各工作在不同時間啟動，以同一個建置時間產生 release 與日期，同一本書的各版本才能共用 doctree
+    os.environ.setdefault('SOURCE_DATE_EPOCH', str(int(time.time())))
+
+    jobs = plan_jobs(books, output_dir, args.offline, args.validate)
+    print(f">>> Building {len(books)} books ({len(jobs)} jobs) with {workers} workers")
+    report = run_jobs(jobs, workers, os.path.join(work_dir, 'logs'), load_timings(work_dir), print_result)
+    save_timings(work_dir, report.results)
+
+    busy = sum(result.seconds for result in report.results.values())
+    print(f">>> Finished in {report.seconds:.1f}s (job time {busy:.1f}s, {busy / report.seconds:.1f}x parallelism)")
+    if report.critical_path:
+        steps = [report.results[name] for name in report.critical_path]
+        chain = ' -> '.join(f"{step.name} ({step.seconds:.1f}s)" for step in steps)
+        print(f">>> Critical path ({sum(step.seconds for step in steps):.1f}s): {chain}")
+    for book in books:
+        for variant in book['variants']:
+            result = report.results.get(f"sphinx:{book['name']}:{variant}")
+            if result is not None and result.status == 'ok':
+                print(f"  - {book['name']} {variant}: {os.path.relpath(result.value[1])}")
+
+    if report.failed:
+        print(f"Error: {len(report.failed)} jobs did not succeed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
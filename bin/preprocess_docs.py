@@ -2,7 +2,8 @@
 """
 主程式：協調文件預處理流程
 
-本程式會依序執行以下處理器，轉換 Markdown 文件：
+本程式會先將每份 Markdown 文件切成一般文字與程式碼區塊片段 (只掃描一次)，
+再依序執行以下處理器，每個處理器只會收到它關心的片段：
 1. 圖片處理 (下載與路徑替換)
 2. 內部連結轉換
 3. Laravel Doc 特有的 diff 語法轉換
@@ -10,7 +11,7 @@
 5. PHP 程式碼區塊標籤修正
 6. 程式碼區塊 tab 語法處理
 
-處理邏輯皆已模組化於 `processors` 目錄下。
+處理邏輯皆已模組化於 `processors` 目錄下，處理順序定義於 `processors/pipeline.py`。
 
 本程式授權採用 MIT License
 Copyright (c) 2025 Pigo Chu
@@ -18,18 +19,197 @@ Copyright (c) 2025 Pigo Chu
 
 import sys
 import os
+import io
+import hashlib
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from contextlib import redirect_stdout
 
-# 從 processors 模組匯入所有處理函式
-from processors.image_handler import process_images
-from processors.link_handler import process_links
-from processors.diff_handler import process_diff_blocks
-from processors.php_tag_handler import process_php_tags
-from processors.tab_handler import process_tabs
+# 從 processors 模組匯入處理管道
+from processors.pipeline import run_pipeline, stream_pipeline, pipeline_version
+from processors.image_handler import find_image_urls, collect_image_urls, fetch_images, DEFAULT_FETCH_WORKERS
+from processors.image_cache import ImageCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES
+from processors.manifest import (
+    build_fingerprint, file_digest, text_digest,
+    load_manifest, manifest_files, save_manifest, write_if_changed, replace_if_changed,
+)
+from processors.link_index import DEFAULT_HEADING_ANCHORS, LinkIndex
+from processors.timing import Stopwatch, merge, slowest, write_report, DEFAULT_TOP_N
 
-def convert_content(source_dir: str, output_dir: str) -> None:
+# 影響輸出結果的設定，改變時會使清單失效並重新處理所有檔案
+IMAGE_SRC_PREFIX = '_static/laravel/'
+# 達到此大小的檔案以串流模式處理 (例如合併成單一頁面的 API 參考)，記憶體用量不隨檔案大小增加
+STREAM_THRESHOLD = 8 * 1024 * 1024
+
+def process_file(source_dir: str, output_dir: str, replacements: dict[str, str], filename: str,
+                 timings: dict | None = None, stream: bool = False) -> dict:
+    """
+    處理單一 Markdown 檔案並寫入輸出目錄，回傳要記錄於清單的資訊
+
+    replacements 為整個文件集預先下載好的圖片對照表。
+    提供 timings 時，會填入此檔案的耗時、輸入 / 輸出大小與各處理器的統計。
+    stream 為 True 或檔案達 STREAM_THRESHOLD 時改以串流模式處理 (見 `_stream_file`)，結果相同。
+    """
+    start = time.perf_counter() if timings is not None else 0.0
+    input_file_path = os.path.join(source_dir, filename)
+    output_file_path = os.path.join(output_dir, filename)
+    image_output_dir = os.path.join(output_dir, '_static', 'laravel')
+    stats = None
+    if timings is not None:
+        stats = timings['processors'] = {}
+
+    if stream or os.path.getsize(input_file_path) >= STREAM_THRESHOLD:
+        print(f"Processing: {filename} (streaming)")
+        output_hash, image_srcs, bytes_in, bytes_out = _stream_file(input_file_path, output_file_path,
+                                                                    replacements, stats)
+    else:
+        print(f"Processing: {filename}")
+
+        with open(input_file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        # --- 處理流程管道 ---
+        # 切成片段後依序呼叫各個處理器
+        bytes_in = len(content.encode('utf-8')) if timings is not None else 0
+        content = run_pipeline(content, image_output_dir, replacements, stats)
+
+        # --- 寫入處理後的檔案 (內容未改變時不寫入，保留 mtime) ---
+        write_if_changed(output_file_path, content)
+
+        output_hash = text_digest(content)
+        image_srcs = find_image_urls(content)
+        bytes_out = len(content.encode('utf-8')) if timings is not None else 0
+
+    if timings is not None:
+        timings.update({
+            'file': filename,
+            'seconds': time.perf_counter() - start,
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+        })
+
+    return {
+        'output': output_hash,
+        'images': sorted({src for src in image_srcs if src.startswith(IMAGE_SRC_PREFIX)}),
+        # 仍有外部圖片代表下載失敗，下次建置需要重試
+        'complete': not any(src.startswith('https://') for src in image_srcs),
+    }
+
+def _stream_file(input_file_path: str, output_file_path: str, replacements: dict[str, str],
+                 stats: dict | None) -> tuple[str, list[str], int, int]:
+    """
+    串流模式：逐行讀入、每處理完一個片段就寫入暫存檔並累計雜湊，記憶體用量與檔案大小無關 (見 `stream_pipeline`)。
+    回傳 (輸出雜湊, 圖片 src, 輸入大小, 輸出大小)；輸出內容未改變時保留原檔。
+    """
+    digest = hashlib.sha256()
+    image_srcs = []
+    bytes_out = 0
+    temp_path = f"{output_file_path}.{os.getpid()}.part"
+    try:
+        with open(input_file_path, 'r', encoding='utf-8') as source, open(temp_path, 'wb') as output:
+            for chunk in stream_pipeline(source, replacements, stats):
+                data = chunk.encode('utf-8')
+                digest.update(data)
+                output.write(data)
+                bytes_out += len(data)
+                if '<img' in chunk:
+                    image_srcs.extend(find_image_urls(chunk))
+        replace_if_changed(temp_path, output_file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return digest.hexdigest(), image_srcs, os.path.getsize(input_file_path), bytes_out
+
+def _process_file_captured(source_dir: str, output_dir: str, replacements: dict[str, str],
+                           report: bool, stream: bool, filename: str) -> tuple[str, dict, dict | None]:
+    """在 worker 中處理檔案，並回傳該檔案的主控台輸出 (由主程序依序印出) 與計時資料"""
+    buffer = io.StringIO()
+    timings = {} if report else None
+    with redirect_stdout(buffer):
+        result = process_file(source_dir, output_dir, replacements, filename, timings, stream)
+    return buffer.getvalue(), result, timings
+
+def _is_up_to_date(entry: dict | None, source_hash: str, output_dir: str, filename: str) -> bool:
+    """判斷清單中的紀錄是否仍有效：來源雜湊相同，且輸出與圖片都還在"""
+    if not entry or not entry.get('complete') or entry.get('source') != source_hash:
+        return False
+    if not os.path.isfile(os.path.join(output_dir, filename)):
+        return False
+    return all(os.path.isfile(os.path.join(output_dir, src)) for src in entry.get('images', []))
+
+def fetch_corpus_images(source_dir: str, filenames: list[str], image_output_dir: str,
+                        max_workers: int = DEFAULT_FETCH_WORKERS,
+                        image_cache: ImageCache | None = None) -> dict[str, str]:
+    """先收集所有待處理檔案引用的圖片，去除重複後一次同時下載"""
+    img_urls = []
+    for filename in filenames:
+        # 逐行讀入，很大的文件也不需整份讀入記憶體
+        with open(os.path.join(source_dir, filename), 'r', encoding='utf-8') as f:
+            img_urls.extend(collect_image_urls(f))
+
+    unique_count = len(set(img_urls))
+    if not unique_count:
+        return {}
+
+    print(f"Fetching {unique_count} images ({len(img_urls)} references)...")
+    replacements = fetch_images(img_urls, image_output_dir, max_workers, image_cache)
+    print()
+    return replacements
+
+def check_links(source_dir: str, filenames: list[str], heading_anchors: int = DEFAULT_HEADING_ANCHORS) -> list:
+    """
+    以所有文件建立頁面與錨點索引 (整個文件集只掃描一次)，印出並回傳失效的內部連結
+
+    即使檔案未改變而不需重新處理，其連結仍會檢查，因為目標頁面可能已被修改或刪除。
+    heading_anchors 需與 Sphinx 的 myst_heading_anchors 相同，結果才會與建置時的警告一致。
+    """
+    start = time.perf_counter()
+    index = LinkIndex(heading_anchors=heading_anchors)
+    for filename in filenames:
+        # 逐行讀入，索引只保留錨點與連結，不保留文件內容
+        with open(os.path.join(source_dir, filename), 'r', encoding='utf-8') as f:
+            index.add(filename[:-len('.md')], f)
+    dangling = index.dangling()
+
+    print(f"Checked {index.link_count} links in {len(filenames)} files: {len(dangling)} dangling "
+          f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+    for link in dangling:
+        print(f"  - {link}")
+    print()
+    return dangling
+
+def convert_content(source_dir: str, output_dir: str, jobs: int = 1, force: bool = False,
+                    image_workers: int = DEFAULT_FETCH_WORKERS,
+                    image_cache: ImageCache | None = None,
+                    report_path: str | None = None,
+                    strict_links: bool = False,
+                    stream: bool = False,
+                    heading_anchors: int = DEFAULT_HEADING_ANCHORS) -> None:
     """
     主要處理函式：遍歷檔案並依序執行所有處理器
+
+    jobs 大於 1 時，會將檔案分配給多個 process 同時處理，
+    主控台輸出仍依檔案順序印出，結果與單一 process 完全相同。
+
+    所有待處理檔案的圖片會先集中去除重複，再以 image_workers 個 thread 同時下載，
+    並經由 image_cache (本地圖片快取) 取得。
+
+    處理結果會記錄於輸出目錄的清單檔，來源檔雜湊、處理器版本與設定都未改變的檔案
+    會直接略過；來源檔已刪除的輸出檔會一併移除 (即使清單已失效)。force 為 True 時忽略清單中的紀錄。
+
+    提供 report_path 時，會記錄各階段、各檔案與各處理器的耗時與大小，寫成 JSON 報告，
+    並印出最慢的檔案與處理器。
+
+    處理前會檢查所有內部連結的目標頁面與錨點是否存在 (錨點為 heading_anchors 層級以內的標題)；
+    strict_links 為 True 時，有任何失效連結就不處理任何檔案並以非零狀態結束。
+
+    stream 為 True 時所有檔案都以串流模式處理 (預設只有達 STREAM_THRESHOLD 的檔案)，
+    每個檔案的記憶體用量只取決於其中最大的程式碼區塊或段落。
     """
+    stopwatch = Stopwatch() if report_path else None
+    file_timings = []
     print("Starting Laravel documentation content conversion...")
     print(f"Source directory: {source_dir}")
     print(f"Output directory: {output_dir}\n")
@@ -37,47 +217,142 @@ def convert_content(source_dir: str, output_dir: str) -> None:
     image_output_dir = os.path.join(output_dir, '_static', 'laravel')
     os.makedirs(image_output_dir, exist_ok=True)
 
+    filenames = [
+        filename for filename in sorted(os.listdir(source_dir))
+        if filename.endswith(".md") and os.path.isfile(os.path.join(source_dir, filename))
+    ]
+
+    fingerprint = build_fingerprint(pipeline_version(), {'image_src_prefix': IMAGE_SRC_PREFIX})
+    previous = {} if force else load_manifest(output_dir, fingerprint)
+    # 清單失效或 force 時仍依舊清單移除來源已刪除的輸出檔
+    previous_files = manifest_files(output_dir)
+
+    manifest = {}
+    pending = []
+    for filename in filenames:
+        source_hash = file_digest(os.path.join(source_dir, filename))
+        entry = previous.get(filename)
+        if _is_up_to_date(entry, source_hash, output_dir, filename):
+            manifest[filename] = entry
+        else:
+            manifest[filename] = {'source': source_hash}
+            pending.append(filename)
+
+    if stopwatch:
+        stopwatch.lap('scan_manifest')
+
+    dangling = check_links(source_dir, filenames, heading_anchors)
+    if dangling and strict_links:
+        print(f"Error: {len(dangling)} dangling links (--strict-links)")
+        sys.exit(1)
+    if stopwatch:
+        stopwatch.lap('check_links')
+
+    replacements = fetch_corpus_images(source_dir, pending, image_output_dir, image_workers, image_cache)
+    if stopwatch:
+        stopwatch.lap('fetch_images')
+
     processed_count = 0
-    for filename in os.listdir(source_dir):
-        if not filename.endswith(".md") or not os.path.isfile(os.path.join(source_dir, filename)):
-            continue
+    if jobs > 1 and len(pending) > 1:
+        worker = partial(_process_file_captured, source_dir, output_dir, replacements, bool(report_path), stream)
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+            # executor.map 依提交順序回傳結果，確保輸出依檔案排序
+            for filename, (log, result, timings) in zip(pending, executor.map(worker, pending)):
+                print(log, end='')
+                manifest[filename].update(result)
+                if timings is not None:
+                    file_timings.append(timings)
+                processed_count += 1
+    else:
+        for filename in pending:
+            timings = {} if report_path else None
+            manifest[filename].update(process_file(source_dir, output_dir, replacements, filename, timings, stream))
+            if timings is not None:
+                file_timings.append(timings)
+            processed_count += 1
+    if stopwatch:
+        stopwatch.lap('process_files')
 
-        input_file_path = os.path.join(source_dir, filename)
+    # 移除來源已不存在的輸出檔
+    removed_count = 0
+    for filename in sorted(previous_files - set(manifest)):
         output_file_path = os.path.join(output_dir, filename)
-        
-        print(f"Processing: {filename}")
+        if os.path.isfile(output_file_path):
+            print(f"Removing: {filename}")
+            os.remove(output_file_path)
+            removed_count += 1
 
-        with open(input_file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # --- 處理流程管道 ---
-        # 依序呼叫各個處理器
-        content = process_images(content, image_output_dir)
-        content = process_links(content)
-        content = process_diff_blocks(content)
-        content = process_php_tags(content)
-        content = process_tabs(content)
-        
-        # --- 寫入處理後的檔案 ---
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-
-        processed_count += 1
+    save_manifest(output_dir, fingerprint, manifest)
+    if stopwatch:
+        stopwatch.lap('cleanup')
 
     print("\nConversion completed!")
     print(f"Total files processed: {processed_count}")
+    print(f"Unchanged files skipped: {len(filenames) - processed_count}")
+    if removed_count:
+        print(f"Stale files removed: {removed_count}")
     print(f"Output files located at: {output_dir}")
 
+    if report_path:
+        write_timing_report(report_path, stopwatch.stages, file_timings, jobs)
+
+def write_timing_report(report_path: str, stages: dict[str, float], file_timings: list[dict], jobs: int) -> None:
+    """寫入 JSON 計時報告，並印出最慢的檔案與處理器"""
+    processors = {}
+    for timings in file_timings:
+        merge(processors, timings['processors'])
+
+    write_report(report_path, {
+        'jobs': jobs,
+        'stages': stages,
+        'processors': processors,
+        'files': sorted(file_timings, key=lambda timings: timings['file']),
+    })
+
+    print(f"\nTiming report written to {report_path}")
+    print("Stages:")
+    for stage, seconds in stages.items():
+        print(f"  {stage:<16} {seconds * 1000:10.1f} ms")
+    print(f"Slowest {DEFAULT_TOP_N} files:")
+    for timings in slowest(file_timings):
+        print(f"  {timings['file']:<40} {timings['seconds'] * 1000:10.1f} ms  "
+              f"{timings['bytes_in'] / 1024:8.1f} KB -> {timings['bytes_out'] / 1024:8.1f} KB")
+    print("Processors (total):")
+    for name, entry in sorted(processors.items(), key=lambda item: item[1]['seconds'], reverse=True):
+        print(f"  {name:<40} {entry['seconds'] * 1000:10.1f} ms  {entry['calls']:8d} calls")
+
 def main() -> None:
     """主函式：解析命令列參數並啟動轉換程序"""
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} <source_dir> <output_dir>")
-        print("  source_dir: Input directory containing .md files")
-        print("  output_dir: Output directory for processed files")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Pre-process Laravel documentation Markdown files for Sphinx")
+    parser.add_argument('source_dir', help="Input directory containing .md files")
+    parser.add_argument('output_dir', help="Output directory for processed files")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of worker processes (0 = number of CPUs, default: 1)")
+    parser.add_argument('--image-workers', type=int, default=DEFAULT_FETCH_WORKERS,
+                        help=f"Number of concurrent image downloads (default: {DEFAULT_FETCH_WORKERS})")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f"Image cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--image-cache-size', type=int, default=DEFAULT_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="Maximum image cache size in MB before old images are evicted (default: %(default)s)")
+    parser.add_argument('--offline', action='store_true',
+                        help="Do not access the network, build images entirely from the cache")
+    parser.add_argument('--force', action='store_true',
+                        help="Ignore the manifest and reprocess every file")
+    parser.add_argument('--report', metavar='PATH',
+                        help="Write a JSON timing report (stages, files, processors) and print the slowest items")
+    parser.add_argument('--strict-links', action='store_true',
+                        help="Fail without processing any file when an internal link points to a missing page or anchor")
+    parser.add_argument('--heading-anchors', type=int, default=DEFAULT_HEADING_ANCHORS,
+                        help="Deepest heading level that gets an anchor, must equal myst_heading_anchors "
+                             "(default: %(default)s)")
+    parser.add_argument('--stream', action='store_true',
+                        help=f"Stream every file through the processors with bounded memory "
+                             f"(default: only files of {STREAM_THRESHOLD // (1024 * 1024)} MB or more)")
+    args = parser.parse_args()
 
-    source_dir = sys.argv[1]
-    output_dir = sys.argv[2]
+    source_dir = args.source_dir
+    output_dir = args.output_dir
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
 
     if not os.path.isdir(source_dir):
         print(f"Error: Source directory '{source_dir}' does not exist")
@@ -90,7 +365,10 @@ def main() -> None:
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     sys.path.insert(0, project_root)
 
-    convert_content(source_dir, output_dir)
+    image_cache = ImageCache(args.cache_dir, args.image_cache_size * 1024 * 1024, args.offline)
+
+    convert_content(source_dir, output_dir, jobs, args.force, args.image_workers, image_cache, args.report,
+                    args.strict_links, args.stream, args.heading_anchors)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import platform
+import time
+import zipfile
+from importlib import metadata
+
+from .manifest import file_digest
+
+# 記錄上一次可重現建置的輸入雜湊與產出的 EPUB，存放於輸出目錄
+STAMP_FILENAME = '.build-stamp.json'
+STAMP_VERSION = 1
+
+# 版本不同就可能產生不同輸出的套件
+TOOL_PACKAGES = ('sphinx', 'docutils', 'myst-parser', 'Pygments', 'Pillow')
+
+# ZIP 格式無法記錄 1980 年以前的時間
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def _is_ignored(name: str) -> bool:
+    return name.startswith('.') or name == '__pycache__' or name.endswith(('~', '.pyc', '.bak'))
+
+
+def iter_input_files(root: str, excluded: set[str] = frozenset()):
+    """依固定順序列出目錄下的所有檔案 (略過隱藏檔、__pycache__ 與 excluded 中的目錄與檔案)。"""
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = sorted(name for name in subdirs
+                            if not _is_ignored(name) and os.path.join(directory, name) not in excluded)
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            if not _is_ignored(name) and path not in excluded:
+                yield path
+
+
+def tool_versions() -> dict[str, str | None]:
+    versions = {'python': platform.python_version()}
+    for package in TOOL_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def input_digest(roots: dict[str, str], excluded: set[str], extra: dict) -> str:
+    """
+    計算所有輸入的 SHA-256：roots 為「名稱 → 目錄或檔案」，每個檔案以相對路徑與內容計入，
+    extra 為其他會影響輸出的設定 (例如工具版本、要建置的版本)。
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(extra, sort_keys=True).encode('utf-8'))
+    for label, root in sorted(roots.items()):
+        paths = iter_input_files(root, excluded) if os.path.isdir(root) else [root] if os.path.isfile(root) else []
+        for path in paths:
+            relative = os.path.relpath(path, root) if os.path.isdir(root) else os.path.basename(path)
+            digest.update(f"\0{label}/{relative}\0".encode('utf-8'))
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_stamp(output_dir: str) -> dict | None:
+    try:
+        with open(os.path.join(output_dir, STAMP_FILENAME), 'r', encoding='utf-8') as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stamp if stamp.get('version') == STAMP_VERSION else None
+
+
+def save_stamp(output_dir: str, inputs: str, epubs: dict[str, str]) -> None:
+    """epubs 為「版本 → EPUB 路徑 (相對於 output_dir)」，一併記錄每個 EPUB 的雜湊。"""
+    stamp = {
+        'version': STAMP_VERSION,
+        'inputs': inputs,
+        'epubs': {variant: {'path': path, 'sha256': file_digest(os.path.join(output_dir, path))}
+                  for variant, path in sorted(epubs.items())},
+    }
+    path = os.path.join(output_dir, STAMP_FILENAME)
+    with open(f"{path}.part", 'w', encoding='utf-8') as f:
+        json.dump(stamp, f, indent=2)
+        f.write('\n')
+    os.replace(f"{path}.part", path)
+
+
+def is_up_to_date(stamp: dict | None, output_dir: str, inputs: str, variants: list[str]) -> bool:
+    """輸入雜湊相同，且每個要求的版本都有 EPUB、內容也與上次產出的完全相同。"""
+    if not stamp or stamp.get('inputs') != inputs:
+        return False
+    for variant in variants:
+        entry = stamp['epubs'].get(variant)
+        if entry is None:
+            return False
+        path = os.path.join(output_dir, entry['path'])
+        if not os.path.isfile(path) or file_digest(path) != entry['sha256']:
+            return False
+    return True
+
+
+def _is_normalized(info: zipfile.ZipInfo, date_time: tuple) -> bool:
+    # ZIP 的時間精確到 2 秒
+    expected = date_time[:5] + (date_time[5] // 2 * 2,)
+    return (info.date_time == expected and info.create_system == 3
+            and (info.external_attr >> 16) & 0o777 == 0o644)
+
+
+def normalize_zip(path: str, epoch: int) -> None:
+    """
+    以固定的時間與權限重寫 ZIP (EPUB)，保留原本的檔案順序與壓縮方式 (mimetype 仍為第一個、不壓縮)，
+    讓相同的內容產生位元組完全相同的檔案。
+    """
+    date_time = max(time.gmtime(epoch)[:6], ZIP_EPOCH)
+    # 由 epub_packager 以 SOURCE_DATE_EPOCH 封裝的 EPUB 已經符合，不必重新壓縮 (也保留其壓縮層級)
+    with zipfile.ZipFile(path) as source:
+        if all(_is_normalized(info, date_time) for info in source.infolist()):
+            return
+    temp_path = f"{path}.part"
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(temp_path, 'w') as target:
+        for info in source.infolist():
+            entry = zipfile.ZipInfo(info.filename, date_time)
+            entry.compress_type = info.compress_type
+            entry.external_attr = 0o644 << 16
+            entry.create_system = 3  # Unix，與執行建置的作業系統無關
+            target.writestr(entry, source.read(info.filename))
+    os.replace(temp_path, path)
@@ -1,24 +1,31 @@
-import re
+from .markdown_scanner import Fence, scan, render
+
+_DIFF_MARKERS = ('<!-- [tl! add] -->', '<!-- [tl! remove] -->')
 
-def process_diff_blocks(content: str) -> str:
-    """轉換 Laravel Doc 特有的 HTML diff 語法為標準 diff 語法。"""
-    def replacer(match: re.Match) -> str:
-        block_content = match.group(1)
 
-        should_convert = False
-        for line in block_content.splitlines():
-            stripped_line = line.strip()
-            if (stripped_line.startswith('+') or stripped_line.startswith('-')) and \
-               ('<!-- [tl! add] -->' in stripped_line or '<!-- [tl! remove] -->' in stripped_line):
-                should_convert = True
-                break
+def convert_diff_fence(fence: Fence) -> None:
+    """將帶有 `[tl! add|remove]` 註解的 html 程式碼區塊轉為 diff 區塊。"""
+    if fence.language != 'html':
+        return
 
-        if should_convert:
-            modified_content = block_content.replace('<!-- [tl! remove] -->', '')
-            modified_content = modified_content.replace('<!-- [tl! add] -->', '')
-            return f"```diff{modified_content}```"
-        
-        return match.group(0)
+    should_convert = False
+    for line in fence.body.splitlines():
+        stripped_line = line.strip()
+        if (stripped_line.startswith('+') or stripped_line.startswith('-')) and \
+           (_DIFF_MARKERS[0] in stripped_line or _DIFF_MARKERS[1] in stripped_line):
+            should_convert = True
+            break
 
-    return re.sub(r"```html(.*?)```", replacer, content, flags=re.DOTALL)
+    if should_convert:
+        modified_content = fence.body.replace(_DIFF_MARKERS[1], '')
+        fence.body = modified_content.replace(_DIFF_MARKERS[0], '')
+        fence.info = fence.info.replace('html', 'diff', 1)
 
+
+def process_diff_blocks(content: str) -> str:
+    """轉換 Laravel Doc 特有的 HTML diff 語法為標準 diff 語法。"""
+    segments = scan(content)
+    for segment in segments:
+        if isinstance(segment, Fence):
+            convert_diff_fence(segment)
+    return render(segments)
@@ -0,0 +1,370 @@
+import os
+import posixpath
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from urllib.parse import unquote
+from xml.parsers import expat
+
+from .link_index import build_link_index
+from .pipeline import pipeline_stages
+
+# 以 XML 檢查的檔案 (頁面與 NCX 目錄)
+PAGE_EXTENSIONS = ('.xhtml', '.html', '.htm', '.ncx')
+# 指向其他檔案的屬性
+REFERENCE_ATTRIBUTES = ('href', 'src', 'xlink:href')
+# 外部連結 (有 scheme 或以 // 開頭) 不檢查
+EXTERNAL_PATTERN = re.compile(r'^(?:[a-zA-Z][a-zA-Z0-9+.-]*:|//)')
+# chapter_split 分割出的檔案，例如 `queues-part2.xhtml`
+PART_SUFFIX_PATTERN = re.compile(r'-part\d+$')
+# 回溯錯誤來源時以帶有屬性的開始標籤作為線索
+START_TAG_PATTERN = re.compile(r'<[A-Za-z][^<>]*=[^<>]*>')
+_ATTRIBUTE_VALUE = re.compile(r'"[^"]*"')
+
+OPF_NAMESPACE = '{http://www.idpf.org/2007/opf}'
+CONTAINER_NAMESPACE = '{urn:oasis:names:tc:opendocument:xmlns:container}'
+
+# 每個 process 一次處理的頁面數量約為總數除以 (jobs * CHUNKS_PER_JOB)，讓各 process 的工作量較平均
+CHUNKS_PER_JOB = 4
+
+
+@dataclass
+class Issue:
+    """驗證發現的一個問題，source / processor 為回溯到的 Markdown 位置與產生問題的處理器。"""
+    page: str  # EPUB 內的檔案
+    line: int
+    kind: str  # 'xml'、'duplicate_id'、'dangling_href'、'missing_file'、'unlisted_file'、'spine'
+    message: str
+    excerpt: str = ''  # 問題所在的 XHTML 行
+    needles: list[str] = field(default_factory=list)  # 用來在 Markdown 中尋找來源的片段
+    in_code: bool = False  # 位於 <pre> 內 (由 torchlight 產生)
+    occurrence: int = 0  # 線索在頁面中是第幾次出現 (由 0 起算)，例如重複的 id
+    target: str = ''  # dangling_href 的目標檔案與錨點
+    anchor: str = ''
+    source: str | None = None
+    source_line: int | None = None
+    processor: str | None = None
+
+    def __str__(self) -> str:
+        text = f"{self.page}:{self.line}: {self.kind}: {self.message}"
+        if self.excerpt:
+            text += f"\n    {self.excerpt}"
+        if self.source:
+            location = f"{self.source}:{self.source_line}" if self.source_line else self.source
+            text += f"\n    -> {location} ({self.processor or 'source Markdown'})"
+        return text
+
+
+@dataclass
+class PageResult:
+    """單一頁面的檢查結果，ids 包含 id 與 `<a name>`，links 為 (行號, 目標檔案, 錨點, 原始 href)。"""
+    name: str
+    ids: set[str] = field(default_factory=set)
+    links: list[tuple[int, str, str, str]] = field(default_factory=list)
+    issues: list[Issue] = field(default_factory=list)
+    well_formed: bool = True
+
+
+@dataclass
+class ValidationReport:
+    path: str
+    pages: int
+    seconds: float
+    issues: list[Issue]
+
+
+class Container:
+    """EPUB 檔或建置輸出目錄 (未打包的 EPUB 內容) 的唯讀存取，檔名一律為以 / 分隔的相對路徑。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.is_zip = os.path.isfile(path)
+        if self.is_zip:
+            self._zip = zipfile.ZipFile(path)
+            self.names = [info.filename for info in self._zip.infolist() if not info.is_dir()]
+        else:
+            self._zip = None
+            self.names = []
+            for directory, subdirs, files in os.walk(path):
+                subdirs[:] = sorted(name for name in subdirs if not name.startswith('.'))
+                relative = os.path.relpath(directory, path)
+                for name in sorted(files):
+                    if not name.startswith('.'):
+                        self.names.append(posixpath.normpath(posixpath.join(relative.replace(os.sep, '/'), name)))
+
+    def read(self, name: str) -> bytes:
+        if self._zip is not None:
+            return self._zip.read(name)
+        with open(os.path.join(self.path, *name.split('/')), 'rb') as f:
+            return f.read()
+
+    def close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+
+
+def _resolve(page: str, reference: str) -> tuple[str, str]:
+    """將頁面中的相對參照轉為 (容器內的檔名, 錨點)，只有錨點時目標為頁面自己。"""
+    target, _, anchor = reference.partition('#')
+    if not target:
+        return page, anchor
+    return posixpath.normpath(posixpath.join(posixpath.dirname(page), unquote(target))), anchor
+
+
+def _tag_needles(line: str, column: int) -> list[str]:
+    """取出該行帶有屬性的開始標籤，距離錯誤位置越近 (且在其之前) 的排越前面。"""
+    tags = list(START_TAG_PATTERN.finditer(line))
+    before = [match.group() for match in reversed(tags) if match.start() <= column]
+    after = [match.group() for match in tags if match.start() > column]
+    return before + after
+
+
+def check_page(name: str, data: bytes) -> PageResult:
+    """以 expat 串流解析一個頁面，檢查格式與重複的 id，並收集 id 與所有內部參照。"""
+    result = PageResult(name)
+    parser = expat.ParserCreate()
+    first_seen = {}
+    seen_count = {}
+    pre_depth = 0
+
+    def start(tag, attributes):
+        nonlocal pre_depth
+        line = parser.CurrentLineNumber
+        if tag == 'pre':
+            pre_depth += 1
+        ident = attributes.get('id')
+        if ident is not None:
+            if ident in first_seen:
+                result.issues.append(Issue(
+                    name, line, 'duplicate_id', f'duplicate id "{ident}" (first defined on line {first_seen[ident]})',
+                    needles=[f'id="{ident}"'], in_code=pre_depth > 0, occurrence=seen_count[ident]))
+            else:
+                first_seen[ident] = line
+            seen_count[ident] = seen_count.get(ident, 0) + 1
+            result.ids.add(ident)
+        if tag == 'a' and 'name' in attributes:
+            result.ids.add(attributes['name'])
+        for attribute in REFERENCE_ATTRIBUTES:
+            reference = attributes.get(attribute)
+            if reference and not EXTERNAL_PATTERN.match(reference):
+                target, anchor = _resolve(name, reference)
+                result.links.append((line, target, anchor, reference))
+
+    def end(tag):
+        nonlocal pre_depth
+        if tag == 'pre':
+            pre_depth -= 1
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    try:
+        parser.Parse(data, True)
+    except expat.ExpatError as e:
+        result.well_formed = False
+        lines = data.decode('utf-8', errors='replace').splitlines()
+        line = lines[e.lineno - 1] if 0 < e.lineno <= len(lines) else ''
+        preceding = '\n'.join(lines[:e.lineno - 1]) + line[:e.offset]
+        in_code = preceding.count('<pre') > preceding.count('</pre>')
+        needles = _tag_needles(line, e.offset)
+        if len(line.strip()) >= 8:
+            needles.append(line.strip())
+        result.issues.append(Issue(name, e.lineno, 'xml', f"{expat.ErrorString(e.code)} (column {e.offset + 1})",
+                                   excerpt=line.strip()[:200], needles=needles, in_code=in_code))
+    # 問題所在的行，供輸出時顯示
+    if any(not issue.excerpt for issue in result.issues):
+        lines = data.decode('utf-8', errors='replace').splitlines()
+        for issue in result.issues:
+            if not issue.excerpt and 0 < issue.line <= len(lines):
+                issue.excerpt = lines[issue.line - 1].strip()[:200]
+    return result
+
+
+def _check_pages(path: str, names: list[str]) -> list[PageResult]:
+    """於 worker process 中檢查一批頁面，每批只開啟一次 EPUB。"""
+    container = Container(path)
+    try:
+        return [check_page(name, container.read(name)) for name in names]
+    finally:
+        container.close()
+
+
+def _package_path(container: Container) -> str:
+    """由 META-INF/container.xml 取得 OPF 的位置 (Sphinx 產生的 EPUB 為 content.opf)。"""
+    if 'META-INF/container.xml' in container.names:
+        root = ElementTree.fromstring(container.read('META-INF/container.xml'))
+        rootfile = root.find(f'.//{CONTAINER_NAMESPACE}rootfile')
+        if rootfile is not None and rootfile.get('full-path'):
+            return rootfile.get('full-path')
+    return 'content.opf'
+
+
+def check_package(container: Container, results: dict[str, PageResult]) -> list[Issue]:
+    """檢查 OPF 的 manifest 與 spine，以及所有頁面中的參照是否都指向存在且列於 manifest 的檔案。"""
+    issues = []
+    names = set(container.names)
+    opf = _package_path(container)
+    if opf not in names:
+        return [Issue(opf, 0, 'missing_file', 'package document not found')]
+    try:
+        root = ElementTree.fromstring(container.read(opf))
+    except ElementTree.ParseError as e:
+        return [Issue(opf, e.position[0], 'xml', str(e))]
+
+    manifest = {}
+    for item in root.iter(f'{OPF_NAMESPACE}item'):
+        href = posixpath.normpath(posixpath.join(posixpath.dirname(opf), unquote(item.get('href', ''))))
+        manifest[item.get('id')] = href
+        if href not in names:
+            issues.append(Issue(opf, 0, 'missing_file', f'manifest item "{item.get("id")}" points to missing {href}'))
+    for itemref in root.iter(f'{OPF_NAMESPACE}itemref'):
+        if itemref.get('idref') not in manifest:
+            issues.append(Issue(opf, 0, 'spine', f'spine refers to unknown manifest item "{itemref.get("idref")}"'))
+
+    listed = set(manifest.values())
+    referenced = set()
+    for page, result in sorted(results.items()):
+        for line, target, anchor, reference in result.links:
+            referenced.add(target)
+            issue = None
+            if target not in names:
+                issue = Issue(page, line, 'dangling_href', f'"{reference}": {target} does not exist')
+            elif target not in listed:
+                issue = Issue(page, line, 'missing_file', f'"{reference}": {target} is not listed in the manifest')
+            elif anchor and target in results and results[target].well_formed and anchor not in results[target].ids:
+                issue = Issue(page, line, 'dangling_href', f'"{reference}": no id "{anchor}" in {target}')
+            if issue is not None:
+                issue.target, issue.anchor = target, anchor
+                issues.append(issue)
+
+    # 建置目錄中還有不會打包的檔案 (例如 .buildinfo)，只檢查 EPUB 檔
+    if container.is_zip:
+        for name in sorted(names - listed - referenced):
+            if name not in ('mimetype', opf) and not name.startswith('META-INF/'):
+                issues.append(Issue(name, 0, 'unlisted_file', 'packaged but not listed in the manifest'))
+    return issues
+
+
+class SourceLocator:
+    """將問題回溯到 source 目錄中的 Markdown 檔與產生問題的處理器。"""
+
+    def __init__(self, source_dir: str):
+        self.source_dir = source_dir
+        self._contents = {}
+        self._link_index = None
+
+    def document(self, page: str) -> str | None:
+        """EPUB 內的頁面對應的文件名稱 (不含 .md)，分割出的 `-partN` 檔對應原本的文件。"""
+        stem = posixpath.splitext(page)[0]
+        for candidate in (stem, PART_SUFFIX_PATTERN.sub('', stem)):
+            if os.path.isfile(os.path.join(self.source_dir, f"{candidate}.md")):
+                return candidate
+        return None
+
+    def content(self, document: str) -> str:
+        if document not in self._contents:
+            with open(os.path.join(self.source_dir, f"{document}.md"), 'r', encoding='utf-8') as f:
+                self._contents[document] = f.read()
+        return self._contents[document]
+
+    @property
+    def link_index(self):
+        if self._link_index is None:
+            documents = {}
+            for filename in sorted(os.listdir(self.source_dir)):
+                if filename.endswith('.md'):
+                    documents[filename[:-3]] = self.content(filename[:-3])
+            self._link_index = build_link_index(documents)
+        return self._link_index
+
+    def locate(self, issue: Issue) -> None:
+        document = self.document(issue.page)
+        if document is None:
+            return
+        issue.source = f"{document}.md"
+        if issue.kind == 'dangling_href' and self._locate_link(issue, document):
+            return
+        line, processor = self._blame(document, issue.needles, issue.occurrence)
+        if line is not None:
+            issue.source_line, issue.processor = line, processor
+        else:
+            # 不是由 Markdown 中的片段直接產生，程式碼區塊為 torchlight 的輸出，其餘為 myst 的轉換
+            issue.processor = 'torchlight' if issue.in_code else 'myst_parser'
+
+    def _locate_link(self, issue: Issue, document: str) -> bool:
+        target = self.document(issue.target) if issue.target != issue.page else document
+        for line, link_target, anchor in self.link_index.links.get(document, ()):
+            if anchor == issue.anchor and (target is None or link_target == target):
+                issue.source_line = line
+                # Markdown 中的連結本來就失效時，問題在來源而不是處理器
+                broken = self.link_index.check(link_target, anchor) is not None
+                issue.processor = None if broken else 'link_handler.process_links'
+                return True
+        return False
+
+    def _blame(self, document: str, needles: list[str], occurrence: int = 0) -> tuple[int | None, str | None]:
+        """
+        找出最早出現線索的處理階段：出現在原始內容表示問題來自 Markdown 本身，否則為第一個產生它的處理器。
+        線索出現多次時取第 occurrence 次 (不足時取最後一次)。
+        """
+        if not needles:
+            return None, None
+        stages = list(pipeline_stages(self.content(document)))
+        for pattern in _needle_patterns(needles):
+            for name, text in stages:
+                matches = list(pattern.finditer(text))
+                if matches:
+                    match = matches[min(occurrence, len(matches) - 1)]
+                    line = text.count('\n', 0, match.start()) + 1
+                    return line, None if name == 'source' else name
+        return None, None
+
+
+def _needle_patterns(needles: list[str]) -> list[re.Pattern]:
+    """先找完全相同的片段，再找屬性值不同 (例如圖片網址已換成本地路徑)、自我結束與否不同的標籤。"""
+    exact = [re.compile(re.escape(needle)) for needle in needles]
+    loose = []
+    for needle in needles:
+        if needle.startswith('<') and needle.endswith('>'):
+            body = re.sub(r'\s*/?>$', '', needle)
+            parts = [re.escape(part) for part in _ATTRIBUTE_VALUE.split(body)]
+            loose.append(re.compile('"[^"]*"'.join(parts) + r'\s*/?>'))
+    return exact + loose
+
+
+def validate(path: str, source_dir: str | None = None, jobs: int = 1) -> ValidationReport:
+    """
+    驗證一個 EPUB 檔 (或建置輸出目錄) 中所有頁面的格式、重複的 id、失效的內部參照與 manifest。
+
+    頁面直接從 EPUB 中串流讀取，jobs 大於 1 時分批交給多個 process 同時檢查。
+    提供 source_dir (原始 Markdown 目錄) 時，會將每個問題回溯到 Markdown 的行號與產生問題的處理器。
+    """
+    start = time.perf_counter()
+    container = Container(path)
+    try:
+        pages = [name for name in container.names if name.lower().endswith(PAGE_EXTENSIONS)]
+        if jobs > 1 and len(pages) > 1:
+            count = min(len(pages), jobs * CHUNKS_PER_JOB)
+            chunks = [pages[index::count] for index in range(count)]
+            with ProcessPoolExecutor(max_workers=min(jobs, count)) as executor:
+                page_results = [result for chunk in executor.map(partial(_check_pages, path), chunks)
+                                for result in chunk]
+        else:
+            page_results = [check_page(name, container.read(name)) for name in pages]
+        results = {result.name: result for result in page_results}
+
+        issues = [issue for name in sorted(results) for issue in results[name].issues]
+        issues.extend(check_package(container, results))
+    finally:
+        container.close()
+
+    if source_dir is not None and os.path.isdir(source_dir):
+        locator = SourceLocator(source_dir)
+        for issue in issues:
+            locator.locate(issue)
+
+    issues.sort(key=lambda issue: (issue.page, issue.line))
+    return ValidationReport(path, len(pages), time.perf_counter() - start, issues)
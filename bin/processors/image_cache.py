@@ -0,0 +1,193 @@
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+# 預設快取位置：專案根目錄下的 .cache/images
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.cache', 'images'
+)
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+INDEX_FILENAME = 'index.json'
+INDEX_VERSION = 1
+
+
+class ImageCacheMiss(Exception):
+    """離線模式下，快取中沒有該圖片。"""
+
+
+class ImageCache:
+    """
+    以 URL 為索引、以內容雜湊儲存圖片的磁碟快取
+
+    -   `blobs/<sha256>` 存放圖片內容，相同內容只存一份。
+    -   `index.json` 記錄 URL 對應的 blob、副檔名、ETag / Last-Modified 與最後使用時間。
+    -   已快取的 URL 會以條件式 GET 重新驗證，伺服器回應 304 時不需重新傳輸。
+    -   離線模式完全不連網，只使用快取。
+    -   快取總大小超過上限時，依最後使用時間淘汰 (本次建置用到的不會被淘汰)。
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 offline: bool = False):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._used: set[str] = set()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._entries = self._load_index()
+
+    def _load_index(self) -> dict[str, dict]:
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILENAME), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if index.get('version') != INDEX_VERSION:
+            return {}
+        return index.get('entries', {})
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest)
+
+    def _cached_entry(self, url: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry and os.path.isfile(self.blob_path(entry['blob'])):
+            return entry
+        return None
+
+    def _touch(self, url: str, entry: dict) -> dict:
+        with self._lock:
+            entry['used'] = time.time()
+            self._entries[url] = entry
+            self._used.add(entry['blob'])
+        return entry
+
+    def get(self, session: requests.Session, url: str) -> dict:
+        """取得圖片的快取紀錄，必要時下載或以條件式 GET 重新驗證。"""
+        entry = self._cached_entry(url)
+        if self.offline:
+            if entry is None:
+                raise ImageCacheMiss("not in image cache (offline mode)")
+            return self._touch(url, entry)
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = session.get(url, headers=headers, stream=True, timeout=10)
+        with response:
+            if entry is not None and response.status_code == 304:
+                return self._touch(url, entry)
+            response.raise_for_status()
+            digest, size = self._store_blob(response)
+
+        return self._touch(url, {
+            'blob': digest,
+            'ext': _image_extension(url, response.headers.get('Content-Type')),
+            'size': size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        })
+
+    def _store_blob(self, response: requests.Response) -> tuple[str, int]:
+        """邊下載邊計算雜湊，寫入暫存檔後再改名為 blob。"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.blob_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            os.replace(temp_path, self.blob_path(digest.hexdigest()))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return digest.hexdigest(), size
+
+    def export(self, entry: dict, output_dir: str) -> str:
+        """
+        將 blob 放到輸出目錄並回傳檔名。檔名由內容雜湊決定，
+        因此不同 URL 的相同圖片只會有一份，同名但內容不同的圖片也不會互相覆蓋。
+        """
+        image_filename = f"{entry['blob'][:16]}{entry['ext']}"
+        target = os.path.join(output_dir, image_filename)
+        if not os.path.isfile(target):
+            fd, temp_path = tempfile.mkstemp(dir=output_dir, suffix='.part')
+            os.close(fd)
+            try:
+                shutil.copyfile(self.blob_path(entry['blob']), temp_path)
+                os.replace(temp_path, target)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        return image_filename
+
+    def save(self) -> None:
+        """
+        淘汰超過容量的 blob，並寫回索引。
+
+        同一個快取可能由多個 process 同時使用 (例如 build_matrix.py 同時預處理多份文件)，
+        寫回前先合併其他 process 在此期間寫入的紀錄，避免互相覆蓋。
+        """
+        with self._lock:
+            for url, entry in self._load_index().items():
+                current = self._entries.get(url)
+                if current is None or entry.get('used', 0.0) > current.get('used', 0.0):
+                    if os.path.isfile(self.blob_path(entry['blob'])):
+                        self._entries[url] = entry
+            self._evict()
+            index_path = os.path.join(self.cache_dir, INDEX_FILENAME)
+            temp_path = f"{index_path}.{os.getpid()}.part"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'entries': self._entries}, f, indent=2, sort_keys=True)
+                f.write('\n')
+            os.replace(temp_path, index_path)
+
+    def _evict(self) -> None:
+        # 每個 blob 的大小與最後使用時間 (多個 URL 共用 blob 時取最新者)
+        blobs: dict[str, tuple[float, int]] = {}
+        for entry in self._entries.values():
+            used, size = blobs.get(entry['blob'], (0.0, entry.get('size', 0)))
+            blobs[entry['blob']] = (max(used, entry.get('used', 0.0)), size)
+
+        total = sum(size for _, size in blobs.values())
+        evicted = set()
+        for digest, (_, size) in sorted(blobs.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            if digest in self._used:
+                continue
+            evicted.add(digest)
+            total -= size
+            if os.path.exists(self.blob_path(digest)):
+                os.remove(self.blob_path(digest))
+
+        if evicted:
+            print(f"  - Evicted {len(evicted)} cached images to stay under {self.max_bytes // (1024 * 1024)} MB")
+            self._entries = {url: entry for url, entry in self._entries.items() if entry['blob'] not in evicted}
+
+
+def _image_extension(url: str, content_type: str | None) -> str:
+    """副檔名優先取自 URL，沒有時再依 Content-Type 判斷。"""
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    if ext:
+        return ext
+    if content_type:
+        return mimetypes.guess_extension(content_type.split(';')[0].strip()) or ''
+    return ''
@@ -1,49 +1,98 @@
-import os
 import re
 import requests
-import hashlib
-from urllib.parse import urlparse
-
-def _download_image(url: str, save_path: str) -> bool:
-    """下載指定 URL 的圖片並儲存到指定路徑。"""
-    try:
-        response = requests.get(url, stream=True, timeout=10)
-        response.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        return True
-    except requests.exceptions.RequestException as e:
-        print(f"    - Error downloading {url}: {e}")
-        return False
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
 
-def process_images(content: str, image_output_dir: str) -> str:
-    """處理 Markdown 內容中的圖片，下載並替換路徑。"""
-    img_urls = re.findall(r'<img[^>]+src="([^"]+)"', content)
-    if not img_urls:
-        return content
+from .markdown_scanner import STREAM_PROSE_LIMIT, Prose, iter_segments, scan
+from .image_cache import ImageCache, ImageCacheMiss
+
+_IMG_SRC = re.compile(r'<img[^>]+src="([^"]+)"')
+_IMG_UNCLOSED = re.compile(r'(<img[^>]*)(?<!/)>')
+
+# 同時下載圖片的預設 worker 數量
+DEFAULT_FETCH_WORKERS = 8
+
+def _create_session(max_workers: int) -> requests.Session:
+    """建立可重用連線的 HTTP session，連線池大小與 worker 數量一致。"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def is_remote_image(url: str) -> bool:
+    """只有 https 的外部圖片需要下載。"""
+    return url.startswith('https://')
+
+def find_image_urls(content: str) -> list[str]:
+    """找出內容中 `<img>` 標籤引用的圖片 URL。"""
+    return _IMG_SRC.findall(content)
+
+def collect_image_urls(content: str | Iterable[str]) -> list[str]:
+    """
+    找出文件一般文字片段中需要下載的圖片 URL (程式碼區塊內的範例不算)。
+
+    content 可為整份文件，或逐行的 iterable (例如開啟的檔案)，後者不需將整份文件讀入記憶體。
+    """
+    segments = scan(content) if isinstance(content, str) else iter_segments(content, STREAM_PROSE_LIMIT)
+    urls = []
+    for segment in segments:
+        if isinstance(segment, Prose):
+            urls.extend(url for url in find_image_urls(segment.text) if is_remote_image(url))
+    return urls
 
-    content = re.sub(r'(<img[^>]*)(?<!/)>', r'\1 />', content)
+def fetch_images(urls, image_output_dir: str, max_workers: int = DEFAULT_FETCH_WORKERS,
+                 cache: ImageCache | None = None) -> dict[str, str]:
+    """
+    以共用連線池的 session 同時取得多張圖片 (重複的 URL 只處理一次)，
+    回傳 URL 與本地路徑的對照表 (只包含成功者)。
 
-    for url in set(img_urls):
-        if not url.startswith('https://'):
-            continue
+    圖片經由 cache 取得 (未提供時使用預設位置的快取)，已快取的圖片以條件式 GET 重新驗證，
+    輸出檔名由內容雜湊決定。
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return {}
 
+    if cache is None:
+        cache = ImageCache()
+    max_workers = max(1, min(max_workers, len(unique_urls)))
+
+    def fetch(url: str) -> tuple[str | None, str | None]:
         try:
-            image_filename = os.path.basename(urlparse(url).path)
-            if not image_filename:
-                image_filename = "img_" + hashlib.md5(url.encode()).hexdigest()[:10]
+            return cache.export(cache.get(session, url), image_output_dir), None
+        except (requests.exceptions.RequestException, ImageCacheMiss, OSError) as e:
+            return None, str(e)
 
-            local_image_path = os.path.join(image_output_dir, image_filename)
-            new_image_src = f"_static/laravel/{image_filename}"
-            
+    replacements = {}
+    with _create_session(max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 依 URL 順序印出結果，讓主控台輸出不受下載完成順序影響
+        for url, (image_filename, error) in zip(unique_urls, executor.map(fetch, unique_urls)):
             print(f"  - Found image: {url}")
-            print(f"    - Downloading to: {new_image_src}")
-            
-            if _download_image(url, local_image_path):
-                content = content.replace(url, new_image_src)
-
-        except Exception as e:
-            print(f"    - Failed to process image URL {url}: {e}")
-            
+            if error is None:
+                new_image_src = f"_static/laravel/{image_filename}"
+                print(f"    - Saved to: {new_image_src}")
+                replacements[url] = new_image_src
+            else:
+                print(f"    - Error downloading {url}: {error}")
+
+    cache.save()
+    return replacements
+
+def rewrite_images(content: str, replacements: dict[str, str]) -> str:
+    """閉合 `<img>` 標籤，並將已下載的圖片 URL 換成本地路徑。"""
+    if '<img' not in content:
+        return content
+
+    content = _IMG_UNCLOSED.sub(r'\1 />', content)
+    for url, new_image_src in replacements.items():
+        content = content.replace(url, new_image_src)
     return content
+
+def process_images(content: str, image_output_dir: str) -> str:
+    """處理 Markdown 內容中的圖片，下載並替換路徑。"""
+    img_urls = [url for url in find_image_urls(content) if is_remote_image(url)]
+    if not img_urls:
+        return content
+
+    return rewrite_images(content, fetch_images(img_urls, image_output_dir))
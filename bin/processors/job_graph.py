@@ -0,0 +1,197 @@
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+# 記錄每個工作上一次的耗時，作為下次排程的估計值
+TIMINGS_FILENAME = 'timings.json'
+
+
+@dataclass
+class Job:
+    """
+    相依圖中的一個工作：func(*args, *inputs) 於獨立的 process 中執行。
+
+    inputs 為要傳入的前置工作名稱，其回傳值會依序附加在 args 之後；deps 為其他只需先完成的工作。
+    cost 為沒有上次耗時紀錄時的估計值 (相對大小即可)。
+    """
+    name: str
+    func: object
+    args: tuple = ()
+    deps: tuple[str, ...] = ()
+    inputs: tuple[str, ...] = ()
+    cost: float = 1.0
+
+    @property
+    def requires(self) -> set[str]:
+        return set(self.deps) | set(self.inputs)
+
+
+@dataclass
+class JobResult:
+    name: str
+    status: str  # 'ok'、'failed' 或 'skipped' (前置工作失敗)
+    start: float = 0.0
+    end: float = 0.0
+    value: object = None
+    error: str = ''
+    log: str | None = None
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class GraphReport:
+    results: dict[str, JobResult]
+    seconds: float
+    critical_path: list[str] = field(default_factory=list)
+
+    @property
+    def failed(self) -> list[JobResult]:
+        return [result for result in self.results.values() if result.status != 'ok']
+
+
+def load_timings(work_dir: str) -> dict[str, float]:
+    try:
+        with open(os.path.join(work_dir, TIMINGS_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_timings(work_dir: str, results: dict[str, JobResult]) -> None:
+    timings = load_timings(work_dir)
+    timings.update({name: round(result.seconds, 3) for name, result in results.items() if result.status == 'ok'})
+    path = os.path.join(work_dir, TIMINGS_FILENAME)
+    with open(f"{path}.part", 'w', encoding='utf-8') as f:
+        json.dump(timings, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(f"{path}.part", path)
+
+
+def _check_graph(jobs: dict[str, Job]) -> list[str]:
+    """檢查相依的工作都存在且沒有循環，回傳拓撲排序。"""
+    order = []
+    state = {}
+
+    def visit(name, chain):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"dependency cycle: {' -> '.join(chain + [name])}")
+        state[name] = 'visiting'
+        for dependency in sorted(jobs[name].requires):
+            if dependency not in jobs:
+                raise ValueError(f"job '{name}' depends on unknown job '{dependency}'")
+            visit(dependency, chain + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for name in jobs:
+        visit(name, [])
+    return order
+
+
+def _priorities(jobs: dict[str, Job], order: list[str], estimates: dict[str, float]) -> dict[str, float]:
+    """每個工作到終點的最長 (估計) 路徑，排程時優先執行位於關鍵路徑上的工作。"""
+    dependents = {name: [] for name in jobs}
+    for name, job in jobs.items():
+        for dependency in job.requires:
+            dependents[dependency].append(name)
+    priority = {}
+    for name in reversed(order):
+        cost = estimates.get(name, jobs[name].cost)
+        priority[name] = cost + max((priority[child] for child in dependents[name]), default=0.0)
+    return priority
+
+
+def critical_path(jobs: dict[str, Job], results: dict[str, JobResult]) -> list[str]:
+    """
+    以實際的開始與結束時間找出關鍵路徑：從最後完成的工作開始，
+    每次往回取最晚完成的前置工作，即為決定總時間的那條工作鏈。
+    """
+    finished = [result for result in results.values() if result.status != 'skipped']
+    if not finished:
+        return []
+    path = [max(finished, key=lambda result: result.end).name]
+    while True:
+        requires = [results[name] for name in jobs[path[-1]].requires if results[name].status != 'skipped']
+        if not requires:
+            break
+        path.append(max(requires, key=lambda result: result.end).name)
+    path.reverse()
+    return path
+
+
+def _run_logged(func, log_path: str | None, args: tuple):
+    """於 worker process 中執行工作，stdout / stderr (含子程序與 Sphinx 的輸出) 導向該工作的記錄檔。"""
+    if log_path is None:
+        return func(*args)
+    with open(log_path, 'w', encoding='utf-8') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        return func(*args)
+
+
+def run_jobs(jobs: list[Job], workers: int, log_dir: str | None = None,
+             estimates: dict[str, float] | None = None, on_finish=None) -> GraphReport:
+    """
+    依相依圖執行所有工作，最多同時執行 workers 個；前置工作都完成的工作中，優先執行到終點路徑最長者。
+
+    每個工作在全新的 process 中執行 (不共用已載入的模組與設定檔)，輸出寫入 log_dir 中的記錄檔。
+    工作失敗時，其後續工作會被略過，其他不相關的工作照常執行。
+    on_finish(result) 於每個工作結束時在主 process 中呼叫，可用來即時印出進度。
+    """
+    graph = {job.name: job for job in jobs}
+    order = _check_graph(graph)
+    priority = _priorities(graph, order, estimates or {})
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+
+    results: dict[str, JobResult] = {}
+    waiting = set(graph)
+    running = {}
+    origin = time.perf_counter()
+
+    def finish(result: JobResult) -> None:
+        results[result.name] = result
+        if on_finish is not None:
+            on_finish(result)
+
+    # max_tasks_per_child=1：每個工作使用全新的 process (spawn)，例如各樣板的 conf_common 不會互相沿用
+    with ProcessPoolExecutor(max_workers=max(1, workers), max_tasks_per_child=1) as executor:
+        while waiting or running:
+            for name in sorted(waiting):
+                failed = [dependency for dependency in graph[name].requires
+                          if dependency in results and results[dependency].status != 'ok']
+                if failed:
+                    waiting.discard(name)
+                    finish(JobResult(name, 'skipped', error=f"{failed[0]} did not succeed"))
+
+            ready = sorted((name for name in waiting if graph[name].requires <= results.keys()),
+                           key=lambda name: (-priority[name], name))
+            for name in ready[:max(0, workers - len(running))]:
+                job = graph[name]
+                waiting.discard(name)
+                log_path = os.path.join(log_dir, f"{name.replace(':', '_').replace('/', '_')}.log") if log_dir else None
+                args = job.args + tuple(results[dependency].value for dependency in job.inputs)
+                future = executor.submit(_run_logged, job.func, log_path, args)
+                running[future] = (name, time.perf_counter() - origin, log_path)
+
+            if not running:
+                if waiting:
+                    continue
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, start, log_path = running.pop(future)
+                end = time.perf_counter() - origin
+                try:
+                    finish(JobResult(name, 'ok', start, end, future.result(), log=log_path))
+                except Exception as e:
+                    finish(JobResult(name, 'failed', start, end, error=f"{type(e).__name__}: {e}", log=log_path))
+
+    return GraphReport(results, time.perf_counter() - origin, critical_path(graph, results))
@@ -1,17 +1,17 @@
 import re
 
+# 內部文件連結，一次比對兩種格式：含 #錨點 的連結 (group 1、2) 與一般的連結 (group 3)
+LINK_PATTERN = re.compile(r'\(/docs/\{\{version\}\}/(?:([^)#]+)#([^)]+)|([^)]+))\)')
+
+
+def _rewrite_link(match: re.Match) -> str:
+    if match.lastindex == 3:
+        return f"({match.group(3)}.md)"
+    return f"({match.group(1)}.md#{match.group(2)})"
+
+
 def process_links(content: str) -> str:
     """處理內部文件連結轉換。"""
-    # 轉換包含 #錨點 的連結
-    content = re.sub(
-        r'\(/docs/\{\{version\}\}/([^)#]+)#([^)]+)\)',
-        r'(\1.md#\2)',
-        content
-    )
-    # 轉換一般的連結
-    content = re.sub(
-        r'\(/docs/\{\{version\}\}/([^)]+)\)',
-        r'(\1.md)',
-        content
-    )
-    return content
+    if '/docs/' not in content:
+        return content
+    return LINK_PATTERN.sub(_rewrite_link, content)
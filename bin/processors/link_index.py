@@ -0,0 +1,126 @@
+import re
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from .markdown_scanner import STREAM_PROSE_LIMIT, Prose, iter_segments, scan
+from .link_handler import LINK_PATTERN
+
+# 同一份文件內的錨點連結，例如頁首目錄的 `[Introduction](#introduction)`
+LOCAL_LINK_PATTERN = re.compile(r'\]\(#([^)\s]+)\)')
+HEADING_PATTERN = re.compile(r'^ {0,3}(#{1,6})[ \t]+(.*?)(?:[ \t]+#+)?[ \t]*$', re.MULTILINE)
+# 與 template 的 conf_common.py 中 myst_heading_anchors 相同：myst 只替這個層級以內的標題產生錨點
+DEFAULT_HEADING_ANCHORS = 4
+
+# 與 myst-parser 的 default_slugify 相同
+_SLUGIFY_CLEAN = re.compile(r'[^\w\u4e00-\u9fff\- ]')
+# myst 只取標題中的文字與行內程式碼：連結只保留文字，HTML 標籤與強調符號會被略過
+_INLINE_LINK = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+_INLINE_HTML = re.compile(r'<[^>]+>')
+_EMPHASIS = re.compile(r'(?<!\w)[*_]+|[*_]+(?!\w)')
+
+
+def slugify(title: str) -> str:
+    """與 myst-parser 相同的標題錨點規則 (仿 GitHub)。"""
+    return _SLUGIFY_CLEAN.sub('', title.lower().replace(' ', '-'))
+
+
+def heading_text(title: str) -> str:
+    """取出 myst 用來產生錨點的標題文字。"""
+    title = _INLINE_LINK.sub(r'\1', title)
+    title = _INLINE_HTML.sub('', title)
+    title = _EMPHASIS.sub('', title)
+    return title.replace('`', '')
+
+
+@dataclass
+class DanglingLink:
+    """指向不存在的頁面或錨點的連結。"""
+    source: str  # 連結所在的頁面
+    line: int
+    target: str  # 目標頁面
+    anchor: str
+    reason: str  # 'page' 或 'anchor'
+
+    def __str__(self) -> str:
+        target = f"{self.target}#{self.anchor}" if self.anchor else self.target
+        return f"{self.source}.md:{self.line}: link to {target}: {self.reason} not found"
+
+
+@dataclass
+class LinkIndex:
+    """
+    整個文件集的頁面與錨點索引。
+
+    pages 為頁面名稱 (不含 `.md`) 對應其所有錨點，
+    links 為每個頁面中的連結 (行號, 目標頁面, 錨點)，同一頁面內的連結目標即為自己。
+
+    錨點與 myst 解析連結時相同，只有 heading_anchors (即 myst_heading_anchors) 層級以內的標題錨點；
+    `<a name>` 雖會原樣輸出，myst 仍無法解析指向它的連結 (myst.xref_missing)，因此不列入。
+    """
+    pages: dict[str, set[str]] = field(default_factory=dict)
+    links: dict[str, list[tuple[int, str, str]]] = field(default_factory=dict)
+    heading_anchors: int = DEFAULT_HEADING_ANCHORS
+
+    def add(self, page: str, content: str | Iterable[str]) -> None:
+        """
+        掃描一份文件 (只掃描一次)，記錄其錨點與連結；程式碼區塊內的內容會被略過。
+        content 可為整份文件，或逐行的 iterable (例如開啟的檔案)。
+        """
+        anchors = self.pages.setdefault(page, set())
+        links = self.links.setdefault(page, [])
+        slugs = set()
+        line = 1
+        segments = scan(content) if isinstance(content, str) else iter_segments(content, STREAM_PROSE_LIMIT)
+        for segment in segments:
+            text = segment.render()
+            if isinstance(segment, Prose):
+                for match in HEADING_PATTERN.finditer(text):
+                    if len(match.group(1)) > self.heading_anchors:
+                        continue
+                    # 重複的標題與 myst 的 compute_unique_slug 相同，依序接上 -1、-2 ... (例如 a-1、a-1-2)
+                    slug = slugify(heading_text(match.group(2)))
+                    count = 1
+                    while slug in slugs:
+                        slug = f"{slug}-{count}"
+                        count += 1
+                    slugs.add(slug)
+                # 與 link_handler 轉換的連結相同 (group 1、2 為含錨點的連結，group 3 為一般的連結)
+                for match in LINK_PATTERN.finditer(text):
+                    target = match.group(3) or match.group(1)
+                    links.append((line + text.count('\n', 0, match.start()), target, match.group(2) or ''))
+                for match in LOCAL_LINK_PATTERN.finditer(text):
+                    links.append((line + text.count('\n', 0, match.start()), page, match.group(1)))
+            line += text.count('\n')
+        anchors.update(slugs)
+        links.sort()
+
+    def check(self, target: str, anchor: str = '') -> str | None:
+        """檢查一個連結，回傳 None (存在)、'page' 或 'anchor' (不存在的部分)。"""
+        anchors = self.pages.get(target)
+        if anchors is None:
+            return 'page'
+        if anchor and anchor not in anchors:
+            return 'anchor'
+        return None
+
+    def dangling(self, pages=None) -> list[DanglingLink]:
+        """回傳指定頁面 (預設為全部) 中所有失效的連結，依頁面與行號排序。"""
+        results = []
+        for page in sorted(self.links if pages is None else pages):
+            for line, target, anchor in self.links.get(page, ()):
+                reason = self.check(target, anchor)
+                if reason is not None:
+                    results.append(DanglingLink(page, line, target, anchor, reason))
+        return results
+
+    @property
+    def link_count(self) -> int:
+        return sum(len(links) for links in self.links.values())
+
+
+def build_link_index(documents: dict[str, str], heading_anchors: int = DEFAULT_HEADING_ANCHORS) -> LinkIndex:
+    """以頁面名稱對應文件內容建立索引。"""
+    index = LinkIndex(heading_anchors=heading_anchors)
+    for page, content in documents.items():
+        index.add(page, content)
+    return index
@@ -0,0 +1,115 @@
+import filecmp
+import hashlib
+import json
+import os
+
+# 清單檔存放於輸出目錄，記錄每個來源檔的雜湊與對應的輸出
+MANIFEST_FILENAME = '.preprocess-manifest.json'
+MANIFEST_VERSION = 1
+# Sphinx 擴充套件 preprocess 複製到文件目錄的原始 Markdown (檔名 → 內容雜湊)
+STAGED_FILENAME = '.preprocess-staged.json'
+
+
+def file_digest(path: str) -> str:
+    """計算檔案內容的 SHA-256。"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_digest(content: str) -> str:
+    """計算文字內容 (UTF-8) 的 SHA-256。"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def build_fingerprint(pipeline_version: str, config: dict) -> str:
+    """將處理器版本與相關設定組成清單的指紋，任一項改變都會使整份清單失效。"""
+    payload = json.dumps({'pipeline': pipeline_version, 'config': config}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _read_manifest(output_dir: str) -> dict:
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def load_manifest(output_dir: str, fingerprint: str) -> dict[str, dict]:
+    """讀取清單，若不存在、格式不符或指紋不同則回傳空的清單。"""
+    manifest = _read_manifest(output_dir)
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('fingerprint') != fingerprint:
+        return {}
+    return manifest.get('files', {})
+
+
+def manifest_files(output_dir: str) -> set[str]:
+    """
+    清單記錄的所有輸出檔名，不論指紋是否相同：處理器版本或設定改變 (或 --force) 時清單雖然失效，
+    其中已刪除來源的輸出檔仍需移除。
+    """
+    files = _read_manifest(output_dir).get('files')
+    return set(files) if isinstance(files, dict) else set()
+
+
+def save_manifest(output_dir: str, fingerprint: str, files: dict[str, dict]) -> None:
+    """寫入清單，先寫暫存檔再改名以免中斷時留下損毀的清單。"""
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    temp_path = f"{path}.{os.getpid()}.part"
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'fingerprint': fingerprint,
+        'files': dict(sorted(files.items())),
+    }
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    os.replace(temp_path, path)
+
+
+def load_staged(srcdir: str) -> dict[str, str]:
+    """讀取文件目錄中由 Sphinx 擴充套件複製的原始 Markdown 紀錄，不存在或格式不符時回傳空的紀錄。"""
+    try:
+        with open(os.path.join(srcdir, STAGED_FILENAME), 'r', encoding='utf-8') as f:
+            staged = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return staged if isinstance(staged, dict) else {}
+
+
+def save_staged(srcdir: str, files: dict[str, str]) -> None:
+    path = os.path.join(srcdir, STAGED_FILENAME)
+    temp_path = f"{path}.{os.getpid()}.part"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(sorted(files.items())), f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    os.replace(temp_path, path)
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """只在內容實際改變時寫入檔案，保留未變更檔案的 mtime。回傳是否有寫入。"""
+    data = content.encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def replace_if_changed(temp_path: str, path: str) -> bool:
+    """以暫存檔取代檔案，內容相同時刪除暫存檔並保留原檔的 mtime (逐塊比較，不需讀入整個檔案)。回傳是否有取代。"""
+    if os.path.isfile(path) and filecmp.cmp(temp_path, path, shallow=False):
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, path)
+    return True
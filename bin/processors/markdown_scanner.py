@@ -0,0 +1,120 @@
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Union
+
+# 程式碼區塊的開頭與結尾：允許任意縮排 (與 tab_handler 過去的 `^\s*` 行為一致)
+_FENCE_OPEN = re.compile(r'[ \t]*(`{3,}|~{3,})')
+_FENCE_CLOSE = re.compile(r'[ \t]*(`{3,}|~{3,})[ \t]*\n?\Z')
+
+# 串流處理 (逐行讀入) 時一般文字片段的大約上限 (字元數)，超過後在下一個段落結尾切分，見 `iter_segments`
+STREAM_PROSE_LIMIT = 64 * 1024
+
+
+@dataclass
+class Prose:
+    """程式碼區塊以外的一般 Markdown 文字。"""
+    text: str
+
+    def render(self) -> str:
+        return self.text
+
+
+@dataclass
+class Fence:
+    """以 ``` 或 ~~~ 圍起來的程式碼區塊。"""
+    indent: str
+    marker: str
+    info: str
+    newline: str
+    body: str
+    closing: str  # 未閉合的區塊為空字串
+    prefix: str = ''  # 輸出時放在區塊前的文字，例如 tab 標題
+
+    @property
+    def language(self) -> str:
+        parts = self.info.split(None, 1)
+        return parts[0] if parts else ''
+
+    def render(self) -> str:
+        return f"{self.prefix}{self.indent}{self.marker}{self.info}{self.newline}{self.body}{self.closing}"
+
+
+Segment = Union[Prose, Fence]
+
+
+def iter_lines(content: str) -> Iterator[str]:
+    """依 `\\n` 切行並保留換行字元。"""
+    start = 0
+    length = len(content)
+    while start < length:
+        end = content.find('\n', start)
+        if end == -1:
+            yield content[start:]
+            return
+        yield content[start:end + 1]
+        start = end + 1
+
+
+def iter_segments(lines: Iterable[str], prose_limit: int | None = None) -> Iterator[Segment]:
+    """
+    將逐行輸入切成 Prose 與 Fence 片段，整份文件只掃描一次。
+
+    提供 prose_limit 時，累積超過 prose_limit 個字元的一般文字會在下一個空行 (段落結尾) 先產生一個 Prose，
+    因此沒有程式碼區塊的長文件也不會整份留在記憶體中；Markdown 的行內語法 (連結、圖片) 不會跨越空行，
+    處理器的結果與不切分時相同。
+    """
+    prose: list[str] = []
+    prose_size = 0
+    fence = None
+    body: list[str] = []
+
+    for line in lines:
+        if fence is None:
+            match = _FENCE_OPEN.match(line)
+            if match:
+                marker = match.group(1)
+                info = line[match.end():]
+                newline = '\n' if info.endswith('\n') else ''
+                info = info[:len(info) - len(newline)]
+                # 反引號區塊的 info 不可包含反引號，否則視為行內程式碼
+                if not (marker[0] == '`' and '`' in info):
+                    if prose:
+                        yield Prose(''.join(prose))
+                        prose = []
+                        prose_size = 0
+                    fence = Fence(line[:match.start(1)], marker, info, newline, '', '')
+                    continue
+            prose.append(line)
+            if prose_limit is not None:
+                prose_size += len(line)
+                if prose_size >= prose_limit and not line.strip():
+                    yield Prose(''.join(prose))
+                    prose = []
+                    prose_size = 0
+        else:
+            match = _FENCE_CLOSE.match(line)
+            if match and match.group(1)[0] == fence.marker[0] and len(match.group(1)) >= len(fence.marker):
+                fence.body = ''.join(body)
+                fence.closing = line
+                yield fence
+                fence = None
+                body = []
+            else:
+                body.append(line)
+
+    if fence is not None:
+        # 未閉合的區塊延伸到文件結尾
+        fence.body = ''.join(body)
+        yield fence
+    elif prose:
+        yield Prose(''.join(prose))
+
+
+def scan(content: str) -> list[Segment]:
+    """將整份文件切成片段清單。"""
+    return list(iter_segments(iter_lines(content)))
+
+
+def render(segments: Iterable[Segment]) -> str:
+    """將片段組回文件內容。"""
+    return ''.join(segment.render() for segment in segments)
@@ -1,13 +1,20 @@
-import re
+from .markdown_scanner import Fence, scan, render
 
-def process_php_tags(content: str) -> str:
-    """處理 PHP 程式碼區塊標籤，確保 `<?php` 存在。"""
-    def ensure_php_tag(match: re.Match) -> str:
-        code_block_content = match.group(1)
-        if '<?php' not in code_block_content:
-            cleaned_content = code_block_content.lstrip()
-            return f"```php-line\n{cleaned_content}```"
-        return match.group(0)
 
-    return re.sub(r"```php(.*?)```", ensure_php_tag, content, flags=re.DOTALL)
+def convert_php_fence(fence: Fence) -> None:
+    """php 程式碼區塊若缺少 `<?php`，改標示為 `php-line`。"""
+    if fence.language != 'php':
+        return
+
+    if '<?php' not in fence.body:
+        fence.info = fence.info.replace('php', 'php-line', 1)
+        fence.body = fence.body.lstrip()
 
+
+def process_php_tags(content: str) -> str:
+    """處理 PHP 程式碼區塊標籤，確保 `<?php` 存在。"""
+    segments = scan(content)
+    for segment in segments:
+        if isinstance(segment, Fence):
+            convert_php_fence(segment)
+    return render(segments)
@@ -0,0 +1,203 @@
+import hashlib
+import os
+import time
+from collections import Counter
+from functools import partial
+from typing import Iterable, Iterator
+
+from .markdown_scanner import STREAM_PROSE_LIMIT, Fence, Prose, Segment, iter_segments, scan, render
+from .image_handler import find_image_urls, is_remote_image, fetch_images, rewrite_images
+from .link_handler import process_links
+from .diff_handler import convert_diff_fence
+from .php_tag_handler import convert_php_fence
+from .tab_handler import convert_tab_fence
+from .timing import handler_name, record
+
+# 一般文字片段的處理器 (圖片由 run_pipeline 另外處理，因為需要先下載)
+PROSE_HANDLERS = (
+    process_links,
+)
+
+# 程式碼區塊的處理器，依序修改同一個 Fence
+FENCE_HANDLERS = (
+    convert_diff_fence,
+    convert_php_fence,
+    convert_tab_fence,
+)
+
+# 處理器鏈實際執行的模組 (依名稱排序)，決定輸出內容；epub_validator、job_graph、build_stamp、timing 等
+# 其他模組不影響輸出，修改它們不會使預處理的結果失效
+PIPELINE_MODULES = (
+    'diff_handler',
+    'image_cache',
+    'image_handler',
+    'link_handler',
+    'markdown_scanner',
+    'php_tag_handler',
+    'pipeline',
+    'tab_handler',
+)
+
+
+def prose_handlers(replacements: dict[str, str]) -> tuple:
+    """
+    一般文字片段依序套用的處理器：先以 replacements 改寫圖片 (已綁定對照表)，再套用 `PROSE_HANDLERS`。
+    每個處理器都只接受並回傳文字。
+    """
+    return (partial(rewrite_images, replacements=replacements), *PROSE_HANDLERS)
+
+
+def run_pipeline(content: str, image_output_dir: str, replacements: dict[str, str] | None = None,
+                 stats: dict[str, dict] | None = None) -> str:
+    """
+    將文件切成片段後，只把各處理器關心的片段交給它們處理。
+
+    replacements 為預先下載好的圖片 URL 與本地路徑對照表 (見 `fetch_images`)，
+    未提供時才會在此下載本文件的圖片。
+
+    提供 stats 時，會將每個處理器的耗時與輸入 / 輸出大小累加到其中 (見 `timing.record`)；
+    計時與實際處理走同一條路徑。
+    """
+    clock = time.perf_counter
+    start = clock()
+    segments = scan(content)
+    if stats is not None:
+        size = _utf8_len(content)
+        record(stats, handler_name(scan), clock() - start, size, size)
+
+    if replacements is None:
+        start = clock()
+        img_urls = []
+        for segment in segments:
+            if isinstance(segment, Prose):
+                img_urls.extend(url for url in find_image_urls(segment.text) if is_remote_image(url))
+        replacements = fetch_images(img_urls, image_output_dir)
+        if stats is not None:
+            record(stats, handler_name(fetch_images), clock() - start, 0, 0)
+
+    handlers = prose_handlers(replacements)
+    outputs = [_process_segment(segment, handlers, stats) for segment in segments]
+
+    start = clock()
+    output = ''.join(outputs)
+    if stats is not None:
+        size = _utf8_len(output)
+        record(stats, handler_name(render), clock() - start, size, size)
+    return output
+
+
+def _utf8_len(text: str) -> int:
+    return len(text.encode('utf-8'))
+
+
+def _fence_len(fence: Fence) -> int:
+    return _utf8_len(fence.render())
+
+
+def _apply(handler, value, stats: dict[str, dict] | None, size):
+    """
+    以 value 呼叫處理器並回傳其結果；提供 stats 時記錄耗時與處理前後的大小 (size(value))。
+    程式碼區塊的處理器直接修改 Fence 而回傳 None，處理後的大小取自 value 本身。
+    """
+    if stats is None:
+        return handler(value)
+    size_in = size(value)
+    start = time.perf_counter()
+    result = handler(value)
+    elapsed = time.perf_counter() - start
+    record(stats, handler_name(handler), elapsed, size_in, size(value if result is None else result))
+    return result
+
+
+def _process_segment(segment: Segment, handlers: tuple, stats: dict[str, dict] | None = None) -> str:
+    """以對應的處理器處理一個片段 (handlers 見 `prose_handlers`)，回傳處理後的內容。"""
+    if isinstance(segment, Fence):
+        for handler in FENCE_HANDLERS:
+            _apply(handler, segment, stats, _fence_len)
+        return segment.render()
+
+    text = segment.text
+    for handler in handlers:
+        text = _apply(handler, text, stats, _utf8_len)
+    return text
+
+
+def stream_pipeline(lines: Iterable[str], replacements: dict[str, str],
+                    stats: dict[str, dict] | None = None) -> Iterator[str]:
+    """
+    與 `run_pipeline` 相同的處理，但逐行讀入 (例如開啟的檔案)、每處理完一個片段就產生其輸出，
+    不會同時持有整份文件：記憶體用量取決於最大的程式碼區塊或段落 (見 `iter_segments` 的 prose_limit)，
+    與文件大小無關。圖片需事先下載 (replacements，見 `fetch_images`)。
+
+    提供 stats 時與 `run_pipeline` 相同，記錄每個處理器的耗時與大小。
+    """
+    segments = iter_segments(lines, STREAM_PROSE_LIMIT)
+    handlers = prose_handlers(replacements)
+    if stats is None:
+        for segment in segments:
+            yield _process_segment(segment, handlers)
+        return
+
+    clock = time.perf_counter
+    scan_seconds = 0.0
+    scanned = 0
+    while True:
+        start = clock()
+        segment = next(segments, None)
+        scan_seconds += clock() - start
+        if segment is None:
+            break
+        scanned += _utf8_len(segment.render())
+        yield _process_segment(segment, handlers, stats)
+    record(stats, handler_name(scan), scan_seconds, scanned, scanned)
+
+
+def pipeline_stages(content: str, replacements: dict[str, str] | None = None):
+    """
+    依 `run_pipeline` 的順序逐一套用處理器，每套用完一個處理器就產生 (處理器名稱, 整份文件目前的內容)，
+    第一項為 ('source', 原始內容)。用於回溯輸出中的某段內容是由哪個處理器產生的。
+    """
+    segments = scan(content)
+    yield 'source', content
+    prose = [segment for segment in segments if isinstance(segment, Prose)]
+    for handler in prose_handlers(replacements or {}):
+        for segment in prose:
+            segment.text = handler(segment.text)
+        yield handler_name(handler), render(segments)
+    fences = [segment for segment in segments if isinstance(segment, Fence)]
+    for handler in FENCE_HANDLERS:
+        for segment in fences:
+            handler(segment)
+        yield handler_name(handler), render(segments)
+
+
+def fence_languages(content: str) -> Counter:
+    """
+    統計文件中各程式碼區塊語言的數量，語言為套用 `FENCE_HANDLERS` 之後的結果 (例如 `php-line`、`diff`)，
+    與 Sphinx 讀到的相同。不含沒有標示語言的區塊與 MyST 的指令 (例如 "```{note}")。
+    """
+    languages = Counter()
+    for segment in scan(content):
+        if isinstance(segment, Fence):
+            for handler in FENCE_HANDLERS:
+                handler(segment)
+            language = segment.language
+            if language and not language.startswith('{'):
+                languages[language] += 1
+    return languages
+
+
+def pipeline_files(processors_dir: str | None = None) -> list[str]:
+    """處理器鏈實際執行的模組 (`PIPELINE_MODULES`) 的原始碼路徑，預設為本模組所在的目錄。"""
+    processors_dir = processors_dir or os.path.dirname(os.path.realpath(__file__))
+    return [os.path.join(processors_dir, f"{name}.py") for name in PIPELINE_MODULES]
+
+
+def pipeline_version(processors_dir: str | None = None) -> str:
+    """以處理器鏈各模組原始碼的雜湊作為版本，修改其中任一模組都會使舊的輸出失效。"""
+    digest = hashlib.sha256()
+    for path in pipeline_files(processors_dir):
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
@@ -1,16 +1,24 @@
 import re
 
+from .markdown_scanner import Fence, scan, render
+
+_TAB_INFO = re.compile(r"(\S+)\s+tab=(.*)")
+
+
+def convert_tab_fence(fence: Fence) -> None:
+    """將 `tab=` 語法轉為粗體標題加上標準程式碼區塊。"""
+    match = _TAB_INFO.match(fence.info.lstrip())
+    if match:
+        language = match.group(1)
+        title = match.group(2).strip()
+        fence.prefix = f"{fence.indent}**{title}**\n\n"
+        fence.info = language
+
+
 def process_tabs(content: str) -> str:
     """處理程式碼區塊的 `tab=` 語法。"""
-    new_content_lines = []
-    for line in content.splitlines(keepends=True):
-        match = re.match(r"^\s*```(\w+)\s+tab=(.*)", line)
-        if match:
-            language = match.group(1)
-            title = match.group(2).strip()
-            new_content_lines.append(f"**{title}**\n\n")
-            new_content_lines.append(f"```{language}\n")
-        else:
-            new_content_lines.append(line)
-    return "".join(new_content_lines)
-
+    segments = scan(content)
+    for segment in segments:
+        if isinstance(segment, Fence):
+            convert_tab_fence(segment)
+    return render(segments)
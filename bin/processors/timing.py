@@ -0,0 +1,61 @@
+import json
+import os
+import time
+
+# 報告中列出的最慢項目數量
+DEFAULT_TOP_N = 10
+
+
+def handler_name(handler) -> str:
+    """以「模組.函式」作為處理器名稱，例如 `link_handler.process_links` (functools.partial 取其原函式)。"""
+    handler = getattr(handler, 'func', handler)
+    return f"{handler.__module__.rsplit('.', 1)[-1]}.{handler.__name__}"
+
+
+def record(stats: dict[str, dict], name: str, seconds: float, bytes_in: int, bytes_out: int) -> None:
+    """累加一次處理器呼叫的耗時與輸入 / 輸出大小。"""
+    entry = stats.get(name)
+    if entry is None:
+        entry = stats[name] = {'calls': 0, 'seconds': 0.0, 'bytes_in': 0, 'bytes_out': 0}
+    entry['calls'] += 1
+    entry['seconds'] += seconds
+    entry['bytes_in'] += bytes_in
+    entry['bytes_out'] += bytes_out
+
+
+def merge(total: dict[str, dict], stats: dict[str, dict]) -> None:
+    """將一份處理器統計累加到總計中。"""
+    for name, entry in stats.items():
+        target = total.setdefault(name, {'calls': 0, 'seconds': 0.0, 'bytes_in': 0, 'bytes_out': 0})
+        for key in target:
+            target[key] += entry[key]
+
+
+class Stopwatch:
+    """依序記錄各階段的耗時。"""
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+        self._last = now
+        return elapsed
+
+
+def slowest(items: list[dict], n: int = DEFAULT_TOP_N, key: str = 'seconds') -> list[dict]:
+    return sorted(items, key=lambda item: item[key], reverse=True)[:n]
+
+
+def write_report(path: str, report: dict) -> None:
+    """寫入 JSON 報告 (先寫暫存檔再改名)。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.part"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    os.replace(temp_path, path)
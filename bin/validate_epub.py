@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+快速檢查產生的 EPUB 結構
+
+完整的 epubcheck 需要 Java 且每個 EPUB 要執行數十秒，本程式只做最常出錯的結構檢查，通常數秒內完成：
+1. 每個 XHTML 頁面 (與 toc.ncx) 都是格式正確的 XML，頁面內沒有重複的 id。
+2. 所有內部連結、圖片與樣式的參照都指向存在的檔案與錨點 (含 chapter_split 分割出的檔案)。
+3. OPF manifest 列出的檔案都存在、被參照或打包的檔案都列於 manifest、spine 只參照 manifest 中的項目。
+
+頁面直接從 EPUB (或建置輸出目錄) 中串流讀取，以多個 process 同時檢查。
+發現問題時會回溯到 `source` 中的 Markdown 檔與行號，並指出是 Markdown 本身的問題還是哪個處理器
+(例如 `image_handler.rewrite_images`、`link_handler.process_links`、torchlight) 產生的。
+
+執行方式 (於專案根目錄)：
+
+    python3 bin/validate_epub.py [--source-dir source] [-j 0] [build/color/xxx.epub build/grayscale ...]
+
+未指定路徑時檢查 `build` 下各版本的 EPUB。有任何問題時以狀態 1 結束。
+
+本程式授權採用 MIT License
+Copyright (c) 2025 Pigo Chu
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+from processors.epub_validator import validate
+
+
+def validate_epubs(paths: list[str], source_dir: str | None, jobs: int) -> int:
+    """驗證每個 EPUB 並印出問題，回傳問題總數。"""
+    total = 0
+    for path in paths:
+        report = validate(path, source_dir, jobs)
+        for issue in report.issues:
+            print(f"  - {issue}")
+        status = f"{len(report.issues)} issues" if report.issues else "OK"
+        print(f">>> {path}: {report.pages} pages checked in {report.seconds:.2f}s, {status}")
+        total += len(report.issues)
+    return total
+
+
+def main() -> None:
+    """主函式：解析命令列參數並驗證各個 EPUB"""
+    parser = argparse.ArgumentParser(description="Fast structural validation of the XHTML inside built EPUBs")
+    parser.add_argument('paths', nargs='*',
+                        help="EPUB files or variant output directories (default: build/*/*.epub)")
+    parser.add_argument('--source-dir', default='source',
+                        help="Raw Markdown directory used to map issues back to their source (default: source)")
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help="Number of worker processes (0 = number of CPUs, default: 0)")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join('build', '*', '*.epub')))
+    if not paths:
+        print("Error: No EPUB found, build first or pass the paths to validate")
+        sys.exit(1)
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Error: '{path}' does not exist")
+            sys.exit(1)
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    if validate_epubs(paths, args.source_dir, jobs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
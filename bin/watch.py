@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+監看模式：儲存檔案後只重建有變動的頁面，並重新打包 EPUB
+
+`bin/build.sh` 每次都會清除輸出並以全新的環境建置所有頁面。本程式則常駐執行，以 inotify
+監看 `source`、`book` 的設定檔、樣板與 `_static`，檔案變動時：
+1. 若 `book/_source` 是由 `preprocess_docs.py` 產生的副本 (含清單檔)，只重新處理有變動的 Markdown
+   (依清單判斷)；使用 Sphinx 擴充套件 preprocess 時，處理器會在 Sphinx 重新讀取該頁時執行。
+2. 沿用 doctree 目錄中的環境，對每個版本做增量建置：只重新讀取、寫出有變動的頁面，再重新打包 EPUB。
+   程式碼高亮與圖片的快取同樣保留。
+
+無法使用 inotify 的系統 (非 Linux) 改為定期比對檔案的修改時間。
+修改 `sphinx_extensions` 或 `bin/processors` 後需重新啟動本程式 (模組已載入，不會重新讀取)。
+
+執行方式 (於專案根目錄)：
+
+    python3 bin/watch.py [--source-dir source] [--book-dir book] [--output-dir build] [-j auto] [color grayscale]
+
+本程式授權採用 MIT License
+Copyright (c) 2025 Pigo Chu
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from build_epub import VARIANTS, build_variant
+from preprocess_docs import convert_content
+from processors.manifest import MANIFEST_FILENAME, load_staged
+
+# 最後一次變動後等待的時間，編輯器存檔時常會連續產生多個事件 (寫入暫存檔、改名)
+DEBOUNCE_SECONDS = 0.3
+# 無法使用 inotify 時，比對修改時間的間隔
+POLL_INTERVAL_SECONDS = 1.0
+
+# inotify 事件 (見 inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+def is_ignored_name(name: str) -> bool:
+    """編輯器的暫存檔、備份檔與隱藏檔 (例如清單檔) 不觸發重建"""
+    return (name.startswith('.') or name.endswith(('~', '.swp', '.swx', '.part', '.tmp'))
+            or name == '4913' or name == '__pycache__')
+
+
+def walk_directories(root: str, ignored_dirs: set[str]):
+    """與 os.walk 相同，但略過隱藏目錄與 ignored_dirs"""
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = [name for name in subdirs
+                      if not is_ignored_name(name) and os.path.join(directory, name) not in ignored_dirs]
+        yield directory, subdirs, files
+
+
+class InotifyWatcher:
+    """
+    以 inotify (透過 ctypes 呼叫 libc) 監看多個目錄樹，新建立的子目錄會自動加入。
+    shallow 中的目錄只監看目錄本身的檔案，不包含子目錄。
+    """
+
+    def __init__(self, roots: list[str], shallow: list[str], ignored_dirs: set[str]):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.ignored_dirs = ignored_dirs
+        self.shallow = set(shallow)
+        # watch descriptor -> 目錄
+        self.directories: dict[int, str] = {}
+        self.overflowed = False
+        for root in roots:
+            self._add_tree(root)
+        for directory in shallow:
+            self._add_directory(directory)
+
+    def _add_directory(self, directory: str) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise OSError(error, 'inotify watch limit reached (fs.inotify.max_user_watches)')
+            return  # 目錄在加入前就被刪除了
+        self.directories[wd] = directory
+
+    def _add_tree(self, root: str) -> None:
+        for directory, subdirs, _files in walk_directories(root, self.ignored_dirs):
+            self._add_directory(directory)
+
+    def read(self, timeout: float | None) -> set[str]:
+        """等待最多 timeout 秒，回傳這段期間變動的檔案路徑。"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            directory = self.directories.get(wd)
+            if directory is None or not name or is_ignored_name(name):
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and directory not in self.shallow and path not in self.ignored_dirs:
+                    self._add_tree(path)
+                continue
+            changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """定期比對檔案的修改時間與大小 (無法使用 inotify 時)。"""
+
+    def __init__(self, roots: list[str], shallow: list[str], ignored_dirs: set[str]):
+        self.roots = roots
+        self.shallow = shallow
+        self.ignored_dirs = ignored_dirs
+        self.overflowed = False
+        self.snapshot = self._scan()
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        listings = [(directory, files) for root in self.roots
+                    for directory, _subdirs, files in walk_directories(root, self.ignored_dirs)]
+        listings.extend((directory, next(os.walk(directory), (None, None, []))[2]) for directory in self.shallow)
+
+        snapshot = {}
+        for directory, files in listings:
+            for name in files:
+                if is_ignored_name(name):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def read(self, timeout: float | None) -> set[str]:
+        time.sleep(POLL_INTERVAL_SECONDS if timeout is None else min(timeout, POLL_INTERVAL_SECONDS))
+        snapshot = self._scan()
+        changed = {path for path in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(path) != self.snapshot.get(path)}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(roots: list[str], shallow: list[str], ignored_dirs: set[str], polling: bool = False):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(roots, shallow, ignored_dirs)
+        except (OSError, AttributeError) as e:
+            print(f"  - inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(roots, shallow, ignored_dirs)
+
+
+def wait_for_changes(watcher) -> set[str]:
+    """等到有檔案變動，並在最後一次變動後 DEBOUNCE_SECONDS 內沒有新變動時回傳。"""
+    changed = set()
+    while not changed:
+        changed = watcher.read(None)
+    while True:
+        more = watcher.read(DEBOUNCE_SECONDS)
+        if not more:
+            return changed
+        changed |= more
+
+
+class Builder:
+    """保存各版本之間需要延續的狀態，依變動的檔案執行增量建置。"""
+
+    def __init__(self, source_dir: str, confdir: str, output_dir: str, variants: list[str], jobs: int):
+        self.source_dir = source_dir
+        self.confdir = confdir
+        self.srcdir = os.path.join(confdir, '_source')
+        self.output_dir = output_dir
+        self.doctreedir = os.path.join(output_dir, '.doctrees')
+        self.variants = variants
+        self.jobs = jobs
+        # 上一個建置完成的版本設定，下一次建置第一個版本時據此判斷能否沿用環境
+        self.config = None
+
+    @property
+    def preprocessed_copies(self) -> bool:
+        """book/_source 是否為 preprocess_docs.py 產生的副本 (而非由 Sphinx 擴充套件直接讀取 source)"""
+        return os.path.isfile(os.path.join(self.srcdir, MANIFEST_FILENAME))
+
+    def is_generated(self, path: str) -> bool:
+        """由建置本身寫入的檔案：preprocess_docs.py 產生的副本，或 Sphinx 擴充套件 preprocess 複製的原始 Markdown"""
+        if os.path.dirname(path) != self.srcdir:
+            return False
+        name = os.path.basename(path)
+        return ((self.preprocessed_copies and os.path.isfile(os.path.join(self.source_dir, name)))
+                or name in load_staged(self.srcdir))
+
+    def is_relevant(self, path: str) -> bool:
+        if self.is_generated(path):
+            return False
+        # book 目錄本身只有設定檔會影響建置
+        return os.path.dirname(path) != self.confdir or path.endswith('.py')
+
+    def reload_configuration(self) -> None:
+        # conf.py 以 import 載入 conf_common 等設定檔，移除已載入的模組才會讀到修改後的內容
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, '__file__', None) or ''
+            if os.path.dirname(os.path.abspath(path)) == self.confdir:
+                del sys.modules[name]
+
+    def build(self, changed: set[str], everything: bool = False) -> bool:
+        """
+        依變動的檔案重建所有版本，成功時回傳 True。建置失敗不會結束監看，修正後存檔即再次建置。
+        everything 為 True 時不知道哪些檔案變動 (例如 inotify 佇列溢位)，重新載入設定並重新處理 source。
+        """
+        if everything or any(os.path.dirname(path) == self.confdir and path.endswith('.py') for path in changed):
+            print("  - Reloading the configuration")
+            self.reload_configuration()
+
+        if self.preprocessed_copies and (everything or any(path.startswith(self.source_dir + os.sep)
+                                                           for path in changed)):
+            # 清單中來源雜湊未改變的檔案會直接略過，只處理有變動的 Markdown
+            convert_content(self.source_dir, self.srcdir, self.jobs)
+
+        for variant in self.variants:
+            start = time.perf_counter()
+            try:
+                app = build_variant(variant, self.srcdir, self.confdir, os.path.join(self.output_dir, variant),
+                                    self.doctreedir, self.jobs, self.config, incremental=True)
+            except Exception as e:
+                print(f"Error: Building the {variant} version failed: {e}")
+                return False
+            if app.statuscode:
+                print(f"Error: Building the {variant} version failed")
+                return False
+            self.config = app.config
+            print(f"  - {variant} version rebuilt in {time.perf_counter() - start:.1f}s")
+        return True
+
+
+def main() -> None:
+    """主函式：先做一次增量建置，接著監看檔案並在變動時重建"""
+    parser = argparse.ArgumentParser(description="Watch the sources and incrementally rebuild the EPUB variants")
+    parser.add_argument('variants', nargs='*', default=list(VARIANTS),
+                        help="Variants to build (default: color grayscale)")
+    parser.add_argument('--source-dir', default='source',
+                        help="Directory containing the Laravel Markdown files (default: source)")
+    parser.add_argument('--book-dir', default='book',
+                        help="Directory containing conf.py, the templates and _source (default: book)")
+    parser.add_argument('--output-dir', default='build',
+                        help="Each variant is written to <output-dir>/<variant> (default: build)")
+    parser.add_argument('-j', '--jobs', default='1',
+                        help="Number of Sphinx processes, or 'auto' for the number of CPUs (default: 1)")
+    parser.add_argument('--poll', action='store_true',
+                        help="Poll modification times instead of using inotify")
+    args = parser.parse_args()
+
+    for variant in args.variants:
+        if variant not in VARIANTS:
+            parser.error(f"unknown variant '{variant}' (choose from {', '.join(VARIANTS)})")
+
+    jobs = (os.cpu_count() or 1) if args.jobs == 'auto' else int(args.jobs)
+    source_dir = os.path.abspath(args.source_dir)
+    confdir = os.path.abspath(args.book_dir)
+    builder = Builder(source_dir, confdir, os.path.abspath(args.output_dir), list(dict.fromkeys(args.variants)), jobs)
+
+    if not os.path.isdir(builder.srcdir):
+        print(f"Error: Source directory '{builder.srcdir}' does not exist")
+        sys.exit(1)
+
+    # source 與 _source (含 _static) 的整個目錄樹、_templates，以及 book 目錄本身的設定檔
+    roots = [path for path in (source_dir, os.path.join(confdir, '_templates'), builder.srcdir)
+             if os.path.isdir(path)]
+    # 建置時下載的圖片
+    ignored_dirs = {os.path.join(builder.srcdir, '_static', 'laravel')}
+    watcher = create_watcher(roots, [confdir], ignored_dirs, args.poll)
+
+    print(">>> Initial incremental build...")
+    builder.build(set())
+    print(f">>> Watching {', '.join(roots + [confdir])} ({type(watcher).__name__}, Ctrl+C to stop)")
+
+    try:
+        while True:
+            changed = {path for path in wait_for_changes(watcher) if builder.is_relevant(path)}
+            everything = watcher.overflowed
+            if everything:
+                # 無法得知哪些檔案變動，重新載入設定並交由清單與 Sphinx 依修改時間判斷
+                print("  - Too many changes at once (inotify queue overflow)")
+                watcher.overflowed = False
+            elif not changed:
+                continue
+
+            names = sorted(os.path.relpath(path) for path in changed)
+            print(f">>> {len(changed)} files changed: {', '.join(names[:5])}{' ...' if len(names) > 5 else ''}")
+            start = time.perf_counter()
+            if builder.build(changed, everything):
+                print(f">>> EPUB refreshed in {time.perf_counter() - start:.1f}s")
+    except KeyboardInterrupt:
+        print("\n>>> Stopped watching")
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()
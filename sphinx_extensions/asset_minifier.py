@@ -0,0 +1,386 @@
+import hashlib
+import os
+import posixpath
+import re
+import zipfile
+from typing import NamedTuple
+
+from sphinx.builders._epub_base import EpubBuilder
+from sphinx.util import logging
+
+from epub_packager import DEFAULT_LEVEL, Entry, write_epub
+
+logger = logging.getLogger(__name__)
+
+# ---- CSS ----
+
+CSS_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+CSS_COMMENT = re.compile(rf'({CSS_STRING})|/\*.*?\*/', re.DOTALL)
+CSS_TOKEN = re.compile(rf'{CSS_STRING}|[{{}};]')
+CSS_STRINGS = re.compile(f'({CSS_STRING})')
+# At-rules whose block holds rules rather than declarations
+NESTED_AT_RULES = {'@media', '@supports', '@document', '@layer', '@keyframes', '@-webkit-keyframes'}
+CLASS_SELECTOR = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+ID_SELECTOR = re.compile(r'#(-?[_a-zA-Z][\w-]*)')
+ATTRIBUTE_SELECTOR = re.compile(r'\[[^\]]*\]')
+NOT_SELECTOR = re.compile(r':not\([^)]*\)')
+# Selectors matching through a list of alternatives: never pruned
+COMPLEX_SELECTOR = re.compile(r':(?:is|where|has|matches|-\w+-any)\(')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)|@import\s+([\'"])([^\'"]+)\3')
+
+# ---- XHTML ----
+
+XHTML_TOKEN = re.compile(r'<!--.*?-->|<(?:[^>"\']|"[^"]*"|\'[^\']*\')*>', re.DOTALL)
+TAG_NAME = re.compile(r'<(/?)([a-zA-Z][\w:-]*)')
+# Elements whose whitespace is significant
+PRESERVE_WHITESPACE = {'pre', 'textarea', 'script', 'style'}
+WHITESPACE_RUN = re.compile(r'[ \t\r\n]+')
+TEXT_ENTITIES = {'&#160;': '\xa0', '&#39;': "'", '&quot;': '"'}
+TEXT_ENTITY = re.compile('|'.join(TEXT_ENTITIES))
+CLASS_ATTRIBUTE = re.compile(r'\sclass="([^"]*)"')
+ID_ATTRIBUTE = re.compile(r'\sid="([^"]*)"')
+XHTML_REFERENCE = re.compile(r'(\s(?:href|src|xlink:href|poster)=")([^"#?:]+)')
+
+# ---- Package ----
+
+OPF_ITEM = re.compile(r'\s*<item\s[^>]*?href="([^"]+)"[^>]*?/>')
+OPF_ITEM_ID = re.compile(r'\sid="([^"]+)"')
+OPF_ID_REFERENCE = re.compile(r'<meta\s[^>]*content="([^"]+)"')
+OPF_GUIDE_REFERENCE = re.compile(r'<reference\s[^>]*href="([^"#]+)')
+# Assets that may be dropped when nothing references them
+REMOVABLE_EXTENSIONS = {'.css', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.otf', '.ttf', '.woff', '.woff2'}
+
+
+class UsedNames(NamedTuple):
+    classes: set[str]
+    ids: set[str]
+
+
+def _outside_strings(text: str, function) -> str:
+    """
+    Apply function to the parts of a CSS text that are not quoted strings. The parts are not
+    stripped: the space in `a[title="x"] b` or `quotes: "«" "»"` is significant.
+    """
+    parts = CSS_STRINGS.split(text)
+    return ''.join(part if index % 2 else function(part) for index, part in enumerate(parts))
+
+
+def _block_end(css: str, pos: int) -> int:
+    """Position of the '}' closing a declaration block opened before pos."""
+    while True:
+        match = CSS_TOKEN.search(css, pos)
+        if match is None:
+            return len(css)
+        if match.group(0) == '}':
+            return match.start()
+        pos = match.end()
+
+
+def parse_css(css: str, pos: int = 0) -> tuple[list, int]:
+    """
+    Parse a stylesheet (without comments) into a list of (prelude, body): body is None for
+    statements such as @import, a list for nested at-rules and the declarations otherwise.
+    """
+    items = []
+    start = pos
+    while True:
+        match = CSS_TOKEN.search(css, pos)
+        if match is None:
+            if css[start:].strip():
+                items.append((css[start:].strip(), None))
+            return items, len(css)
+        token = match.group(0)
+        if token == ';':
+            if css[start:match.start()].strip():
+                items.append((css[start:match.start()].strip(), None))
+            pos = start = match.end()
+        elif token == '{':
+            prelude = css[start:match.start()].strip()
+            if prelude.startswith('@') and prelude.split(None, 1)[0] in NESTED_AT_RULES:
+                children, pos = parse_css(css, match.end())
+                items.append((prelude, children))
+            else:
+                end = _block_end(css, match.end())
+                items.append((prelude, css[match.end():end]))
+                pos = end + 1
+            start = pos
+        elif token == '}':
+            return items, match.end()
+        else:
+            pos = match.end()
+
+
+def _split_selectors(prelude: str) -> list[str]:
+    selectors, depth, start = [], 0, 0
+    for index, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:index].strip())
+            start = index + 1
+    selectors.append(prelude[start:].strip())
+    return selectors
+
+
+def may_match(selector: str, used: UsedNames) -> bool:
+    """False when the selector needs a class or id that no page uses."""
+    if '\\' in selector or '"' in selector or "'" in selector or COMPLEX_SELECTOR.search(selector):
+        return True
+    selector = NOT_SELECTOR.sub('', ATTRIBUTE_SELECTOR.sub('', selector))
+    return (all(name in used.classes for name in CLASS_SELECTOR.findall(selector))
+            and all(name in used.ids for name in ID_SELECTOR.findall(selector)))
+
+
+def _minify_prelude(prelude: str) -> str:
+    if prelude.startswith('@'):
+        # Media queries and @supports conditions may hold calc() expressions
+        return _outside_strings(prelude, lambda text: WHITESPACE_RUN.sub(' ', text)).strip()
+    return _outside_strings(
+        prelude, lambda text: re.sub(r'\s*([,>~+])\s*', r'\1', WHITESPACE_RUN.sub(' ', text))).strip()
+
+
+def _compact_declarations(text: str) -> str:
+    text = re.sub(r'\s*([;:,])\s*', r'\1', WHITESPACE_RUN.sub(' ', text))
+    return re.sub(r'\(\s+', '(', re.sub(r'\s+\)', ')', text))
+
+
+def _minify_declarations(declarations: str) -> str:
+    return _outside_strings(declarations, _compact_declarations).strip().rstrip(';')
+
+
+def serialize_css(items: list, used: UsedNames | None) -> str:
+    """Write the parsed rules back without whitespace, dropping rules no page can match."""
+    out = []
+    for prelude, body in items:
+        if body is None:
+            out.append(_minify_prelude(prelude) + ';')
+        elif isinstance(body, list):
+            # Keyframe selectors (from, to, 50%) are not matched against the pages
+            keyframes = 'keyframes' in prelude.split(None, 1)[0]
+            inner = serialize_css(body, None if keyframes else used)
+            if inner:
+                out.append(f"{_minify_prelude(prelude)}{{{inner}}}")
+        else:
+            if used is not None and not prelude.startswith('@'):
+                selectors = [selector for selector in _split_selectors(prelude) if may_match(selector, used)]
+                if not selectors:
+                    continue
+                prelude = ','.join(selectors)
+            declarations = _minify_declarations(body)
+            if declarations:
+                out.append(f"{_minify_prelude(prelude)}{{{declarations}}}")
+    return ''.join(out)
+
+
+def minify_css(css: str, used: UsedNames | None) -> str:
+    css = CSS_COMMENT.sub(lambda match: match.group(1) or '', css)
+    return serialize_css(parse_css(css)[0], used)
+
+
+def minify_xhtml(text: str) -> str:
+    """
+    Collapse whitespace runs outside <pre> (runs containing a line break become one line break,
+    others one space, which renders the same under `white-space: normal`), drop comments and
+    write &#160;, &#39; and &quot; in text as characters. Preformatted content is kept byte for byte.
+    """
+    out = []
+    preserve = 0
+    pos = 0
+    for match in XHTML_TOKEN.finditer(text):
+        segment = text[pos:match.start()]
+        if segment:
+            if not preserve:
+                segment = WHITESPACE_RUN.sub(lambda run: '\n' if '\n' in run.group(0) else ' ', segment)
+                segment = TEXT_ENTITY.sub(lambda entity: TEXT_ENTITIES[entity.group(0)], segment)
+            out.append(segment)
+        tag = match.group(0)
+        pos = match.end()
+        if tag.startswith('<!--'):
+            if preserve:
+                out.append(tag)
+            continue
+        name = TAG_NAME.match(tag)
+        if name and name.group(2).lower() in PRESERVE_WHITESPACE and not tag.endswith('/>'):
+            preserve += -1 if name.group(1) else 1
+        out.append(tag)
+    out.append(text[pos:])
+    return ''.join(out)
+
+
+def used_names(pages) -> UsedNames:
+    used = UsedNames(set(), set())
+    for text in pages:
+        for value in CLASS_ATTRIBUTE.findall(text):
+            used.classes.update(value.split())
+        used.ids.update(ID_ATTRIBUTE.findall(text))
+    return used
+
+
+def _resolve(source: str, reference: str) -> str:
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source), reference))
+
+
+def _references(name: str, text: str) -> set[str]:
+    if name.endswith('.css'):
+        matches = [match.group(2) or match.group(4) for match in CSS_URL.finditer(text)]
+    else:
+        matches = [match.group(2) for match in XHTML_REFERENCE.finditer(text)]
+    return {_resolve(name, reference) for reference in matches if ':' not in reference}
+
+
+def _rewrite_references(name: str, text: str, renamed: dict[str, str]) -> str:
+    directory = posixpath.dirname(name)
+
+    def replace(match, group):
+        target = renamed.get(_resolve(name, match.group(group)))
+        if target is None:
+            return match.group(0)
+        start = match.start(group) - match.start()
+        end = match.end(group) - match.start()
+        new = posixpath.relpath(target, directory or '.')
+        return match.group(0)[:start] + new + match.group(0)[end:]
+
+    if name.endswith('.css'):
+        return CSS_URL.sub(lambda match: replace(match, 2 if match.group(2) else 4), text)
+    return XHTML_REFERENCE.sub(lambda match: replace(match, 2), text)
+
+
+class AssetReport(NamedTuple):
+    name: str
+    before: int
+    after: int
+    note: str = ''
+
+
+def _manifest_ids(opf_name: str, opf: str) -> dict[str, str]:
+    """Manifest item ids by file name."""
+    ids = {}
+    for match in OPF_ITEM.finditer(opf):
+        item_id = OPF_ITEM_ID.search(match.group(0))
+        if item_id:
+            ids[_resolve(opf_name, match.group(1))] = item_id.group(1)
+    return ids
+
+
+def minify_epub(path: str, prune_css: bool = True, level: int = DEFAULT_LEVEL, jobs: int = 0) -> list[AssetReport]:
+    """
+    Minify the XHTML and CSS of an EPUB, drop duplicate and unreferenced assets and repackage it
+    with epub_packager (same entry order, times and stored/deflated choice as the original).
+    """
+    with zipfile.ZipFile(path) as source:
+        infos = source.infolist()
+        data = {info.filename: source.read(info.filename) for info in infos}
+
+    opf_name = next(name for name in data if name.endswith('.opf'))
+    pages = [name for name in data if name.endswith('.xhtml')]
+    stylesheets = [name for name in data if name.endswith('.css')]
+    texts = {name: data[name].decode('utf-8') for name in pages + stylesheets + [opf_name]}
+    manifest_ids = _manifest_ids(opf_name, texts[opf_name])
+    # The cover image is referenced by its manifest id
+    referenced_ids = set(OPF_ID_REFERENCE.findall(texts[opf_name]))
+    removable = [name for name in sorted(data) if posixpath.splitext(name)[1].lower() in REMOVABLE_EXTENSIONS]
+    # File name -> the file replacing it, or None when it is dropped
+    removed: dict[str, str | None] = {}
+    notes: dict[str, str] = {}
+
+    # Identical assets: keep the first one and point the references at it
+    seen: dict[str, str] = {}
+    for name in removable:
+        digest = hashlib.sha256(data[name]).hexdigest()
+        if digest in seen and manifest_ids.get(name) not in referenced_ids:
+            removed[name] = seen[digest]
+            notes[name] = f"duplicate of {seen[digest]}"
+        else:
+            seen.setdefault(digest, name)
+    if removed:
+        for name in pages + stylesheets:
+            texts[name] = _rewrite_references(name, texts[name], removed)
+
+    for name in pages:
+        texts[name] = minify_xhtml(texts[name])
+    used = used_names(texts[name] for name in pages) if prune_css else None
+    for name in stylesheets:
+        texts[name] = minify_css(texts[name], used)
+
+    # Assets nothing refers to any more (e.g. theme images of pruned rules)
+    referenced = {_resolve(opf_name, href) for href in OPF_GUIDE_REFERENCE.findall(texts[opf_name])}
+    pending = list(pages)
+    while pending:
+        name = pending.pop()
+        for target in _references(name, texts.get(name, '')):
+            if target not in referenced:
+                referenced.add(target)
+                if target.endswith('.css'):
+                    pending.append(target)
+    for name in removable:
+        if name not in removed and name not in referenced and manifest_ids.get(name) not in referenced_ids:
+            removed[name] = None
+            notes[name] = 'unreferenced'
+
+    def drop_item(match):
+        return '' if _resolve(opf_name, match.group(1)) in removed else match.group(0)
+
+    texts[opf_name] = OPF_ITEM.sub(drop_item, texts[opf_name])
+
+    reports = []
+    entries = []
+    for info in infos:
+        name = info.filename
+        if name in removed:
+            reports.append(AssetReport(name, len(data[name]), 0, notes[name]))
+            continue
+        content = texts[name].encode('utf-8') if name in texts else data[name]
+        if len(content) != len(data[name]):
+            reports.append(AssetReport(name, len(data[name]), len(content)))
+        entries.append(Entry(name, content, info.compress_type == zipfile.ZIP_STORED, info.date_time))
+    write_epub(path, entries, level, jobs)
+    return reports
+
+
+def minify_assets(app, exception):
+    if exception is not None or not app.config.asset_minifier_enabled:
+        return
+    builder = app.builder
+    if not isinstance(builder, EpubBuilder):
+        return
+
+    path = os.path.join(builder.outdir, builder.config.epub_basename + '.epub')
+    package_before = os.path.getsize(path)
+    # Recompress with the packager's settings when it is enabled
+    packager = getattr(app.config, 'epub_packager_enabled', False)
+    reports = minify_epub(path, app.config.asset_minifier_prune_css,
+                          app.config.epub_packager_level if packager else DEFAULT_LEVEL,
+                          app.config.epub_packager_jobs if packager else 0)
+    package_after = os.path.getsize(path)
+
+    pages = [report for report in reports if report.name.endswith('.xhtml')]
+    for report in reports:
+        if report in pages:
+            continue
+        note = f" ({report.note})" if report.note else ''
+        logger.info(f"[asset_minifier] {report.name}: {report.before / 1024:.1f} KB -> "
+                    f"{report.after / 1024:.1f} KB{note}")
+    if pages:
+        before = sum(report.before for report in pages)
+        after = sum(report.after for report in pages)
+        largest = max(pages, key=lambda report: report.before - report.after)
+        logger.info(f"[asset_minifier] {len(pages)} XHTML files: {before / 1024:.1f} KB -> {after / 1024:.1f} KB "
+                    f"(most saved: {largest.name}, {largest.before / 1024:.1f} KB -> {largest.after / 1024:.1f} KB)")
+    logger.info(f"[asset_minifier] {os.path.basename(path)}: {package_before / 1024:.1f} KB -> "
+                f"{package_after / 1024:.1f} KB")
+
+
+def setup(app):
+    # Minify the packaged XHTML and CSS and drop duplicate and unreferenced assets
+    app.add_config_value('asset_minifier_enabled', False, '')
+    # Remove CSS rules whose classes or ids appear on no page
+    app.add_config_value('asset_minifier_prune_css', True, '')
+    app.connect('build-finished', minify_assets)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
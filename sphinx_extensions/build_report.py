@@ -0,0 +1,238 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sphinx.highlighting import lexers
+from sphinx.util import logging
+
+sys.path.insert(0, str(Path(__file__).parent / '..' / 'bin'))
+
+from processors.timing import DEFAULT_TOP_N, merge, slowest, write_report
+
+logger = logging.getLogger(__name__)
+
+
+class BuildReport:
+    """
+    Timings of one Sphinx build: the build phases, every document (read, resolve, write and
+    the Markdown processors) and every highlighted code block.
+
+    Parallel read and write processes are forked from the main process; they append their
+    records to a JSON Lines file of their own, which the main process merges when the build
+    finishes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Outside the output directory, which the EPUB builder packages as a whole
+        self.parts_dir = tempfile.mkdtemp(prefix='build-report-')
+        self.main_pid = os.getpid()
+        self.phases: dict[str, float] = {}
+        self.records: list[dict] = []
+        self._phase = None
+        self._phase_start = 0.0
+        self._parts_file = None
+        self._parts_pid = None
+        # docname -> start of its read (source-read) in this process
+        self.reading: dict[str, float] = {}
+        # End of the previous resolve/write step, in this process
+        self.mark = 0.0
+
+        # The report lives in the output directory: the previous one must not be packaged
+        # into the EPUB, the new one is only written after packaging
+        if os.path.exists(path):
+            os.remove(path)
+
+    def start_phase(self, phase: str | None) -> None:
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases[self._phase] = self.phases.get(self._phase, 0.0) + now - self._phase_start
+        self._phase, self._phase_start = phase, now
+        self.mark = now
+
+    def add(self, record: dict) -> None:
+        if os.getpid() == self.main_pid:
+            self.records.append(record)
+            return
+
+        if self._parts_pid != os.getpid():
+            # Freshly forked: the inherited handle (if any) belongs to the parent
+            self._parts_file = open(os.path.join(self.parts_dir, f"{os.getpid()}.jsonl"), 'a',
+                                    encoding='utf-8', buffering=1)
+            self._parts_pid = os.getpid()
+        self._parts_file.write(json.dumps(record) + '\n')
+
+    def collect(self) -> list[dict]:
+        records = list(self.records)
+        for filename in sorted(os.listdir(self.parts_dir)):
+            with open(os.path.join(self.parts_dir, filename), 'r', encoding='utf-8') as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        return records
+
+
+def _timed_highlight_block(report, builder, highlighter):
+    """Wrap PygmentsBridge.highlight_block (outside the highlight cache) to time every block."""
+    highlight_block = highlighter.highlight_block
+
+    def timed_highlight_block(source, lang, opts=None, force=False, location=None, **kwargs):
+        start = time.perf_counter()
+        hlsource = highlight_block(source, lang, opts, force, location, **kwargs)
+        seconds = time.perf_counter() - start
+        if not isinstance(source, str):
+            source = source.decode()
+        # Sphinx registers every lexer it resolves, so the lookup after the call is free
+        lexer = lexers.get(lang)
+        report.add({
+            'kind': 'block',
+            'docname': getattr(builder, 'current_docname', None),
+            'lang': lang,
+            'lexer': type(lexer).__name__ if lexer is not None else None,
+            'lines': source.count('\n') + 1,
+            'bytes_in': len(source.encode('utf-8')),
+            'bytes_out': len(hlsource.encode('utf-8')),
+            'seconds': seconds,
+        })
+        return hlsource
+
+    return timed_highlight_block
+
+
+def _timed_write_doc(report, write_doc):
+    def timed_write_doc(docname, doctree):
+        start = time.perf_counter()
+        write_doc(docname, doctree)
+        report.mark = time.perf_counter()
+        report.add({'kind': 'write', 'docname': docname, 'seconds': report.mark - start})
+
+    return timed_write_doc
+
+
+def init_build_report(app):
+    if not app.config.build_report_path:
+        return
+
+    report = BuildReport(os.path.join(app.outdir, app.config.build_report_path))
+    app.build_report = report
+    report.start_phase('init')
+
+    highlighter = getattr(app.builder, 'highlighter', None)
+    if highlighter is not None:
+        highlighter.highlight_block = _timed_highlight_block(report, app.builder, highlighter)
+    app.builder.write_doc = _timed_write_doc(report, app.builder.write_doc)
+
+    app.connect('env-before-read-docs', start_read)
+    # Before any other source-read handler, so the time includes the preprocessing
+    app.connect('source-read', start_document, priority=0)
+    app.connect('doctree-read', finish_document, priority=900)
+    app.connect('env-updated', lambda app, env: app.build_report.start_phase('consistency'))
+    app.connect('write-started', lambda app, builder: app.build_report.start_phase('write'))
+    app.connect('doctree-resolved', resolved_document, priority=900)
+    app.connect('html-collect-pages', start_finish)
+    app.connect('build-finished', write_build_report)
+
+
+def start_read(app, env, docnames):
+    app.build_report.start_phase('read')
+
+
+def start_document(app, docname, source):
+    app.build_report.reading[docname] = time.perf_counter()
+
+
+def finish_document(app, doctree):
+    report = app.build_report
+    docname = app.env.docname
+    start = report.reading.pop(docname, None)
+    if start is not None:
+        report.add({'kind': 'read', 'docname': docname, 'seconds': time.perf_counter() - start})
+
+
+def resolved_document(app, doctree, docname):
+    # Resolving happens in the main process, one document after the other
+    report = app.build_report
+    now = time.perf_counter()
+    report.add({'kind': 'resolve', 'docname': docname, 'seconds': now - report.mark})
+    report.mark = now
+
+
+def start_finish(app):
+    app.build_report.start_phase('finish')
+    return []
+
+
+def _summarize(records: list[dict]) -> tuple[dict, list[dict], dict]:
+    documents: dict[str, dict] = {}
+    blocks = []
+    processors: dict[str, dict] = {}
+    for record in records:
+        kind = record['kind']
+        if kind == 'block':
+            blocks.append(record)
+            continue
+        document = documents.setdefault(record['docname'], {'docname': record['docname'], 'seconds': 0.0})
+        if kind == 'processors':
+            document['processors'] = record['processors']
+            merge(processors, record['processors'])
+        else:
+            document[kind] = document.get(kind, 0.0) + record['seconds']
+            document['seconds'] += record['seconds']
+    return documents, blocks, processors
+
+
+def write_build_report(app, exception):
+    report = app.build_report
+    report.start_phase(None)
+    if exception is not None:
+        shutil.rmtree(report.parts_dir, ignore_errors=True)
+        return
+
+    documents, blocks, processors = _summarize(report.collect())
+    for block in blocks:
+        document = documents.get(block['docname'])
+        if document is not None:
+            document['blocks'] = document.get('blocks', 0) + 1
+            document['highlight'] = document.get('highlight', 0.0) + block['seconds']
+
+    write_report(report.path, {
+        'builder': app.builder.name,
+        'project': app.config.project,
+        'parallel': app.parallel,
+        'phases': report.phases,
+        'totals': {
+            kind: sum(document.get(kind, 0.0) for document in documents.values())
+            for kind in ('read', 'resolve', 'write', 'highlight')
+        },
+        'processors': processors,
+        'documents': sorted(documents.values(), key=lambda document: document['docname']),
+        'blocks': blocks,
+    })
+
+    logger.info(f"[build_report] Timing report written to {report.path}")
+    logger.info("[build_report] Phases: " + ', '.join(f"{phase} {seconds:.2f}s"
+                                                     for phase, seconds in report.phases.items()))
+    logger.info(f"[build_report] Slowest {DEFAULT_TOP_N} documents:")
+    for document in slowest(list(documents.values())):
+        logger.info(f"  {document['docname']:<40} {document['seconds'] * 1000:10.1f} ms")
+    logger.info(f"[build_report] Slowest {DEFAULT_TOP_N} code blocks:")
+    for block in slowest(blocks):
+        logger.info(f"  {block['docname'] or '-':<32} {block['lang']:<10} {block['lines']:5d} lines "
+                    f"{block['seconds'] * 1000:10.2f} ms")
+
+
+def setup(app):
+    # Path of the JSON timing report, relative to the output directory (None disables the
+    # report; no handler is connected then)
+    app.add_config_value('build_report_path', None, '')
+    # After torchlight installed the highlight cache, so that cached blocks are timed as well
+    app.connect('builder-inited', init_build_report, priority=900)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
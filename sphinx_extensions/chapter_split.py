@@ -0,0 +1,375 @@
+import hashlib
+import json
+import os
+import posixpath
+import re
+from typing import NamedTuple
+
+from sphinx.builders._epub_base import EpubBuilder
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when the way documents are split changes, so split outputs are regenerated
+SPLIT_VERSION = '2'
+
+BODY_START = re.compile(r'<div class="body" role="main">')
+# Start and end tags (attribute values may contain '>') and comments
+TAG = re.compile(r'<(/?)([a-zA-Z][\w:.-]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*?)(/?)>|<!--.*?-->', re.DOTALL)
+HEADING = re.compile(r'\s*<h([1-6])[\s>]')
+ID = re.compile(r'\s(?:id|name)="([^"]+)"')
+# Relative links with a fragment, e.g. `href="mix.xhtml#sec-2"` or `href="#introduction"`
+HREF = re.compile(r'(\shref=")([^"#:]*)#([^"]*)"')
+# Laravel's `<a name>` anchors are placed just before the heading they belong to, inside the
+# previous section: they move to the file that starts with that heading
+TRAILING_ANCHORS = re.compile(r'(?:<p><a name="[^"]*"></a></p>\s*)+((?:</section>\s*)*)$')
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source',
+                 'track', 'wbr'}
+
+
+class SplitPoint(NamedTuple):
+    position: int
+    # (name, start tag) of the elements still open at this position, outermost first
+    stack: tuple[tuple[str, str], ...]
+
+
+def _scan(text: str, start: int, level: int) -> tuple[int, list[SplitPoint]]:
+    """
+    Return the end of the body content starting at `start` and the sections (with a heading of
+    level 2 to `level`) a new file can start at.
+    """
+    stack: list[tuple[str, str]] = []
+    points = []
+    for match in TAG.finditer(text, start):
+        closing, name, _attributes, self_closing = match.groups()
+        if name is None or self_closing:
+            continue
+        name = name.lower()
+        if closing:
+            if not stack and name == 'div':
+                return match.start(), points
+            for index in range(len(stack) - 1, -1, -1):
+                if stack[index][0] == name:
+                    del stack[index:]
+                    break
+            continue
+        if name in VOID_ELEMENTS:
+            continue
+        if name == 'section':
+            heading = HEADING.match(text, match.end())
+            if heading and 1 < int(heading.group(1)) <= level:
+                points.append(SplitPoint(match.start(), tuple(stack)))
+        stack.append((name, match.group(0)))
+    return len(text), points
+
+
+def _part(text: str, position: int, opened: str, point: SplitPoint | None, end: int) -> tuple[str, str]:
+    """
+    Return the body of the file starting at `position` and ending before `point` (at the end of
+    the body when None), and what the next file starts with.
+    """
+    if point is None:
+        return opened + text[position:end], ''
+    trailing = TRAILING_ANCHORS.search(text, position, point.position)
+    if trailing:
+        content = text[position:trailing.start()] + trailing.group(1)
+        moved = text[trailing.start():trailing.start(1)]
+    else:
+        content, moved = text[position:point.position], ''
+    closing = ''.join(f'</{name}>' for name, _tag in reversed(point.stack))
+    return opened + content + closing, ''.join(ID.sub('', tag) for _name, tag in point.stack) + moved
+
+
+def _choose(text: str, points: list[SplitPoint], start: int, end: int, max_bytes: int | None) -> list[SplitPoint]:
+    """
+    Without a budget split at every point, otherwise pack sections greedily into files. The
+    budget covers the whole file in UTF-8: the head and tail every file repeats included.
+    """
+    if not max_bytes:
+        return points
+    if len(text.encode('utf-8')) <= max_bytes:
+        return []
+    budget = max_bytes - len((text[:start] + text[end:]).encode('utf-8'))
+    chosen = []
+    position, opened, last = start, '', None
+    for point in [*points, None]:
+        body, _next = _part(text, position, opened, point, end)
+        if len(body.encode('utf-8')) > budget and last is not None:
+            chosen.append(last)
+            _body, opened = _part(text, position, opened, last, end)
+            position = last.position
+        last = point
+    return chosen
+
+
+def split_xhtml(text: str, level: int, max_bytes: int | None) -> list[tuple[str, list[str]]]:
+    """
+    Split a page written by the EPUB builder before its sections, returning the text of every
+    file and the ids defined in it. Every file keeps the page's head and the elements around
+    the body content; the sections the split happens in are reopened without their ids.
+    """
+    body = BODY_START.search(text)
+    if body is None:
+        return [(text, [])]
+    start = body.end()
+    end, points = _scan(text, start, level)
+    points = _choose(text, points, start, end, max_bytes)
+    if not points:
+        return [(text, [])]
+
+    head, tail = text[:start], text[end:]
+    parts = []
+    position, opened = start, ''
+    for point in [*points, None]:
+        content, next_opened = _part(text, position, opened, point, end)
+        parts.append((head + content + tail, ID.findall(content)))
+        if point is not None:
+            position, opened = point.position, next_opened
+    return parts
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _remove(outdir: str, filenames) -> None:
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(outdir, filename))
+        except FileNotFoundError:
+            pass
+
+
+class ChapterSplitter:
+    """
+    Splits the pages of an EPUB build into several files (spine items) after they are written
+    and before they are packaged, then points the links and the table of contents at the file
+    each anchor ended up in.
+
+    Split pages are recorded in the doctree directory: a page Sphinx did not write again keeps
+    its files, so links into it can still be resolved in incremental builds.
+    """
+
+    def __init__(self, builder, settings: dict, state_path: str, documents: dict[str, dict]):
+        self.builder = builder
+        self.settings = settings
+        self.state_path = state_path
+        # docname -> {'parts': [filename, ...], 'ids': {id: part index}, 'sizes': [...], 'digest': ...}
+        self.documents = documents
+        self.owners: dict[str, str] = {}
+        # Final size of every written page, grouped by document: docname -> {filename: bytes}
+        self.sizes: dict[str, dict[str, int]] = {}
+
+    def split_documents(self) -> None:
+        builder = self.builder
+        outdir, suffix = str(builder.outdir), builder.out_suffix
+        found_docs = builder.env.found_docs
+        for docname in [docname for docname in self.documents if docname not in found_docs]:
+            _remove(outdir, self.documents.pop(docname)['parts'])
+
+        for docname in sorted(found_docs):
+            filename = docname + suffix
+            path = os.path.join(outdir, filename)
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            entry = self.documents.get(docname)
+            if entry is not None:
+                if entry['digest'] == _digest(text):
+                    continue
+                # Written again by Sphinx: the previous files are stale
+                _remove(outdir, entry['parts'][1:])
+                del self.documents[docname]
+
+            parts = split_xhtml(text, self.settings['level'], self.settings['max_bytes'])
+            if len(parts) == 1:
+                continue
+            filenames = [filename] + [f"{docname}-part{number}{suffix}" for number in range(2, len(parts) + 1)]
+            clashes = [name for name in filenames[1:] if name[:-len(suffix)] in found_docs]
+            if clashes:
+                logger.warning(f"[chapter_split] Cannot split {docname}: {clashes[0]} is a document",
+                               type='chapter_split')
+                continue
+
+            sizes = []
+            for name, (part, _ids) in zip(filenames, parts):
+                data = part.encode('utf-8')
+                sizes.append(len(data))
+                with open(os.path.join(outdir, name), 'wb') as f:
+                    f.write(data)
+            self.documents[docname] = {
+                'parts': filenames,
+                'ids': {id: index for index, (_part, ids) in enumerate(parts) if index for id in ids},
+                'sizes': sizes,
+                'digest': None,
+            }
+            logger.info(f"[chapter_split] {docname}: {len(text.encode('utf-8')) / 1024:.1f} KB -> "
+                        f"{len(parts)} files, largest {max(sizes) / 1024:.1f} KB")
+
+        self.owners = {name: docname for docname, entry in self.documents.items() for name in entry['parts']}
+        self.rewrite_links()
+        self.save()
+        self.report()
+
+    def _resolve(self, source: str, match) -> str:
+        prefix, target, fragment = match.groups()
+        directory = posixpath.dirname(source)
+        target_file = posixpath.normpath(posixpath.join(directory, target)) if target else source
+        docname = self.owners.get(target_file)
+        if docname is None:
+            return match.group(0)
+        entry = self.documents[docname]
+        part = entry['parts'][entry['ids'].get(fragment, 0)]
+        href = '' if part == source else posixpath.relpath(part, directory or '.')
+        return f'{prefix}{href}#{fragment}"'
+
+    def rewrite_links(self) -> None:
+        """
+        Point every link with a fragment into a split page at the file defining the anchor, and
+        record the final size of every page.
+        """
+        outdir, suffix = str(self.builder.outdir), self.builder.out_suffix
+        self.sizes = {}
+        for root, dirs, files in os.walk(outdir):
+            dirs.sort()
+            for name in sorted(files):
+                source = os.path.relpath(os.path.join(root, name), outdir).replace(os.sep, '/')
+                # nav.xhtml is written afterwards, from the table of contents
+                if not name.endswith(suffix) or source == 'nav.xhtml':
+                    continue
+                path = os.path.join(root, name)
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                rewritten = HREF.sub(lambda match: self._resolve(source, match), text)
+                if rewritten != text:
+                    with open(path, 'w', encoding='utf-8') as f:
+                        f.write(rewritten)
+                docname = self.owners.get(source)
+                size = len(rewritten.encode('utf-8'))
+                self.sizes.setdefault(docname or source[:-len(suffix)], {})[source] = size
+                if docname is not None:
+                    entry = self.documents[docname]
+                    entry['sizes'][entry['parts'].index(source)] = size
+                    if entry['parts'][0] == source:
+                        entry['digest'] = _digest(rewritten)
+
+    def update_refnodes(self, refnodes: list[dict]) -> None:
+        """
+        Point table of contents entries at the file defining their anchor and add the split
+        files after their page. The added entries have no text: the EPUB builder puts them in
+        the spine (reading order) but leaves them out of toc.ncx and nav.xhtml.
+        """
+        result = []
+        for refnode in refnodes:
+            target, _, fragment = refnode['refuri'].partition('#')
+            docname = self.owners.get(target)
+            if docname is None:
+                result.append(refnode)
+                continue
+            entry = self.documents[docname]
+            if fragment:
+                refnode['refuri'] = f"{entry['parts'][entry['ids'].get(fragment, 0)]}#{fragment}"
+                result.append(refnode)
+            else:
+                result.append(refnode)
+                result.extend({'level': refnode['level'], 'refuri': name, 'text': ''}
+                              for name in entry['parts'][1:])
+        refnodes[:] = result
+
+    def largest_parts(self) -> dict[str, tuple[str, int]]:
+        """The largest file of every document: docname -> (filename, bytes)."""
+        return {docname: max(files.items(), key=lambda item: (item[1], item[0]))
+                for docname, files in sorted(self.sizes.items())}
+
+    def report(self) -> None:
+        largest_parts = self.largest_parts()
+        if not largest_parts:
+            return
+        for docname, (name, size) in largest_parts.items():
+            logger.verbose(f"[chapter_split] {docname}: {len(self.sizes[docname])} files, "
+                           f"largest {size / 1024:.1f} KB ({name})")
+        name, size = max(largest_parts.values(), key=lambda item: (item[1], item[0]))
+        split_files = sum(len(entry['parts']) for entry in self.documents.values())
+        pages = sum(len(files) for files in self.sizes.values())
+        logger.info(f"[chapter_split] {len(self.documents)} documents split into {split_files} files; "
+                    f"largest of {pages} pages {size / 1024:.1f} KB ({name})")
+
+    def save(self) -> None:
+        temp_path = f"{self.state_path}.{os.getpid()}.part"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'settings': self.settings, 'documents': self.documents}, f)
+        os.replace(temp_path, self.state_path)
+
+
+def _settings(config) -> dict | None:
+    if not config.chapter_split_enabled:
+        return None
+    return {
+        'version': SPLIT_VERSION,
+        'level': config.chapter_split_level,
+        'max_bytes': config.chapter_split_max_bytes,
+    }
+
+
+def _load_state(path: str) -> dict | None:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def init_chapter_split(app):
+    builder = app.builder
+    if not isinstance(builder, EpubBuilder):
+        return
+
+    outdir_key = hashlib.sha256(os.path.abspath(app.outdir).encode()).hexdigest()[:16]
+    state_path = os.path.join(app.doctreedir, f"chapter_split-{outdir_key}.json")
+    settings = _settings(app.config)
+    state = _load_state(state_path)
+    if state is not None and state['settings'] != settings:
+        # The first file of a split page only becomes whole again when Sphinx writes it:
+        # removing it makes Sphinx consider the document outdated
+        for docname, entry in state['documents'].items():
+            _remove(str(builder.outdir), entry['parts'])
+        os.remove(state_path)
+        state = None
+    if settings is None:
+        return
+
+    os.makedirs(app.doctreedir, exist_ok=True)
+    splitter = ChapterSplitter(builder, settings, state_path, state['documents'] if state else {})
+    app.chapter_splitter = splitter
+
+    handle_finish = builder.handle_finish
+    toc_add_files = builder.toc_add_files
+
+    def split_handle_finish():
+        splitter.split_documents()
+        handle_finish()
+
+    def split_toc_add_files(refnodes):
+        toc_add_files(refnodes)
+        splitter.update_refnodes(refnodes)
+
+    builder.handle_finish = split_handle_finish
+    builder.toc_add_files = split_toc_add_files
+
+
+def setup(app):
+    app.add_config_value('chapter_split_enabled', False, '')
+    # Sections with a heading of level 2 to this level may start a new file
+    app.add_config_value('chapter_split_level', 2, '')
+    # Size budget of a file in bytes (the whole file, with the head every file repeats): larger
+    # pages are split, packing consecutive sections into files up to the budget; None splits
+    # every page at every such section
+    app.add_config_value('chapter_split_max_bytes', 100 * 1024, '')
+    app.connect('builder-inited', init_chapter_split)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,179 @@
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from sphinx.builders._epub_base import EpubBuilder
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# zlib's default, the level the stock packager (zipfile) uses
+DEFAULT_LEVEL = 6
+# Already compressed formats: deflating them costs time and saves next to nothing
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.woff', '.woff2', '.mp3', '.mp4', '.m4a', '.zip'}
+# Entries compressed ahead of the one being written, per thread; bounds the memory held in flight
+WINDOW_PER_THREAD = 4
+# ZIP format earliest date
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+_END_OF_CENTRAL_DIRECTORY = struct.Struct('<4s4H2LH')
+_ZIP_VERSION = 20
+_UNIX = 3
+_UTF8_FLAG = 0x800
+_FILE_ATTRIBUTES = 0o100644 << 16
+
+
+class Entry(NamedTuple):
+    """
+    An archive entry: source is the content (bytes) or the path of a file read when it is packed.
+    stored forces (True) or forbids (False) storing it uncompressed; None decides from the extension.
+    """
+    name: str
+    source: bytes | str
+    stored: bool | None = None
+    date_time: tuple | None = None
+
+
+class PackageStats(NamedTuple):
+    entries: int
+    stored: int
+    size_in: int
+    size_out: int
+    seconds: float
+
+
+def is_stored(name: str) -> bool:
+    """mimetype must be stored (EPUB OCF); media are already compressed."""
+    return name == 'mimetype' or os.path.splitext(name)[1].lower() in STORED_EXTENSIONS
+
+
+def _dos_date_time(date_time: tuple) -> tuple[int, int]:
+    year, month, day, hour, minute, second = max(tuple(date_time[:6]), ZIP_EPOCH)
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def _pack(entry: Entry, level: int, date_time: tuple | None):
+    """Read and compress one entry: (data, method, crc, size, date_time). Runs in a worker thread."""
+    if isinstance(entry.source, bytes):
+        data = entry.source
+        mtime = None
+    else:
+        with open(entry.source, 'rb') as f:
+            data = f.read()
+        mtime = os.stat(entry.source).st_mtime
+    date_time = entry.date_time or date_time or time.localtime(mtime if mtime is not None else time.time())[:6]
+    crc = zlib.crc32(data)
+    stored = entry.stored if entry.stored is not None else is_stored(entry.name)
+    if entry.name == 'mimetype' or stored:
+        return data, 0, crc, len(data), date_time
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) >= len(data) and entry.stored is None:
+        # Incompressible content: storing it is smaller and cheaper to read
+        return data, 0, crc, len(data), date_time
+    return compressed, 8, crc, len(data), date_time
+
+
+def write_epub(path: str, entries, level: int = DEFAULT_LEVEL, jobs: int = 0,
+               date_time: tuple | None = None) -> PackageStats:
+    """
+    Write a ZIP (EPUB) with the entries in the given order.
+
+    Entries are read and deflated on a pool of jobs threads (0 = number of CPUs; zlib releases the
+    GIL) a bounded window ahead of the writer, which appends them to the archive as soon as their
+    turn comes. date_time applies to entries without their own, otherwise the file's mtime is used;
+    every entry gets the same Unix permissions, so identical inputs give identical archives.
+    """
+    if not 0 <= level <= 9:
+        raise ValueError(f"compression level must be between 0 and 9, got {level}")
+    start = time.perf_counter()
+    threads = jobs if jobs > 0 else (os.cpu_count() or 1)
+    central = []
+    stored = size_in = 0
+    temp_path = f"{path}.{os.getpid()}.part"
+
+    with ThreadPoolExecutor(max_workers=threads) as executor, open(temp_path, 'wb') as archive:
+        pending = deque()
+
+        def write_next():
+            nonlocal stored, size_in
+            entry, future = pending.popleft()
+            data, method, crc, size, entry_date_time = future.result()
+            name = entry.name.encode('utf-8')
+            flags = _UTF8_FLAG if not entry.name.isascii() else 0
+            if size > 0xFFFFFFFF or archive.tell() > 0xFFFFFFFF:
+                raise ValueError(f"{entry.name}: archive too large for a ZIP without ZIP64")
+            dos_time, dos_date = _dos_date_time(entry_date_time)
+            offset = archive.tell()
+            archive.write(_LOCAL_HEADER.pack(b'PK\x03\x04', _ZIP_VERSION, flags, method, dos_time, dos_date,
+                                             crc, len(data), size, len(name), 0))
+            archive.write(name)
+            archive.write(data)
+            central.append(_CENTRAL_HEADER.pack(b'PK\x01\x02', (_UNIX << 8) | _ZIP_VERSION, _ZIP_VERSION, flags,
+                                                method, dos_time, dos_date, crc, len(data), size, len(name),
+                                                0, 0, 0, 0, _FILE_ATTRIBUTES, offset) + name)
+            stored += method == 0
+            size_in += size
+
+        for entry in entries:
+            pending.append((entry, executor.submit(_pack, entry, level, date_time)))
+            if len(pending) >= threads * WINDOW_PER_THREAD:
+                write_next()
+        while pending:
+            write_next()
+
+        if len(central) > 0xFFFF:
+            raise ValueError("too many entries for a ZIP without ZIP64")
+        directory_offset = archive.tell()
+        for header in central:
+            archive.write(header)
+        archive.write(_END_OF_CENTRAL_DIRECTORY.pack(b'PK\x05\x06', 0, 0, len(central), len(central),
+                                                     archive.tell() - directory_offset, directory_offset, 0))
+    os.replace(temp_path, path)
+    return PackageStats(len(central), stored, size_in, os.path.getsize(path), time.perf_counter() - start)
+
+
+def build_date_time() -> tuple | None:
+    """Entry time of reproducible builds (SOURCE_DATE_EPOCH), otherwise None (each file's mtime)."""
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    return time.gmtime(int(epoch))[:6] if epoch else None
+
+
+def package_epub(app) -> None:
+    """Replacement of EpubBuilder.build_epub: same entries in the same order, packed by write_epub."""
+    builder = app.builder
+    outname = builder.config.epub_basename + '.epub'
+    names = ['mimetype', 'META-INF/container.xml', 'content.opf', 'toc.ncx', *builder.files]
+    entries = [Entry(name.replace(os.sep, '/'), os.path.join(builder.outdir, name)) for name in names]
+    stats = write_epub(os.path.join(builder.outdir, outname), entries, app.config.epub_packager_level,
+                       app.config.epub_packager_jobs, build_date_time())
+    logger.info(f"[epub_packager] {outname}: {stats.entries} files ({stats.stored} stored), "
+                f"{stats.size_in / 1024:.1f} KB -> {stats.size_out / 1024:.1f} KB in {stats.seconds:.2f}s")
+
+
+def init_epub_packager(app):
+    if not app.config.epub_packager_enabled or not isinstance(app.builder, EpubBuilder):
+        return
+    app.builder.build_epub = lambda: package_epub(app)
+
+
+def setup(app):
+    # Package the EPUB with write_epub instead of the builder's serial zipfile packager
+    app.add_config_value('epub_packager_enabled', False, '')
+    # Deflate level of text entries (0-9)
+    app.add_config_value('epub_packager_level', DEFAULT_LEVEL, '')
+    # Compression threads, 0 for the number of CPUs
+    app.add_config_value('epub_packager_jobs', 0, '')
+    app.connect('builder-inited', init_epub_packager)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,239 @@
+import hashlib
+import html
+import os
+import re
+import shutil
+from typing import NamedTuple
+
+from sphinx.builders._epub_base import EpubBuilder
+from sphinx.util import logging
+
+try:
+    from fontTools import subset
+except ImportError:  # fontTools is optional, the stage is skipped without it
+    subset = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the subsetting options change so cached subsets are regenerated
+SUBSETTER_VERSION = '1'
+
+# Stylesheet with the @font-face rules, linked after the user's stylesheets (priority 800)
+CSS_FILENAME = 'fonts.css'
+CSS_PRIORITY = 900
+# Directory of the subsets, under _static in the output directory
+FONT_DIR = 'fonts'
+
+# Always kept: line numbers, list counters and other text generated by CSS
+ASCII_TEXT = ''.join(chr(code) for code in range(0x20, 0x7F))
+
+BODY = re.compile(r'<body\b[^>]*>(.*)</body>', re.DOTALL)
+TAG = re.compile(r'<!--.*?-->|<[^>]*>', re.DOTALL)
+ELEMENT_NAME = re.compile(r'[a-zA-Z][\w-]*$')
+
+
+class EmbeddedFont(NamedTuple):
+    """A configured font: the subset covers the text of the elements (None for the whole body)."""
+    family: str
+    path: str
+    index: int
+    selector: str
+    fallback: str
+    elements: frozenset[str] | None
+
+
+def _fonts(app) -> list[EmbeddedFont]:
+    fonts = []
+    for font in app.config.font_subsetter_fonts:
+        path = os.path.abspath(os.path.join(app.confdir, font['path']))
+        if not os.path.isfile(path):
+            logger.warning(f"[font_subsetter] Font {path} does not exist, skipped")
+            continue
+        selector = font.get('selector', 'body')
+        names = [name.strip().lower() for name in selector.split(',')]
+        # Only element selectors can be matched while scanning the pages; any other
+        # selector (or body) takes every character of the book
+        if all(ELEMENT_NAME.match(name) for name in names) and not {'html', 'body'} & set(names):
+            elements = frozenset(names)
+        else:
+            elements = None
+        family = font.get('family') or f"Embedded {os.path.splitext(os.path.basename(path))[0]}"
+        fonts.append(EmbeddedFont(family, path, font.get('index', 0), selector, font.get('fallback', ''), elements))
+    return fonts
+
+
+def _element_pattern(names: frozenset[str]) -> re.Pattern:
+    """Outermost elements of one of the names and their content (group 2)."""
+    alternatives = '|'.join(re.escape(name) for name in sorted(names))
+    return re.compile(rf'<({alternatives})(?:\s[^>]*)?>(.*?)</\1>', re.DOTALL | re.IGNORECASE)
+
+
+def _text(markup: str) -> str:
+    text = TAG.sub('', markup)
+    return html.unescape(text) if '&' in text else text
+
+
+def page_text(xhtml: str, elements: list[re.Pattern | None]) -> list[str]:
+    """
+    Text of the <body> of a page, once per pattern of _element_pattern: the text inside the
+    matching elements, or all of it for None. Character references are resolved.
+    """
+    body = BODY.search(xhtml)
+    markup = body.group(1) if body else ''
+    return [_text(markup) if pattern is None else ''.join(_text(match.group(2)) for match in pattern.finditer(markup))
+            for pattern in elements]
+
+
+def used_characters(outdir: str, fonts: list[EmbeddedFont]) -> list[set[str]]:
+    """
+    Characters each font must cover, from every XHTML page of the output directory that links
+    fonts.css. Pages without the link (the cover and nav.xhtml, written after the subsets) do
+    not use the fonts.
+    """
+    elements = [None if font.elements is None else _element_pattern(font.elements) for font in fonts]
+    characters = [set(ASCII_TEXT) for _ in fonts]
+    for root, _dirs, files in os.walk(outdir):
+        for filename in files:
+            if not filename.endswith('.xhtml'):
+                continue
+            with open(os.path.join(root, filename), 'r', encoding='utf-8') as f:
+                xhtml = f.read()
+            if CSS_FILENAME not in xhtml:
+                continue
+            texts = page_text(xhtml, elements)
+            for number, text in enumerate(texts):
+                characters[number].update(text)
+    for used in characters:
+        used.difference_update('\n\r\t')
+    return characters
+
+
+def subset_font(path: str, index: int, text: str, output: str) -> None:
+    """Keep only the glyphs of text (with their layout features) and drop the hinting."""
+    options = subset.Options()
+    options.font_number = index
+    # E-ink readers rasterise at high resolution, hinting only adds size
+    options.hinting = False
+    options.desubroutinize = True
+    font = subset.load_font(path, options, dontLoadGlyphNames=True)
+    try:
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(text=text)
+        subsetter.subset(font)
+        subset.save_font(font, output, options)
+    finally:
+        font.close()
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cached_subset(font: EmbeddedFont, text: str, cache_dir: str) -> str:
+    """Path of the subset of the font for exactly these characters, generated on a cache miss."""
+    key = hashlib.sha256('\0'.join([SUBSETTER_VERSION, _file_digest(font.path), str(font.index), text])
+                         .encode('utf-8')).hexdigest()
+    cached = os.path.join(cache_dir, key[:2], key)
+    if not os.path.exists(cached):
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        temp_path = f"{cached}.{os.getpid()}.part"
+        try:
+            subset_font(font.path, font.index, text, temp_path)
+            os.replace(temp_path, cached)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return cached
+
+
+def _extension(path: str) -> str:
+    with open(path, 'rb') as f:
+        return '.otf' if f.read(4) == b'OTTO' else '.ttf'
+
+
+def font_face_css(entries: list[tuple[EmbeddedFont, str]]) -> str:
+    """@font-face rules of the subsets and the rules applying them; entries are (font, URL)."""
+    rules = []
+    for font, url in entries:
+        rules.append(f'@font-face {{\n  font-family: "{font.family}";\n  src: url("{url}");\n}}\n')
+    for font, _ in entries:
+        fallback = f", {font.fallback}" if font.fallback else ''
+        rules.append(f'{font.selector} {{\n  font-family: "{font.family}"{fallback};\n}}\n')
+    return '\n'.join(rules)
+
+
+def embed_fonts(app, fonts: list[EmbeddedFont]) -> None:
+    """Subset the fonts to the characters of the written pages and write them with fonts.css."""
+    outdir = str(app.builder.outdir)
+    cache_dir = os.path.abspath(app.config.font_subsetter_cache_dir or
+                                os.path.join(app.confdir, '.cache', 'font_subsetter'))
+    font_dir = os.path.join(outdir, '_static', FONT_DIR)
+    # Subsets of previous builds are named after other glyph sets
+    shutil.rmtree(font_dir, ignore_errors=True)
+    os.makedirs(font_dir)
+
+    entries = []
+    for font, characters in zip(fonts, used_characters(outdir, fonts)):
+        text = ''.join(sorted(characters))
+        try:
+            cached = _cached_subset(font, text, os.path.join(cache_dir, 'subsets'))
+        except Exception as e:
+            logger.warning(f"[font_subsetter] Cannot subset {font.path}: {type(e).__name__}: {e}")
+            continue
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        filename = f"{os.path.splitext(os.path.basename(font.path))[0]}-{digest}{_extension(cached)}"
+        shutil.copyfile(cached, os.path.join(font_dir, filename))
+        entries.append((font, f"{FONT_DIR}/{filename}"))
+
+        before = os.path.getsize(font.path)
+        after = os.path.getsize(cached)
+        logger.info(f"[font_subsetter] {os.path.basename(font.path)} ({font.selector}): {len(characters)} characters, "
+                    f"{before / 1024:.1f} KB -> {after / 1024:.1f} KB")
+
+    # Written even without any subset: every page links to it
+    with open(os.path.join(outdir, '_static', CSS_FILENAME), 'w', encoding='utf-8') as f:
+        f.write(font_face_css(entries))
+
+
+def init_font_subsetter(app):
+    config = app.config
+    builder = app.builder
+    if not config.font_subsetter_enabled or not isinstance(builder, EpubBuilder):
+        return
+    if subset is None:
+        logger.warning("[font_subsetter] fontTools is not installed, fonts are not embedded")
+        return
+    fonts = _fonts(app)
+    if not fonts:
+        return
+
+    app.add_css_file(CSS_FILENAME, priority=CSS_PRIORITY)
+    handle_finish = builder.handle_finish
+
+    def subset_handle_finish():
+        # Before content.opf is written, so the subsets and fonts.css are in the manifest
+        embed_fonts(app, fonts)
+        handle_finish()
+
+    builder.handle_finish = subset_handle_finish
+
+
+def setup(app):
+    # Embed subsets of local fonts holding only the characters of the book
+    app.add_config_value('font_subsetter_enabled', False, 'html')
+    # [{'path': font file relative to the configuration directory, 'selector': CSS selector
+    #   ('body' by default), 'fallback': rest of the font-family list, 'family': CSS family name,
+    #   'index': font number in a collection (.ttc)}, ...]
+    app.add_config_value('font_subsetter_fonts', [], 'html')
+    app.add_config_value('font_subsetter_cache_dir', None, '')
+    app.connect('builder-inited', init_font_subsetter)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import pygments
+
+# Entries live in <cache_dir>/<key[:2]>/<key>.html; the mtime of an entry is its last use
+ENTRY_SUFFIX = '.html'
+STATS_DIRNAME = 'stats'
+
+
+def _touch(path: str) -> None:
+    """
+    Mark an entry as used now. The time is set explicitly: the file system's own clock may lag
+    behind time.time(), which would date an entry used by this build before it started.
+    """
+    now = time.time()
+    os.utime(path, (now, now))
+
+
+def _describe_lexer(lexer) -> list:
+    """Identify a custom lexer instance by its class and options."""
+    return [f"{type(lexer).__module__}.{type(lexer).__qualname__}", lexer.options]
+
+
+class HighlightCache:
+    """
+    Disk cache of highlighted code blocks, shared by every build that points at the same directory.
+
+    The formatter only emits CSS class names, so its output does not depend on the Pygments
+    style: the key covers the source, the lexer (alias, custom lexer and options), the formatter
+    arguments other than the style, and the formatter/Pygments versions.
+
+    Each entry is its own file written through a temporary file and os.replace, so parallel
+    write processes never see partial entries. Hits and misses are counted per process and
+    flushed to small stats files, which the main process sums up at the end of the build.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, formatter_version: str):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.formatter_version = formatter_version
+        self.build_id = uuid.uuid4().hex
+        self.main_pid = os.getpid()
+        self.started = time.time()
+        self._reset_counters()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _reset_counters(self) -> None:
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit: bool) -> None:
+        # Forked write processes inherit the parent's counters; start from zero in each of them
+        if self._pid != os.getpid():
+            self._reset_counters()
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def key(self, source: str, lang: str, custom_lexer, formatter_class, formatter_args: dict,
+            opts: dict | None, force: bool, kwargs: dict) -> str:
+        args = {name: value for name, value in formatter_args.items() if name != 'style'}
+        meta = json.dumps([
+            self.formatter_version,
+            pygments.__version__,
+            f"{formatter_class.__module__}.{formatter_class.__qualname__}",
+            lang,
+            _describe_lexer(custom_lexer) if custom_lexer is not None else None,
+            opts or {},
+            force,
+            args,
+            kwargs,
+        ], sort_keys=True, default=repr)
+        digest = hashlib.sha256(meta.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(source.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ENTRY_SUFFIX)
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+        except OSError:
+            self._count(hit=False)
+            return None
+        try:
+            _touch(path)  # LRU: mark the entry as recently used
+        except OSError:
+            pass
+        self._count(hit=True)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(value)
+            _touch(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def flush_stats(self) -> None:
+        """Record this process' counters so the main process can report them."""
+        if self._pid != os.getpid():
+            self._reset_counters()
+        stats_dir = os.path.join(self.cache_dir, STATS_DIRNAME, self.build_id)
+        os.makedirs(stats_dir, exist_ok=True)
+        path = os.path.join(stats_dir, f"{self._pid}.json")
+        temp_path = f"{path}.part"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'hits': self.hits, 'misses': self.misses}, f)
+        os.replace(temp_path, path)
+
+    def collect_stats(self) -> tuple[int, int]:
+        """Sum the counters of every process of this build and remove their stats files."""
+        self.flush_stats()
+        stats_dir = os.path.join(self.cache_dir, STATS_DIRNAME, self.build_id)
+        hits = misses = 0
+        for filename in os.listdir(stats_dir):
+            path = os.path.join(stats_dir, filename)
+            if filename.endswith('.json'):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        stats = json.load(f)
+                    hits += stats['hits']
+                    misses += stats['misses']
+                except (OSError, ValueError, KeyError):
+                    pass
+            os.remove(path)
+        os.rmdir(stats_dir)
+        return hits, misses
+
+    def evict(self) -> tuple[int, int]:
+        """Remove the least recently used entries until the cache fits; returns (count, bytes) removed."""
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(self.cache_dir):
+            if os.path.relpath(root, self.cache_dir).split(os.sep)[0] == STATS_DIRNAME:
+                continue
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if not filename.endswith(ENTRY_SUFFIX):
+                    # Temporary files left behind by an interrupted build
+                    if stat.st_mtime < self.started:
+                        os.remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        removed = removed_bytes = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if mtime >= self.started:
+                break  # Never evict entries used by this build
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            removed_bytes += size
+        return removed, removed_bytes
@@ -0,0 +1,197 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+
+from sphinx.util import logging
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, the stage is skipped without it
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the derivative algorithm changes so cached files are regenerated
+OPTIMIZER_VERSION = '1'
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+JPEG_QUALITIES = (85, 75, 65, 55, 45)
+MIN_WIDTH = 320
+
+
+def _settings(config) -> dict:
+    return {
+        'version': OPTIMIZER_VERSION,
+        'max_width': config.image_optimizer_max_width,
+        'max_bytes': config.image_optimizer_max_bytes,
+        'grayscale': config.image_optimizer_grayscale,
+        'colors': config.image_optimizer_colors,
+    }
+
+
+def _flatten(image):
+    """Drop the alpha channel by compositing onto a white page background."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, image).convert('RGB')
+    return image
+
+
+def _save(image, fmt: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, optimize=True, **options)
+    return buffer.getvalue()
+
+
+def _candidates(image, fmt: str, settings: dict):
+    """Yield encodings of the image from best to lowest quality."""
+    if fmt == 'JPEG':
+        image = image.convert('L' if settings['grayscale'] else 'RGB')
+        for quality in JPEG_QUALITIES:
+            yield _save(image, 'JPEG', quality=quality, progressive=True)
+    elif settings['grayscale']:
+        # Palette reduction: e-ink panels only show a handful of gray levels
+        yield _save(image.convert('L').quantize(colors=settings['colors']), 'PNG')
+    else:
+        yield _save(image, 'PNG')
+        # Over budget at full quality: fall back to an 8-bit palette PNG
+        yield _save(_flatten(image).convert('RGB').quantize(colors=256), 'PNG')
+
+
+def optimize_image(data: bytes, settings: dict) -> bytes | None:
+    """Return the optimised derivative, or None when the image should be kept as is."""
+    image = Image.open(io.BytesIO(data))
+    fmt = image.format
+    if fmt not in ('PNG', 'JPEG') or getattr(image, 'n_frames', 1) > 1:
+        return None
+
+    if fmt == 'JPEG' or settings['grayscale']:
+        image = _flatten(image)
+    if image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+        image = image.convert('RGB')
+
+    width = min(image.width, settings['max_width'])
+    best = None
+    while True:
+        if width < image.width:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+        else:
+            resized = image
+
+        for encoded in _candidates(resized, fmt, settings):
+            if best is None or len(encoded) < len(best):
+                best = encoded
+            if len(encoded) <= settings['max_bytes']:
+                return best if len(best) < len(data) else None
+
+        # Still over budget: keep shrinking the resolution
+        if width <= MIN_WIDTH:
+            break
+        width = max(MIN_WIDTH, int(width * 0.85))
+
+    return best if len(best) < len(data) else None
+
+
+def _derivative(source_path: str, cache_dir: str, settings: dict, settings_key: str) -> tuple[str, int, int]:
+    """Return (derivative path, original size, optimised size), generating it on a cache miss."""
+    with open(source_path, 'rb') as f:
+        data = f.read()
+
+    key = hashlib.sha256(data).hexdigest() + '-' + settings_key
+    ext = os.path.splitext(source_path)[1].lower()
+    cached = os.path.join(cache_dir, key[:2], key + ext)
+    if not os.path.exists(cached):
+        optimized = optimize_image(data, settings)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        temp_path = f"{cached}.{os.getpid()}.part"
+        with open(temp_path, 'wb') as f:
+            f.write(optimized if optimized is not None else data)
+        os.replace(temp_path, cached)
+
+    return cached, len(data), os.path.getsize(cached)
+
+
+def _static_images(app):
+    """
+    (static directory, image path) of the images in image_optimizer_paths of every static directory,
+    including the one of the images fetched by preprocess.py. Like Sphinx, a later directory
+    overrides the files of an earlier one.
+    """
+    for static_path in app.config.html_static_path:
+        static_dir = os.path.join(app.confdir, static_path)
+        for subdir in app.config.image_optimizer_paths:
+            for root, _dirs, files in os.walk(os.path.join(static_dir, subdir)):
+                for filename in sorted(files):
+                    if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                        yield static_dir, os.path.join(root, filename)
+
+
+def stage_derivatives(app, env) -> None:
+    config = app.config
+    if not config.image_optimizer_enabled:
+        return
+    if Image is None:
+        logger.warning("[image_optimizer] Pillow is not installed, images are packaged unchanged")
+        return
+
+    settings = _settings(config)
+    settings_key = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+    cache_dir = os.path.abspath(config.image_optimizer_cache_dir or os.path.join(app.confdir, '.cache', 'image_optimizer'))
+
+    # The staged tree mirrors _static and is appended to html_static_path, so its files
+    # overwrite the originals when Sphinx copies static files into the output directory.
+    outdir_key = hashlib.sha256(os.path.abspath(app.outdir).encode()).hexdigest()[:16]
+    staged_dir = os.path.join(cache_dir, 'staged', outdir_key)
+    shutil.rmtree(staged_dir, ignore_errors=True)
+
+    total_before = total_after = 0
+    for static_dir, source_path in _static_images(app):
+        filename = os.path.basename(source_path)
+        try:
+            cached, before, after = _derivative(source_path, os.path.join(cache_dir, 'derivatives'),
+                                                settings, settings_key)
+        except OSError as e:
+            logger.warning(f"[image_optimizer] Cannot optimise {filename}: {e}")
+            continue
+
+        target = os.path.join(staged_dir, os.path.relpath(source_path, static_dir))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(cached, target)
+
+        total_before += before
+        total_after += after
+        saved = before - after
+        logger.info(f"[image_optimizer] {filename}: {before / 1024:.1f} KB -> {after / 1024:.1f} KB "
+                    f"(saved {saved / 1024:.1f} KB, {saved * 100 / before if before else 0:.0f}%)")
+
+    if total_before:
+        logger.info(f"[image_optimizer] Total: {total_before / 1024:.1f} KB -> {total_after / 1024:.1f} KB "
+                    f"(saved {(total_before - total_after) / 1024:.1f} KB)")
+        config.html_static_path = [*config.html_static_path, staged_dir]
+
+
+def setup(app):
+    app.add_config_value('image_optimizer_enabled', False, '')
+    # Target device width in pixels; wider images are downscaled
+    app.add_config_value('image_optimizer_max_width', 1200, '')
+    # Per-image size budget in bytes
+    app.add_config_value('image_optimizer_max_bytes', 300 * 1024, '')
+    # Convert to grayscale with a reduced palette (for e-ink builds)
+    app.add_config_value('image_optimizer_grayscale', False, '')
+    app.add_config_value('image_optimizer_colors', 16, '')
+    # Directories under _static whose images are optimised
+    app.add_config_value('image_optimizer_paths', ['laravel'], '')
+    app.add_config_value('image_optimizer_cache_dir', None, '')
+
+    # After the read phase, so images fetched while reading (see preprocess.py) are included
+    app.connect('env-updated', stage_derivatives)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,136 @@
+import sys
+from collections import Counter
+from pathlib import Path
+
+from pygments.lexers import find_lexer_class_by_name, get_lexer_by_name
+from pygments.util import ClassNotFound
+from sphinx.highlighting import lexer_classes, lexers
+from sphinx.util import logging
+
+# The processors live next to the standalone CLI in bin/
+sys.path.insert(0, str(Path(__file__).parent / '..' / 'bin'))
+
+from processors.pipeline import fence_languages
+
+logger = logging.getLogger(__name__)
+
+# Languages PygmentsBridge.get_lexer resolves by itself (Python detection, guessing)
+SPHINX_LANGUAGES = {'default', 'guess', 'none', 'py', 'py3', 'python', 'python3', 'pycon', 'pycon3'}
+# Documents listed per unknown language
+UNKNOWN_EXAMPLES = 3
+
+# Languages this extension put in sphinx.highlighting.lexers; a later build in the same
+# process (bin/watch.py) may replace them, unlike the lexers registered by the configuration
+_registered: set[str] = set()
+
+
+class LexerRegistry:
+    """
+    Fence language -> Pygments lexer, from a declarative alias table.
+
+    Aliases map a language to a Pygments lexer name, optionally with lexer options:
+    {'blade': 'html+php', 'php-line': ('php', {'startinline': True})}. Any other language
+    is looked up as a Pygments name. Instances are only built when a language is first
+    requested and are shared by every language that resolves to the same lexer and options.
+    """
+
+    def __init__(self, aliases: dict):
+        self.aliases: dict[str, tuple[str, dict]] = {}
+        for language, target in aliases.items():
+            name, options = (target, {}) if isinstance(target, str) else target
+            self.aliases[language] = (name, dict(options))
+        self._instances = {}
+
+    def resolve(self, language: str) -> tuple[str, dict] | None:
+        """Pygments name and options of the language, None if Pygments does not know it."""
+        name, options = self.aliases.get(language, (language, {}))
+        try:
+            find_lexer_class_by_name(name)
+        except ClassNotFound:
+            return None
+        return name, options
+
+    def lexer(self, language: str):
+        """Lexer instance of the language (built on first use), None if it is unknown."""
+        resolved = self.resolve(language)
+        if resolved is None:
+            return None
+        name, options = resolved
+        key = (name, tuple(sorted(options.items())))
+        if key not in self._instances:
+            self._instances[key] = get_lexer_by_name(name, **options)
+        return self._instances[key]
+
+
+def scan_fence_languages(app, env, docnames):
+    """
+    Count the fence languages of the documents about to be read (after the preprocess fence
+    handlers), before any of them is parsed. Unchanged documents keep their counts in the environment.
+    """
+    documents = getattr(env, 'fence_languages', {})
+    # Removed documents
+    documents = {docname: counts for docname, counts in documents.items() if docname in env.found_docs}
+    for docname in docnames:
+        path = Path(env.doc2path(docname))
+        if path.suffix == '.md':
+            documents[docname] = fence_languages(path.read_text(encoding='utf-8'))
+    env.fence_languages = documents
+    register_lexers(app, documents)
+
+
+def register_lexers(app, documents: dict[str, Counter]) -> None:
+    """
+    Register a lexer for every fence language of the corpus in sphinx.highlighting.lexers, so
+    highlighting neither looks up nor re-creates lexers per block. Unknown languages are reported
+    here, once, and highlighted as plain text instead of warning on every block.
+    """
+    registry = LexerRegistry(app.config.lexer_registry_aliases)
+    for language, (name, _) in registry.aliases.items():
+        if registry.resolve(language) is None:
+            logger.warning(f"[lexer_registry] Alias {language!r} points at unknown Pygments lexer {name!r}",
+                           type='lexer_registry', subtype='unknown_alias')
+
+    totals = Counter()
+    found_in: dict[str, list[str]] = {}
+    for docname in sorted(documents):
+        for language, count in documents[docname].items():
+            totals[language] += count
+            found_in.setdefault(language, []).append(docname)
+
+    unknown = []
+    for language in sorted(totals):
+        # Sphinx's own languages, and lexers registered by the configuration, are left alone
+        if language in SPHINX_LANGUAGES or language in lexer_classes or \
+           (language in lexers and language not in _registered):
+            continue
+        # Per-language highlight_options are only passed to lexers Sphinx creates per block
+        if language in app.config.highlight_options and language not in registry.aliases:
+            continue
+        lexer = registry.lexer(language)
+        if lexer is None:
+            unknown.append(language)
+            lexer = lexer_classes['none']()
+        lexers[language] = lexer
+        _registered.add(language)
+
+    logger.info(f"[lexer_registry] {sum(totals.values())} code blocks in {len(totals)} languages: "
+                + ', '.join(f"{language} ({count})" for language, count in totals.most_common()))
+    for language in unknown:
+        docnames = found_in[language]
+        examples = ', '.join(docnames[:UNKNOWN_EXAMPLES]) + (', ...' if len(docnames) > UNKNOWN_EXAMPLES else '')
+        logger.warning(f"[lexer_registry] Unknown code block language {language!r} "
+                       f"({totals[language]} blocks in {len(docnames)} documents: {examples}); "
+                       f"highlighted as plain text, add it to lexer_registry_aliases",
+                       type='lexer_registry', subtype='unknown_language')
+
+
+def setup(app):
+    # Fence language -> Pygments lexer name, or (name, options); see LexerRegistry
+    app.add_config_value('lexer_registry_aliases', {}, 'html')
+    app.connect('env-before-read-docs', scan_fence_languages)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
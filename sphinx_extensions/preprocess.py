@@ -0,0 +1,244 @@
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+from sphinx.errors import ExtensionError
+from sphinx.util import logging
+
+# The processors live next to the standalone CLI in bin/
+sys.path.insert(0, str(Path(__file__).parent / '..' / 'bin'))
+
+from processors.pipeline import pipeline_files, run_pipeline
+from processors.image_handler import collect_image_urls, fetch_images, DEFAULT_FETCH_WORKERS
+from processors.image_cache import ImageCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES
+from processors.link_index import build_link_index
+from processors.manifest import load_staged, save_staged
+
+logger = logging.getLogger(__name__)
+
+# Every transformed document depends on the modules of the processor chain that transformed it
+PROCESSOR_FILES = pipeline_files()
+
+# Directory of the fetched images under _static, as referenced by the rewritten <img> tags
+IMAGE_DIR = 'laravel'
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class RawSources:
+    """
+    Raw Laravel Markdown files, staged unchanged into the Sphinx source directory and transformed
+    in memory when Sphinx reads them.
+    """
+
+    def __init__(self, source_dir: str, static_dir: str, suffix: str = '.md'):
+        self.source_dir = source_dir
+        # Static directory of the build holding the fetched images (in IMAGE_DIR)
+        self.static_dir = static_dir
+        self.suffix = suffix
+        # docname -> absolute path of the raw file
+        self.docs: dict[str, Path] = {}
+        # URL -> local image path, filled before each read phase
+        self.replacements: dict[str, str] = {}
+
+    @property
+    def image_output_dir(self) -> str:
+        return os.path.join(self.static_dir, IMAGE_DIR)
+
+    def stage(self, srcdir: str) -> list[str]:
+        """
+        Copy the raw documents into srcdir, rewriting only the copies whose content changed so
+        Sphinx's mtime check re-reads exactly the edited pages, and remove the copies of deleted
+        documents. Files the extension did not write (e.g. preprocess_docs.py output) are left
+        alone; their docnames are returned.
+        """
+        staged = load_staged(srcdir)
+        current = {}
+        shadowed = []
+        self.docs = {}
+        for filename in sorted(os.listdir(self.source_dir)):
+            path = os.path.join(self.source_dir, filename)
+            if not filename.endswith(self.suffix) or not os.path.isfile(path):
+                continue
+            target = os.path.join(srcdir, filename)
+            existing = _file_digest(target)
+            if existing is not None and existing != staged.get(filename):
+                shadowed.append(filename[:-len(self.suffix)])
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = _digest(data)
+            if digest != existing:
+                temp_path = f"{target}.{os.getpid()}.part"
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, target)
+            current[filename] = digest
+            self.docs[filename[:-len(self.suffix)]] = Path(path)
+
+        for filename, digest in staged.items():
+            target = os.path.join(srcdir, filename)
+            if filename not in current and _file_digest(target) == digest:
+                os.remove(target)
+        save_staged(srcdir, current)
+        return shadowed
+
+
+def _file_digest(path: str) -> str | None:
+    try:
+        with open(path, 'rb') as f:
+            return _digest(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def _static_dir(app) -> str:
+    """Static directory of the fetched images, one per source directory (shared by the variants)."""
+    cache_dir = app.config.preprocess_cache_dir or os.path.join(app.confdir, '.cache', 'preprocess')
+    srcdir_key = hashlib.sha256(os.path.abspath(app.srcdir).encode()).hexdigest()[:16]
+    return os.path.join(os.path.abspath(cache_dir), 'static', srcdir_key)
+
+
+def init_raw_sources(app):
+    if not app.config.preprocess_source_dir:
+        return
+
+    source_dir = os.path.abspath(os.path.join(app.confdir, app.config.preprocess_source_dir))
+    if not os.path.isdir(source_dir):
+        logger.warning(f"[preprocess] Source directory {source_dir} does not exist")
+        return
+
+    raw_sources = RawSources(source_dir, _static_dir(app))
+    # Before the read phase discovers the documents
+    shadowed = raw_sources.stage(str(app.srcdir))
+    if shadowed:
+        logger.warning(f"[preprocess] {len(shadowed)} documents of {source_dir} are shadowed by other files in "
+                       f"{app.srcdir} (e.g. {shadowed[0]}); remove the preprocessed copies to read the raw documents")
+    app.preprocess_sources = raw_sources
+
+    # Fetched images are static files of the build, copied to the output like _static
+    os.makedirs(raw_sources.image_output_dir, exist_ok=True)
+    config = app.config
+    if raw_sources.static_dir not in config.html_static_path:
+        config.html_static_path = [*config.html_static_path, raw_sources.static_dir]
+    logger.info(f"[preprocess] Reading Laravel documents from {source_dir}")
+
+
+def fetch_document_images(app, env, docnames):
+    """Download the images of the documents about to be read, before the (parallel) read starts."""
+    raw_sources = getattr(app, 'preprocess_sources', None)
+    if raw_sources is None:
+        return
+
+    document_urls = {}
+    for docname in docnames:
+        path = raw_sources.docs.get(docname)
+        if path is not None:
+            document_urls[docname] = collect_image_urls(path.read_text(encoding='utf-8'))
+    img_urls = [url for urls in document_urls.values() for url in urls]
+    replacements = {}
+    if img_urls:
+        config = app.config
+        image_cache = ImageCache(config.preprocess_image_cache_dir or DEFAULT_CACHE_DIR,
+                                 config.preprocess_image_cache_size * 1024 * 1024,
+                                 config.preprocess_offline)
+        logger.info(f"[preprocess] Fetching {len(set(img_urls))} images ({len(img_urls)} references)")
+        replacements = fetch_images(img_urls, raw_sources.image_output_dir, config.preprocess_image_workers,
+                                    image_cache)
+    raw_sources.replacements = replacements
+
+    # Documents still pointing at remote images are read again by the next build (see outdated_documents).
+    # Set here rather than while reading: env-purge-doc runs for every document that is re-read
+    incomplete = {docname for docname in getattr(env, 'preprocess_incomplete', set())
+                  if docname in raw_sources.docs and docname not in docnames}
+    incomplete.update(docname for docname, urls in document_urls.items()
+                      if any(url not in replacements for url in urls))
+    env.preprocess_incomplete = incomplete
+
+
+def outdated_documents(app, env, added, changed, removed):
+    """Re-read the documents whose images could not all be fetched last time, to retry them."""
+    raw_sources = getattr(app, 'preprocess_sources', None)
+    if raw_sources is None:
+        return []
+    incomplete = getattr(env, 'preprocess_incomplete', set())
+    return sorted(docname for docname in incomplete if docname in raw_sources.docs and docname not in removed)
+
+
+def check_document_links(app, env, docnames):
+    """
+    Check the internal links of the documents about to be read against an index of every raw
+    document, long before Sphinx resolves (and warns about) references.
+    """
+    raw_sources = getattr(app, 'preprocess_sources', None)
+    if raw_sources is None or not app.config.preprocess_check_links:
+        return
+
+    strict = app.config.preprocess_strict_links
+    reading = [docname for docname in docnames if docname in raw_sources.docs]
+    if not reading and not strict:
+        return
+
+    # Anchors are the heading slugs myst generates, so the result agrees with its xref warnings
+    index = build_link_index({docname: path.read_text(encoding='utf-8')
+                              for docname, path in raw_sources.docs.items()},
+                             app.config.myst_heading_anchors)
+    # Unchanged documents were checked when they were read, unless the build must not pass
+    # with any dangling link
+    dangling = index.dangling(None if strict else reading)
+    for link in dangling:
+        target = f"{link.target}#{link.anchor}" if link.anchor else link.target
+        logger.warning(f"[preprocess] Link to {target}: {link.reason} not found",
+                       location=(link.source, link.line), type='preprocess', subtype='dangling_link')
+    if dangling and strict:
+        raise ExtensionError(f"{len(dangling)} dangling links (preprocess_strict_links)")
+
+
+def preprocess_source(app, docname, source):
+    raw_sources = getattr(app, 'preprocess_sources', None)
+    if raw_sources is None or docname not in raw_sources.docs:
+        return
+
+    report = getattr(app, 'build_report', None)
+    if report is None:
+        source[0] = run_pipeline(source[0], raw_sources.image_output_dir, raw_sources.replacements)
+    else:
+        stats = {}
+        source[0] = run_pipeline(source[0], raw_sources.image_output_dir, raw_sources.replacements, stats)
+        report.add({'kind': 'processors', 'docname': docname, 'processors': stats})
+
+    # Editing the raw page, or any processor, re-reads the documents it transformed
+    app.env.note_dependency(str(raw_sources.docs[docname]))
+    for filename in PROCESSOR_FILES:
+        app.env.note_dependency(filename)
+
+
+def setup(app):
+    # Directory of the raw Markdown files, relative to the configuration directory (None disables)
+    app.add_config_value('preprocess_source_dir', None, 'env')
+    # Fetched images are kept under <preprocess_cache_dir>/static and added to html_static_path
+    app.add_config_value('preprocess_cache_dir', None, '')
+    app.add_config_value('preprocess_image_workers', DEFAULT_FETCH_WORKERS, '')
+    app.add_config_value('preprocess_image_cache_dir', None, '')
+    app.add_config_value('preprocess_image_cache_size', DEFAULT_CACHE_MAX_BYTES // (1024 * 1024), '')
+    # Never access the network, build images entirely from the image cache
+    app.add_config_value('preprocess_offline', False, '')
+    # Check the internal links of the raw documents before reading them; fail the build on a
+    # dangling link when strict
+    app.add_config_value('preprocess_check_links', True, '')
+    app.add_config_value('preprocess_strict_links', False, '')
+
+    app.connect('builder-inited', init_raw_sources)
+    app.connect('env-get-outdated', outdated_documents)
+    app.connect('env-before-read-docs', check_document_links)
+    app.connect('env-before-read-docs', fetch_document_images)
+    app.connect('source-read', preprocess_source)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -1,192 +1,319 @@
+import hashlib
+import logging as std_logging
+import os
 import re
+from pygments import highlight
+from pygments.filters import ErrorToken
 from pygments.formatter import Formatter
 from pygments.formatters.html import HtmlFormatter
 from pygments.token import Token, Comment, Text
 
-from sphinx.highlighting import PygmentsBridge
+from sphinx.config import ENUM
+from sphinx.highlighting import lexers
 from sphinx.util import logging
 
+from highlight_cache import HighlightCache
+
 logger = logging.getLogger(__name__)
 
+# Any change to this module invalidates the highlight cache
+with open(__file__, 'rb') as _f:
+    FORMATTER_VERSION = hashlib.sha256(_f.read()).hexdigest()[:16]
+
+NBSP = '&#160;'
+LINENOS_OPEN = '<span class="linenos">'
+SPAN_CLOSE = '</span>'
+
+# Space runs that are rewritten to &#160; in a single pass over each line:
+#  - inside the linenos span, before the number
+#  - inside pygments' whitespace-only spans
+#  - leading spaces in sd (docstring) spans
+SPACE_RUN_PATTERN = re.compile(
+    r'<span class="(?:linenos">( +)(?=\d+</span>)|w">( +)(?=</span>)|sd">( +))'
+)
+
+# Pattern to find [tl! add|remove] tags, accounting for Pygments' spans
+# Captures and removes the '//' prefix as well
+TAG_PATTERN = re.compile(r'(?P<prefix>//\s*)?\[tl!\s*(?P<type>add|remove)(?::(?P<subtype>start|end))?\]')
+
+# Pygments' empty comment spans left behind once a tag is removed
+EMPTY_COMMENT_PATTERN = re.compile(r'<span class="c[0-9]">\s*</span>')
+
+# Pygments' whitespace spans, unwrapped in compact markup
+WHITESPACE_SPAN_PATTERN = re.compile(r'<span class="w">([ \t]*)</span>')
+
+
+def _nbsp_run(match):
+    # Keep the opening tag, replace only the captured run of spaces
+    run_start = match.start(match.lastindex)
+    return match.group(0)[:run_start - match.start()] + NBSP * (match.end() - run_start)
+
+
 class TorchlightHtmlFormatter(HtmlFormatter):
     def __init__(self, **options):
         options['linenos'] = 'inline'
         super().__init__(**options)
         self.options['nowrap'] = True # Ensure no extra wrapping by base class
         logger.debug("[torchlight] TorchlightHtmlFormatter __init__ called!")
-        self.in_add_block = False
-        self.in_remove_block = False
+
+    def _rewrite_spaces(self, value):
+        """Replace the space runs that browsers would collapse with &#160; entities."""
+        linenos_start = value.find(LINENOS_OPEN)
+        if linenos_start != -1:
+            # Spaces following the first </span> after the linenos span opens
+            # e.g. <span class="linenos"> 1</span>  foo -> ...</span>&#160;&#160;foo
+            close = value.find(SPAN_CLOSE + ' ', linenos_start + len(LINENOS_OPEN))
+            if close != -1:
+                run_start = close + len(SPAN_CLOSE)
+                run_end = run_start
+                while run_end < len(value) and value[run_end] == ' ':
+                    run_end += 1
+                value = value[:run_start] + NBSP * (run_end - run_start) + value[run_end:]
+
+        if ' ' in value:
+            value = SPACE_RUN_PATTERN.sub(_nbsp_run, value)
+        return value
+
+    def _wrap_line(self, value):
+        """Wrap the line number and the code in their own spans."""
+        newline_suffix = ''
+        if value.endswith('\n'):
+            value = value[:-1]
+            newline_suffix = '\n'
+
+        linenos_span = ''
+        code_part = value
+        if value.startswith(LINENOS_OPEN):
+            close = value.find(SPAN_CLOSE)
+            if close != -1:
+                linenos_span = value[:close + len(SPAN_CLOSE)]
+                code_part = value[close + len(SPAN_CLOSE):]
+
+        # Wrap the code part in its own span, handling empty/whitespace-only cases
+        if not code_part.strip():
+            wrapped_code = '<span class="code empty">&#10;</span>'
+        else:
+            wrapped_code = f'<span class="code">{code_part}</span>'
+
+        return f'<span class="line">{linenos_span}{wrapped_code}</span>{newline_suffix}'
 
     def wrap(self, source):
-        logger.debug("[torchlight] TorchlightHtmlFormatter wrap() method called!")
+        debug = logger.isEnabledFor(std_logging.DEBUG)
+        if debug:
+            logger.debug("[torchlight] TorchlightHtmlFormatter wrap() method called!")
+        # Range state belongs to this code block only: an unclosed [tl! add:start] must not
+        # leak into the next block, even when Sphinx reuses the formatter (relaxed-mode retry)
+        in_add_block = False
+        in_remove_block = False
         # Call the parent's wrap method to get the default Pygments output
         for type, value in super().wrap(source):
-            if type == 1: # This type typically indicates a line of code
-
-                # Replace spaces inside and after the linenos span
-                # e.g. <span class="linenos"> 1</span>  foo
-                # -> <span class="linenos">&#160;1</span>&#160;&#160;foo
-
-                # Handle spaces inside the linenos span, before the number
-                value = re.sub(
-                    r'(<span class="linenos">)( +)(\d+</span>)',
-                    lambda m: m.group(1) + ''.join(['&#160;' for char in m.group(2)]) + m.group(3),
-                    value
-                )
-
-                # Handle spaces after the linenos span
-                value = re.sub(
-                    r'(<span class="linenos">.*?</span>)( +)',
-                    lambda m: m.group(1) + ''.join(['&#160;' for char in m.group(2)]),
-                    value
-                )
-
-                # Handle spaces inside pygments' whitespace-only spans
-                value = re.sub(
-                    r'(<span class="w">)( +)(</span>)',
-                    lambda m: m.group(1) + ''.join(['&#160;' for char in m.group(2)]) + m.group(3),
-                    value
-                )
-
-                # Handle leading spaces in sd spans
-                value = re.sub(
-                    r'(<span class="sd">)( +)',
-                    lambda m: m.group(1) + ''.join(['&#160;' for char in m.group(2)]),
-                    value
-                )
-
-                
-
-                # --- Wrap line and code in spans, as per user request ---
-                # 1. Separate newline
-                newline_suffix = ''
-                if value.endswith('\n'):
-                    value = value[:-1]
-                    newline_suffix = '\n'
-
-                # 2. Separate line number span from the rest of the code
-                linenos_span = ''
-                code_part = ''
-                match = re.match(r'(<span class="linenos">.*?</span>)(.*)', value)
-                if match:
-                    linenos_span = match.group(1)
-                    code_part = match.group(2)
-                else:
-                    # Fallback for lines without a line number
-                    code_part = value
-                
-                # 3. Wrap the code part in its own span, handling empty/whitespace-only cases
-                if not code_part.strip():
-                    wrapped_code = '<span class="code empty">&#10;</span>'
-                else:
-                    wrapped_code = f'<span class="code">{code_part}</span>'
-                
-                # 4. Assemble the new line structure
-                value = f'<span class="line">{linenos_span}{wrapped_code}</span>'
-
-                # 5. Add the newline back on for the next stage
-                value += newline_suffix
-
-                processed_value = value
-                line_highlight_class = None
-                
-                # Pattern to find [tl! add|remove] tags, accounting for Pygments' spans
-                # Modified to capture and remove the '//' prefix as well
-                tag_pattern = r'(?P<prefix>//\s*)?\[tl!\s*(?P<type>add|remove)(?::(?P<subtype>start|end))?\]'
-                
-                tag_match = re.search(tag_pattern, processed_value)
-                
-                if tag_match:
-                    tag_type = tag_match.group('type')
-                    tag_subtype = tag_match.group('subtype')
-                    
+            if type != 1: # Only type 1 is a line of code
+                yield type, self._block_markup(value)
+                continue
+
+            value = self._prepare_line(value)
+
+            line_highlight_class = None
+            tag_match = TAG_PATTERN.search(value) if '[tl!' in value else None
+
+            if tag_match:
+                tag_type = tag_match.group('type')
+                tag_subtype = tag_match.group('subtype')
+                if debug:
                     logger.debug(f"[torchlight] Found tag: {tag_match.group(0)}. Type: {tag_type}, Subtype: {tag_subtype}")
-                    logger.debug(f"[torchlight] Before replacement (group 0): '{tag_match.group(0)}'")
-                    logger.debug(f"[torchlight] Before replacement (processed_value): '{processed_value.strip()}'")
 
-                    if tag_type == 'add':
-                        # --- Handle 'add' tags ---
-                        if tag_subtype is None:  # Single line tag
+                if tag_type == 'add':
+                    # --- Handle 'add' tags ---
+                    if tag_subtype is None:  # Single line tag
+                        line_highlight_class = "hll"
+                    elif tag_subtype == 'start':
+                        in_add_block = True
+                        line_highlight_class = "hll"  # Highlight the start line itself
+                    else:
+                        if in_add_block:  # Highlight the end line if a block was active
                             line_highlight_class = "hll"
-                        elif tag_subtype == 'start':
-                            self.in_add_block = True
-                            line_highlight_class = "hll"  # Highlight the start line itself
-                            logger.debug(f"[torchlight] Started add block.")
-                        elif tag_subtype == 'end':
-                            if self.in_add_block:  # Highlight the end line if a block was active
-                                line_highlight_class = "hll"
-                            self.in_add_block = False
-                            logger.debug(f"[torchlight] Ended add block.")
-                    
-                    elif tag_type == 'remove':
-                        # --- Handle 'remove' tags ---
-                        if tag_subtype is None:  # Single line tag
-                            line_highlight_class = "dll"
-                        elif tag_subtype == 'start':
-                            self.in_remove_block = True
-                            line_highlight_class = "dll"
-                            logger.debug(f"[torchlight] Started remove block.")
-                        elif tag_subtype == 'end':
-                            if self.in_remove_block:  # Highlight the end line if a block was active
-                                line_highlight_class = "dll"
-                            self.in_remove_block = False
-                            logger.debug(f"[torchlight] Ended remove block.")
-
-                    # --- Remove the [tl! ...] tag and its '//' prefix from the processed_value ---
-                    # Replace the entire matched tag (including the optional '//' prefix) with an empty string
-                    processed_value = processed_value.replace(tag_match.group(0), '')
-                    
-                    # Clean up any empty comment spans that might be left behind
-                    # This regex is more specific to Pygments' empty comment spans
-                    processed_value = re.sub(r'<span class="c[0-9]">\s*</span>', '', processed_value)
-                    logger.debug(f"[torchlight] After replacement (processed_value): '{processed_value.strip()}'")
-                    
-                    # Keep these commented out for now, as they caused XHTML validation issues
-                    # processed_value = re.sub(r'<span class="c[0-9]">\\s*</span>', '', processed_value)
-                    # processed_value = re.sub(r'<--\s*-->', '', processed_value) # For HTML comments
-                    
-                    logger.debug(f"[torchlight] Tag removed. Processed value after removal: {processed_value.strip()}")
-                
-                # --- Apply highlighting based on current state (for ranges) ---
-                elif self.in_add_block:
-                    line_highlight_class = "hll"
-                    logger.debug(f"[torchlight] Applying hll due to active add block.")
-                elif self.in_remove_block:
-                    line_highlight_class = "dll"
-                    logger.debug(f"[torchlight] Applying dll due to active remove block.")
-
-                # --- Apply highlighting and yield ---
-                if line_highlight_class:
-                    # The 'value' from super().wrap(source) already contains the newline.
-                    # We need to remove the newline from processed_value before wrapping,
-                    # and then add it back after the span.
-                    if processed_value.endswith('\n'):
-                        processed_value = processed_value[:-1]
-                        newline_suffix = '\n'
+                        in_add_block = False
+                else:
+                    # --- Handle 'remove' tags ---
+                    if tag_subtype is None:  # Single line tag
+                        line_highlight_class = "dll"
+                    elif tag_subtype == 'start':
+                        in_remove_block = True
+                        line_highlight_class = "dll"
                     else:
-                        newline_suffix = ''
-                    ''
+                        if in_remove_block:  # Highlight the end line if a block was active
+                            line_highlight_class = "dll"
+                        in_remove_block = False
 
-                    yield type, f'<span class="{line_highlight_class}">{processed_value}</span>{newline_suffix}'
-                    logger.debug(f"[torchlight] Wrapped line with {line_highlight_class}. Final HTML: {processed_value.strip()}")
-                else:
-                    yield type, value # Yield original value (with newline) if no tag or no active block
-            else:
+            # --- Apply highlighting based on current state (for ranges) ---
+            elif in_add_block:
+                line_highlight_class = "hll"
+            elif in_remove_block:
+                line_highlight_class = "dll"
+
+            rendered = self._render_line(value, line_highlight_class, tag_match)
+            yield type, rendered
+            if debug and line_highlight_class:
+                logger.debug(f"[torchlight] Wrapped line with {line_highlight_class}. Final HTML: {rendered.strip()}")
+
+    def _block_markup(self, value):
+        """Markup around the lines (the opening <pre> and the closing tags)."""
+        if value.strip() == '<pre><span></span>':
+            return '<pre>\n'
+        return value # Yield other types (e.g., 'doc') unchanged
+
+    def _prepare_line(self, value):
+        return self._wrap_line(self._rewrite_spaces(value))
+
+    def _render_line(self, value, line_highlight_class, tag_match):
+        if not line_highlight_class:
+            return value # Yield original value (with newline) if no tag or no active block
+
+        processed_value = _remove_tag(value, tag_match)
+
+        newline_suffix = ''
+        if processed_value.endswith('\n'):
+            processed_value = processed_value[:-1]
+            newline_suffix = '\n'
+
+        return f'<span class="{line_highlight_class}">{processed_value}</span>{newline_suffix}'
+
+
+class CompactTorchlightHtmlFormatter(TorchlightHtmlFormatter):
+    """
+    Compact markup: one span per line (class hll/dll on added/removed lines) inside
+    <pre class="tl">. Line numbers come from a CSS counter and whitespace is kept by
+    `white-space: pre-wrap` instead of &#160; entities (see custom.css).
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        # Line numbers are generated by CSS, Pygments must not emit them
+        self.linenos = 0
+
+    def _block_markup(self, value):
+        if value.strip() == '<pre><span></span>':
+            # No newline after <pre>: XHTML keeps it, and it would render as an empty first line
+            start = self.linenostart
+            return '<pre class="tl">' if start == 1 else f'<pre class="tl" style="counter-reset: line {start - 1}">'
+        return value
+
+    def _prepare_line(self, value):
+        if '<span class="w">' in value:
+            value = WHITESPACE_SPAN_PATTERN.sub(r'\1', value)
+        return value
+
+    def _render_line(self, value, line_highlight_class, tag_match):
+        value = _remove_tag(value, tag_match)
+        newline_suffix = ''
+        if value.endswith('\n'):
+            value = value[:-1]
+            newline_suffix = '\n'
+        if line_highlight_class:
+            return f'<span class="{line_highlight_class}">{value}</span>{newline_suffix}'
+        return f'<span>{value}</span>{newline_suffix}'
+
+
+def _remove_tag(value, tag_match):
+    if not tag_match:
+        return value
+    # Remove the [tl! ...] tag (including the optional '//' prefix) and
+    # clean up any empty comment spans that might be left behind
+    value = value.replace(tag_match.group(0), '')
+    # Keep these commented out for now, as they caused XHTML validation issues
+    # value = re.sub(r'<--\s*-->', '', value) # For HTML comments
+    return EMPTY_COMMENT_PATTERN.sub('', value)
+
+
+FORMATTERS = {
+    'full': TorchlightHtmlFormatter,
+    'compact': CompactTorchlightHtmlFormatter,
+}
+
+
+def _cached_highlight_block(highlighter, cache):
+    """Wrap PygmentsBridge.highlight_block of one builder so results are served from the cache."""
+    highlight_block = highlighter.highlight_block
+
+    def cached_highlight_block(source, lang, opts=None, force=False, location=None, **kwargs):
+        if not isinstance(source, str):
+            source = source.decode()
+        key = cache.key(source, lang, lexers.get(lang), highlighter.formatter, highlighter.formatter_args,
+                        opts, force, kwargs)
+        hlsource = cache.get(key)
+        if hlsource is None:
+            lexer = highlighter.get_lexer(source, lang, opts, force, location)
+            try:
+                hlsource = highlight(source, lexer, highlighter.get_formatter(**kwargs))
+            except ErrorToken:
+                # Not cached: Sphinx warns and retries in relaxed mode, on every build
+                return highlight_block(source, lang, opts, force, location, **kwargs)
+            cache.put(key, hlsource)
+        return hlsource
+
+    return cached_highlight_block
+
+
+def install_highlight_cache(app):
+    highlighter = getattr(app.builder, 'highlighter', None)
+    if not app.config.torchlight_cache_dir or highlighter is None or highlighter.dest != 'html':
+        return
+
+    cache = HighlightCache(os.path.abspath(app.config.torchlight_cache_dir),
+                           app.config.torchlight_cache_max_bytes, FORMATTER_VERSION)
+    highlighter.highlight_block = _cached_highlight_block(highlighter, cache)
+    app.torchlight_cache = cache
+    logger.info(f"[torchlight] Using highlight cache at {cache.cache_dir}")
+
+
+def flush_cache_stats(app, pagename, templatename, context, doctree):
+    # Parallel write processes report their counters after each page
+    cache = getattr(app, 'torchlight_cache', None)
+    if cache is not None and os.getpid() != cache.main_pid:
+        cache.flush_stats()
+
+
+def report_cache_stats(app, exception):
+    cache = getattr(app, 'torchlight_cache', None)
+    if cache is None:
+        return
+
+    hits, misses = cache.collect_stats()
+    removed, removed_bytes = cache.evict()
+    total = hits + misses
+    logger.info(f"[torchlight] Highlight cache: {hits} hits, {misses} misses "
+                f"({hits * 100 / total if total else 0:.0f}% hit rate)")
+    if removed:
+        logger.info(f"[torchlight] Evicted {removed} cached blocks ({removed_bytes / 1024:.1f} KB)")
+
+
+def use_torchlight_formatter(app):
+    # Only the HTML highlighter of this builder is switched over, instead of patching
+    # PygmentsBridge for every builder in the process
+    highlighter = getattr(app.builder, 'highlighter', None)
+    if highlighter is not None and highlighter.dest == 'html':
+        highlighter.formatter = FORMATTERS[app.config.torchlight_markup]
 
-                if value.strip() == '<pre><span></span>':
-                    yield type, '<pre>\n'
-                else:
-                    yield type, value # Yield other types (e.g., 'doc') unchanged
 
 def setup(app):
     logger.info("[torchlight] Torchlight Sphinx extension loaded!")
 
-    # Directly modify the class attribute of PygmentsBridge
-    # This ensures that any new PygmentsBridge instances will use our formatter
-    PygmentsBridge.html_formatter = TorchlightHtmlFormatter
+    # 'full' wraps line numbers and code of every line in spans of their own, 'compact'
+    # emits one span per line and leaves line numbers and whitespace to CSS
+    app.add_config_value('torchlight_markup', 'full', 'html', ENUM('full', 'compact'))
+    app.connect('builder-inited', use_torchlight_formatter)
+
+    # Highlighted blocks are cached on disk (None disables the cache); the output only uses
+    # CSS class names, so the color and grayscale builds share the same entries
+    app.add_config_value('torchlight_cache_dir', None, '')
+    app.add_config_value('torchlight_cache_max_bytes', 64 * 1024 * 1024, '')
+
+    app.connect('builder-inited', install_highlight_cache)
+    app.connect('html-page-context', flush_cache_stats)
+    app.connect('build-finished', report_cache_stats)
 
     return {
         'version': '0.1',
         'parallel_read_safe': True,
         'parallel_write_safe': True,
-    }
\ No newline at end of file
+    }
@@ -18,6 +18,14 @@ epub_css_files = ['custom.css']
 # -- 封面圖檔 --
 epub_cover = ('_static/cover-color.png','cover.html')
 
+# -- 圖片最佳化：寬度上限適合平板，每張圖片盡量壓在 300KB 以內 --
+image_optimizer_enabled = True
+image_optimizer_max_width = 1600
+image_optimizer_max_bytes = 300 * 1024
+
+# -- 內嵌字型子集：彩色版本通常在平板閱讀，使用系統字型即可 (設定方式見 conf_grayscale.py) --
+font_subsetter_enabled = False
+
 # EPUB 專用排除設定
 epub_exclude_files = [
     'search.html',
@@ -16,8 +16,13 @@ sys.path.insert(0, str(Path(__file__).parent / '..' / 'sphinx_extensions'))
 copyright = "2025, Laravel Contributors"
 author = 'Laravel contributors'
 version = '12.x'
-# 動態生成 release (格式：12.x-%Y%m%d%H%M)
-release = f"{version}-{datetime.datetime.now().strftime('%Y%m%d%H%M')}"
+# 建置時間：可重現建置 (bin/build_epub.py --reproducible) 時取自 SOURCE_DATE_EPOCH，否則為目前時間
+if os.environ.get('SOURCE_DATE_EPOCH'):
+    build_time = datetime.datetime.fromtimestamp(int(os.environ['SOURCE_DATE_EPOCH']), datetime.timezone.utc)
+else:
+    build_time = datetime.datetime.now()
+# 動態生成 release (格式：12.x-%Y%m%d%H%M)；可重現建置時改為輸入的雜湊 (格式：12.x-<雜湊前 12 碼>)
+release = f"{version}-{os.environ.get('EPUB_BUILD_ID') or build_time.strftime('%Y%m%d%H%M')}"
 
 # 為專案和作者提供預設值，主要為了讓靜態分析工具能夠識別
 # 這些值會被 conf_color.py / conf_grayscale.py 中的定義所覆寫
@@ -28,7 +33,15 @@ epub_author = author
 # Using myst_parser for modern Markdown support in Sphinx
 extensions = [
     'myst_parser',
+    'preprocess',
     'torchlight',
+    'lexer_registry',
+    'image_optimizer',
+    'chapter_split',
+    'font_subsetter',
+    'epub_packager',
+    'asset_minifier',
+    'build_report',
 ]
 
 
@@ -41,6 +54,10 @@ source_suffix = {
 # 定義目錄索引的檔案
 master_doc = '_index'
 
+# 替 h1 ~ h4 標題產生錨點 (例如 `## Basic Usage` -> `#basic-usage`)，`page.md#anchor` 的連結才能解析；
+# preprocess 檢查連結時使用相同的層級 (preprocess_docs.py 的 --heading-anchors 預設值亦同)
+myst_heading_anchors = 4
+
 # 排除不需要的檔案和目錄
 exclude_patterns = [
     '_build',
@@ -65,24 +82,27 @@ epub_publisher = 'laradoc-trans-lab'
 epub_contributor = 'laradoc-trans-lab'
 epub_contributor_url = 'https://github.com/laradoc-trans-lab'
 epub_tocdepth = 2
-epub_build_date = f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}" # 建置日期
+epub_build_date = f"{build_time.strftime('%Y-%m-%d %H:%M')}" # 建置日期
 
 
 # -- 修正不支援的 Highlighting --
-from pygments.lexers.templates import PhpLexer
-from pygments.lexers.templates import HtmlPhpLexer
-from pygments.lexers.configs import IniLexer
-from pygments.lexers.configs import BashLexer
-from sphinx.highlighting import lexers
-
-# -- blade 語法改為 PHP 語法 --
-lexers['blade'] = HtmlPhpLexer(linenos=True)
-# -- env 檔案語法改為 ini 語法 --
-lexers['env'] = IniLexer(linenos=True)
-# -- shell 語法改為 bash 語法 --
-lexers['shell'] = BashLexer(linenos=True)
-
-lexers['php-line'] = PhpLexer(startinline=True)
+# 程式碼區塊語言 -> Pygments lexer 名稱 (或 (名稱, 選項))，彩色與灰階版本共用。
+# 讀取前會先統計所有文件的程式碼區塊語言並印出，每種語言只在用到時建立一個 lexer；
+# 表中沒有、Pygments 也不認得的語言會在建置開始時一次列出，並以純文字顯示
+lexer_registry_aliases = {
+    # blade 語法改為 PHP 語法
+    'blade': 'html+php',
+    # Statamic 的 antlers 樣板
+    'antlers': 'html',
+    # env 檔案語法改為 ini 語法
+    'env': 'ini',
+    'dotenv': 'ini',
+    # shell 語法改為 bash 語法
+    'shell': 'bash',
+    'txt': 'text',
+    # 沒有 <?php 開頭的 PHP 程式碼 (php_tag_handler)
+    'php-line': ('php', {'startinline': True}),
+}
 
 
 # ---- 目錄設定 ----
@@ -94,6 +114,77 @@ html_static_path = ['_source/_static']
 html_codeblock_linenos_style = 'inline'
 
 
+# ---- Markdown 預處理 ----
+# 原始 Markdown 會原樣複製到 _source (只複製有變動的檔案)，Sphinx 讀取文件時直接在記憶體中執行 bin/processors 的處理器，
+# 不需先以 preprocess_docs.py 產生修正後的副本
+# 原始 Markdown 所在目錄 (相對於本設定檔所在目錄)，設為 None 則停用，改用 preprocess_docs.py 的輸出
+preprocess_source_dir = '../source'
+# 下載的圖片存放於此目錄下 (依 _source 的位置區分)，並加入 html_static_path，不寫入 _source
+preprocess_cache_dir = str(Path(__file__).parent / '..' / '.cache' / 'preprocess')
+# 離線模式：不連網，圖片完全從快取取得
+preprocess_offline = False
+# 讀取前以整個文件集的頁面與錨點索引檢查內部連結，失效的連結會列為警告；
+# 設為 True 則有任何失效連結時建置失敗
+preprocess_strict_links = False
+
+
+# ---- 程式碼高亮快取 ----
+# 高亮結果只使用 CSS class，與 pygments_style 無關，彩色與灰階版本共用同一份快取
+torchlight_cache_dir = str(Path(__file__).parent / '..' / '.cache' / 'highlight')
+torchlight_cache_max_bytes = 64 * 1024 * 1024
+# 程式碼區塊的標記方式，可在 conf_color.py / conf_grayscale.py 依版本覆寫：
+#  - 'full': 每行的行號與程式碼各有自己的 span，空白轉為 &#160;，相容性最好
+#  - 'compact': 每行只有一個 span，行號以 CSS counter 產生、空白以 white-space 保留，
+#    程式碼區塊的 HTML 約小一半 (以 benchmarks/bench_code_markup.py 比較)，但閱讀器需支援 ::before 與 counter
+torchlight_markup = 'full'
+
+
+# ---- 建置計時報告 ----
+# 設定檔名 (相對於輸出目錄，例如 'build-report.json') 即記錄各階段、各文件與各程式碼區塊的耗時，
+# 寫成 JSON 並印出最慢的項目；None 則完全停用 (不掛上任何事件)
+build_report_path = None
+
+
+# ---- 章節分割 ----
+# 較大的頁面在打包前分割成數個 XHTML 檔 (依序加入 spine)，電子閱讀器翻頁與開啟章節時只需排版較小的檔案；
+# 目錄、錨點與跨頁連結會指向錨點實際所在的檔案
+chapter_split_enabled = True
+# 可作為分割點的標題層級 (2 表示只在 `##` 標題處分割，3 則 `###` 也可以)
+chapter_split_level = 2
+# 每個檔案的大小上限 (整個檔案的 UTF-8 位元組，含每個檔案重複的 <head> 與頁首頁尾)，超過的頁面才分割，並盡量把相鄰的章節放在同一個檔案；
+# 設為 None 則每個分割層級的標題都另起一個檔案
+chapter_split_max_bytes = 100 * 1024
+
+
+# ---- EPUB 瘦身 ----
+# 打包後重新整理 EPUB：壓縮 XHTML 與 CSS 的空白 (<pre> 內不變)、移除頁面中沒有用到的 class / id 的 CSS 規則
+# (例如大部分的 Pygments token 樣式)、移除重複與沒有被參照的檔案，並印出每個檔案處理前後的大小
+asset_minifier_enabled = True
+# 設為 False 則只壓縮空白，不移除 CSS 規則
+asset_minifier_prune_css = True
+
+
+# ---- EPUB 封裝 ----
+# 以多個 thread 同時壓縮文字檔 (XHTML、CSS ...) 後依固定順序寫入 EPUB，mimetype 與已壓縮的圖片、字型直接存放不再壓縮
+epub_packager_enabled = True
+# 文字檔的 deflate 壓縮層級 (0 ~ 9)，越高檔案越小但越慢，以 benchmarks/bench_epub_packager.py 比較
+epub_packager_level = 6
+# 壓縮使用的 thread 數量，0 為 CPU 數
+epub_packager_jobs = 0
+
+
+# ---- 圖片最佳化 (需安裝 Pillow) ----
+# 依各版本的設定縮小解析度、重新壓縮圖片，結果依來源雜湊快取，彩色與灰階版本各自一份
+# 各版本的參數於 conf_color.py / conf_grayscale.py 設定
+image_optimizer_cache_dir = str(Path(__file__).parent / '..' / '.cache' / 'image_optimizer')
+
+
+# ---- 內嵌字型子集 (需安裝 fontTools) ----
+# 依各版本的設定 (conf_color.py / conf_grayscale.py) 將本機的字型縮減為書中實際用到的字元後內嵌，
+# 結果依字型與字元集合的雜湊快取
+font_subsetter_cache_dir = str(Path(__file__).parent / '..' / '.cache' / 'font_subsetter')
+
+
 
 
 
@@ -17,9 +17,28 @@ epub_author = author
 # 原本的 grayscale 並非真正灰階，修正為符合 eink 螢幕特性使字形能以 300PPI 呈現
 epub_css_files = ['custom.css' , 'grayscale-eink.css']
 
+# -- 程式碼區塊標記，閱讀器支援 CSS counter 時可改為 'compact' 減少頁面大小 --
+torchlight_markup = 'full'
+
 # -- 封面圖檔 --
 epub_cover = ('_static/cover-grayscale.png','cover.html')
 
+# -- 圖片最佳化：轉為 16 階灰階，寬度上限為常見 6 吋 eink 閱讀器的 1072px --
+image_optimizer_enabled = True
+image_optimizer_grayscale = True
+image_optimizer_colors = 16
+image_optimizer_max_width = 1072
+image_optimizer_max_bytes = 150 * 1024
+
+# -- 內嵌字型子集：許多 eink 閱讀器沒有好的中文字型，只內嵌書中用到的字元 (需安裝 fontTools) --
+# 將字型檔放在專案根目錄的 fonts 下 (路徑相對於本設定檔所在目錄) 後改為 True；
+# 'selector' 為套用字型的 CSS 選擇器 (預設 body)，'fallback' 為字型缺字時的後備字型，.ttc 可以 'index' 指定第幾個字型
+font_subsetter_enabled = False
+font_subsetter_fonts = [
+    {'path': '../fonts/NotoSansTC-Regular.otf', 'fallback': 'sans-serif'},
+    {'path': '../fonts/NotoSansMonoCJKtc-Regular.otf', 'selector': 'code, pre', 'fallback': 'monospace'},
+]
+
 # EPUB 專用排除設定
 epub_exclude_files = [
     'search.html',
@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 與 bin/ 下的程式相同，以 `processors` 匯入處理器；Sphinx 擴充套件與 conf.py 相同，以模組名稱匯入
+sys.path.insert(0, os.path.join(ROOT, 'bin'))
+sys.path.insert(0, os.path.join(ROOT, 'sphinx_extensions'))
@@ -0,0 +1,129 @@
+import zipfile
+
+from asset_minifier import UsedNames, may_match, minify_css, minify_epub, minify_xhtml, parse_css, used_names
+from epub_packager import Entry, write_epub
+
+USED = UsedNames({'highlight', 'tl', 'hll', 'x'}, {'main'})
+
+
+def test_parses_nested_at_rules():
+    css = ('@import url("base.css");'
+           '@media screen and (min-width: 10em) { @supports (display: grid) { .tl { color: red } } p { margin: 0 } }'
+           'a { color: blue }')
+    items, end = parse_css(css)
+    assert end == len(css)
+    assert items == [
+        ('@import url("base.css")', None),
+        ('@media screen and (min-width: 10em)', [
+            ('@supports (display: grid)', [('.tl', ' color: red ')]),
+            ('p', ' margin: 0 '),
+        ]),
+        ('a', ' color: blue '),
+    ]
+    assert minify_css(css, USED) == ('@import url("base.css");@media screen and (min-width: 10em)'
+                                     '{@supports (display: grid){.tl{color:red}}p{margin:0}}a{color:blue}')
+
+
+def test_drops_at_rules_left_empty():
+    css = '@media print { .unused { color: red } } @supports (display: grid) { @media print { #nav { top: 0 } } }'
+    assert minify_css(css, USED) == ''
+    # Without pruning every rule is kept
+    assert minify_css(css, None) == ('@media print{.unused{color:red}}'
+                                     '@supports (display: grid){@media print{#nav{top:0}}}')
+
+
+def test_keeps_keyframes():
+    css = '@keyframes fade { from { opacity: 0 } 50% { opacity: .5 } to { opacity: 1 } } .x { animation: fade 1s }'
+    assert minify_css(css, USED) == '@keyframes fade{from{opacity:0}50%{opacity:.5}to{opacity:1}}.x{animation:fade 1s}'
+
+
+def test_strings_may_hold_braces_and_semicolons():
+    css = ('.x::before { content: "{;}" ; font-family: \'a } b\' }  /* "not a string */'
+           '.unused::after { content: "}" } p { quotes: "\\"" "\'" }')
+    items, _ = parse_css(css.replace('/* "not a string */', ''))
+    assert [prelude for prelude, _body in items] == ['.x::before', '.unused::after', 'p']
+    assert minify_css(css, USED) == '.x::before{content:"{;}";font-family:\'a } b\'}p{quotes:"\\"" "\'"}'
+    # The space next to a string can be a descendant combinator
+    css = '.x[title="a b"]  p { background: url( "x.png" ) }'
+    assert minify_css(css, USED) == '.x[title="a b"] p{background:url("x.png")}'
+
+
+def test_selector_pruning():
+    assert may_match('.tl .hll', USED)
+    assert not may_match('.tl .unused', USED)
+    assert may_match('#main > p', USED)
+    assert not may_match('#nav a', USED)
+    # Classes inside :not() and attribute selectors are not required
+    assert may_match('p:not(.unused)', USED)
+    assert may_match('a[href$=".pdf"]', USED)
+    assert may_match('a[class~="unused"]', USED)
+    assert not may_match('a[href].unused', USED)
+    # Escaped and complex selectors are never pruned
+    assert may_match('.md\\:flex', USED)
+    assert may_match(':is(.unused, .other) p', USED)
+    assert minify_css('.unused, .tl > span , p:not(.x) { color: red }', USED) == '.tl>span,p:not(.x){color:red}'
+
+
+def test_used_names():
+    pages = ['<div class="highlight tl" id="main"><span class="hll">x</span></div>', '<p id="intro">y</p>']
+    assert used_names(pages) == UsedNames({'highlight', 'tl', 'hll'}, {'main', 'intro'})
+
+
+def test_preserves_preformatted_text():
+    pre = '<pre>  if (a) {\n\n      b();\n  }  &#160;&quot;x&quot;\n</pre>'
+    torchlight = ('<pre class="tl"><code><span class="line"><span class="line-number">  1</span>'
+                  '    <span class="k">echo</span>   1;</span>\n<!-- kept -->\n\n</code></pre>')
+    page = (f'<body>\n\n  <p>one   two\n\n   three</p>  <!-- dropped -->\n'
+            f'{pre}\n   {torchlight}  <p>a&#160;b</p>\n</body>')
+    minified = minify_xhtml(page)
+    assert pre in minified
+    assert torchlight in minified
+    assert minified == f'<body>\n<p>one two\nthree</p> \n{pre}\n{torchlight} <p>a\xa0b</p>\n</body>'
+
+
+def _epub(path, files):
+    entries = [Entry('mimetype', b'application/epub+zip')]
+    entries.extend(Entry(name, data.encode('utf-8') if isinstance(data, str) else data) for name, data in files.items())
+    write_epub(str(path), entries, date_time=(2024, 1, 1, 0, 0, 0))
+
+
+def test_rewrites_references_to_duplicate_assets(tmp_path):
+    path = tmp_path / 'book.epub'
+    image = b'\x89PNG same image'
+    opf = ('<package><metadata><meta name="cover" content="cover-image"/></metadata><manifest>\n'
+           '  <item id="page" href="chapter/page.xhtml" media-type="application/xhtml+xml"/>\n'
+           '  <item id="style" href="_static/style.css" media-type="text/css"/>\n'
+           '  <item id="a" href="_static/a.png" media-type="image/png"/>\n'
+           '  <item id="b" href="_static/images/b.png" media-type="image/png"/>\n'
+           '  <item id="cover-image" href="_static/cover.png" media-type="image/png"/>\n'
+           '  <item id="unused" href="_static/unused.png" media-type="image/png"/>\n'
+           '</manifest></package>')
+    page = ('<html><head><link href="../_static/style.css" rel="stylesheet"/></head>'
+            '<body><img src="../_static/a.png"/><img src="../_static/images/b.png"/></body></html>')
+    _epub(path, {
+        'content.opf': opf,
+        'chapter/page.xhtml': page,
+        '_static/style.css': 'body { background: url("images/b.png") }',
+        '_static/a.png': image,
+        '_static/images/b.png': image,
+        '_static/cover.png': image,
+        '_static/unused.png': b'\x89PNG other image',
+    })
+
+    reports = {report.name: report for report in minify_epub(str(path))}
+    assert reports['_static/images/b.png'].note == 'duplicate of _static/a.png'
+    assert reports['_static/unused.png'].note == 'unreferenced'
+    # The cover is referenced by its manifest id
+    assert '_static/cover.png' not in reports
+
+    with zipfile.ZipFile(path) as epub:
+        assert epub.testzip() is None
+        names = epub.namelist()
+        assert names == ['mimetype', 'content.opf', 'chapter/page.xhtml', '_static/style.css', '_static/a.png',
+                         '_static/cover.png']
+        page = epub.read('chapter/page.xhtml').decode('utf-8')
+        assert page.count('src="../_static/a.png"') == 2
+        assert epub.read('_static/style.css') == b'body{background:url("a.png")}'
+        opf = epub.read('content.opf').decode('utf-8')
+        assert 'images/b.png' not in opf and 'unused.png' not in opf
+        assert 'href="_static/cover.png"' in opf
@@ -0,0 +1,49 @@
+import os
+import shutil
+import sys
+
+from build_epub import read_config, reproducible_inputs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VARIANTS = ['color', 'grayscale']
+
+
+def _workspace(tmp_path):
+    """Same layout as the project: book (the template), source and the fonts the grayscale version embeds."""
+    shutil.copytree(os.path.join(ROOT, 'template', '12.x'), tmp_path / 'book')
+    (tmp_path / 'source').mkdir()
+    (tmp_path / 'source' / 'routing.md').write_text('# Routing\n', encoding='utf-8')
+    (tmp_path / 'fonts').mkdir()
+    for name in ('NotoSansTC-Regular.otf', 'NotoSansMonoCJKtc-Regular.otf'):
+        (tmp_path / 'fonts' / name).write_bytes(b'font')
+    return str(tmp_path / 'source'), str(tmp_path / 'book')
+
+
+def test_hashes_fonts_outside_the_book(tmp_path):
+    source_dir, confdir = _workspace(tmp_path)
+    inputs = reproducible_inputs(source_dir, confdir, VARIANTS)
+    color = reproducible_inputs(source_dir, confdir, ['color'])
+    assert reproducible_inputs(source_dir, confdir, VARIANTS) == inputs
+
+    (tmp_path / 'fonts' / 'NotoSansTC-Regular.otf').write_bytes(b'other font')
+    changed = reproducible_inputs(source_dir, confdir, VARIANTS)
+    assert changed != inputs
+    # Only the grayscale version embeds the fonts
+    assert reproducible_inputs(source_dir, confdir, ['color']) == color
+
+    (tmp_path / 'fonts' / 'NotoSansTC-Regular.otf').unlink()
+    assert reproducible_inputs(source_dir, confdir, VARIANTS) not in (inputs, changed)
+
+
+def test_reading_the_config_leaves_no_modules_behind(tmp_path, monkeypatch):
+    _, confdir = _workspace(tmp_path)
+    monkeypatch.delenv('SPHINX_CUSTOM_CONFIG', raising=False)
+    path = list(sys.path)
+
+    config = read_config(confdir, 'grayscale')
+    assert [font['path'] for font in config['font_subsetter_fonts']] == [
+        '../fonts/NotoSansTC-Regular.otf', '../fonts/NotoSansMonoCJKtc-Regular.otf']
+    # The build imports the configuration again, e.g. with the release derived from the inputs
+    assert not any(name.startswith('conf_') for name in sys.modules)
+    assert sys.path == path
+    assert 'SPHINX_CUSTOM_CONFIG' not in os.environ
@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+
+from chapter_split import ChapterSplitter, split_xhtml
+
+HEAD = '<html><body><div class="body" role="main">'
+TAIL = '</div></body></html>'
+
+
+def _section(number: int, size: int) -> str:
+    return f'<section id="sec-{number}"><h2>Section {number}</h2><p>{"x" * size}</p></section>'
+
+
+def _splitter(tmp_path, pages: dict[str, str]) -> ChapterSplitter:
+    for docname, text in pages.items():
+        path = tmp_path / f"{docname}.xhtml"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf-8')
+    builder = SimpleNamespace(outdir=str(tmp_path), out_suffix='.xhtml', env=SimpleNamespace(found_docs=set(pages)))
+    return ChapterSplitter(builder, {'level': 2, 'max_bytes': 1000}, str(tmp_path / 'state.json'), {})
+
+
+def test_records_the_final_size_of_every_page(tmp_path):
+    splitter = _splitter(tmp_path, {
+        'routing': HEAD + ''.join(_section(number, 600) for number in range(1, 4))
+        + '<p><a href="views.xhtml#sec-1">views</a></p>' + TAIL,
+        'views': HEAD + _section(1, 100) + '<p><a href="routing.xhtml#sec-3">routing</a></p>' + TAIL,
+    })
+    splitter.split_documents()
+
+    assert set(splitter.sizes) == {'routing', 'views'}
+    assert set(splitter.sizes['routing']) == {'routing.xhtml', 'routing-part2.xhtml', 'routing-part3.xhtml'}
+    # Sizes are taken after the links are rewritten (views now links to routing-part3.xhtml)
+    for files in splitter.sizes.values():
+        for name, size in files.items():
+            assert size == (tmp_path / name).stat().st_size
+    assert splitter.documents['routing']['sizes'] == [
+        splitter.sizes['routing'][name] for name in splitter.documents['routing']['parts']]
+
+    largest = splitter.largest_parts()
+    assert largest['views'] == ('views.xhtml', splitter.sizes['views']['views.xhtml'])
+    assert largest['routing'][1] == max(splitter.sizes['routing'].values())
+
+
+
+def _page(*sections: str, head: str = HEAD) -> str:
+    return head + '<section id="routing"><h1>Routing</h1>' + ''.join(sections) + '</section>' + TAIL
+
+
+def test_parts_fit_the_budget_with_the_repeated_head():
+    head = ('<html><head><title>Routing</title><link href="_static/epub.css" rel="stylesheet"/>'
+            f'<style>{"p{margin:0}" * 40}</style></head><body><div class="body" role="main">')
+    # Multibyte text: the budget is counted in UTF-8 bytes
+    page = _page(*(f'<section id="sec-{number}"><h2>{number}</h2><p>{"路由" * 100}</p></section>'
+                   for number in range(1, 9)), head=head)
+    parts = split_xhtml(page, 2, 2000)
+    assert len(parts) == 4
+    for part, _ids in parts:
+        assert len(part.encode('utf-8')) <= 2000
+        assert part.startswith(head) and part.endswith(TAIL)
+    # Every section is in exactly one file, in order
+    assert [id for _part, ids in parts for id in ids] == ['routing', *(f'sec-{number}' for number in range(1, 9))]
+
+    assert split_xhtml(page, 2, len(page.encode('utf-8'))) == [(page, [])]
+
+
+def test_reopens_the_enclosing_sections_without_their_ids():
+    page = _page(_section(1, 10), _section(2, 10))
+    assert split_xhtml(page, 2, None) == [
+        (HEAD + '<section id="routing"><h1>Routing</h1></section>' + TAIL, ['routing']),
+        (HEAD + '<section>' + _section(1, 10) + '</section>' + TAIL, ['sec-1']),
+        (HEAD + '<section>' + _section(2, 10) + '</section>' + TAIL, ['sec-2']),
+    ]
+    # Sections of a deeper level stay in their file
+    assert len(split_xhtml(_page(_section(1, 10).replace('h2', 'h3')), 2, None)) == 1
+
+
+def test_moves_anchors_before_a_heading_to_its_file():
+    first_section = '<section id="sec-1"><h2>Section 1</h2><p><a name="views"></a></p>\n<p>x</p>\n'
+    anchors = '<p><a name="redirects"></a></p>\n<p><a name="redirect-routes"></a></p>\n'
+    page = _page(first_section + anchors + '</section>', _section(2, 10))
+    (_first, _ids), (second, second_ids), (third, third_ids) = split_xhtml(page, 2, None)
+    # The anchor inside the section stays, the ones just before the next heading move
+    assert second == HEAD + '<section>' + first_section + '</section></section>' + TAIL
+    assert second_ids == ['sec-1', 'views']
+    assert third == HEAD + '<section>' + anchors + _section(2, 10) + '</section>' + TAIL
+    assert third_ids == ['redirects', 'redirect-routes', 'sec-2']
+
+
+def test_points_links_and_the_table_of_contents_at_the_split_files(tmp_path):
+    links = '<p><a href="#sec-1">1</a><a href="#sec-2">2</a><a href="#sec-3">3</a><a href="#missing">?</a></p>'
+    splitter = _splitter(tmp_path, {
+        'routing': _page(_section(1, 600), _section(2, 600) + links, _section(3, 600)),
+        'guide/views': HEAD + '<p><a href="../routing.xhtml#sec-3">a</a><a href="../routing.xhtml#routing">b</a>'
+                       '<a href="../routing.xhtml">c</a><a href="https://laravel.com/docs/routing#sec-3">d</a>'
+                       '<a href="#top">e</a></p>' + TAIL,
+    })
+    splitter.split_documents()
+
+    entry = splitter.documents['routing']
+    assert entry['parts'] == ['routing.xhtml', 'routing-part2.xhtml', 'routing-part3.xhtml']
+    assert entry['ids'] == {'sec-2': 1, 'sec-3': 2}
+    assert 'guide/views' not in splitter.documents
+
+    second = (tmp_path / 'routing-part2.xhtml').read_text(encoding='utf-8')
+    assert ('<a href="routing.xhtml#sec-1">1</a><a href="#sec-2">2</a><a href="routing-part3.xhtml#sec-3">3</a>'
+            '<a href="routing.xhtml#missing">?</a>') in second
+    views = (tmp_path / 'guide' / 'views.xhtml').read_text(encoding='utf-8')
+    assert ('<a href="../routing-part3.xhtml#sec-3">a</a><a href="../routing.xhtml#routing">b</a>'
+            '<a href="../routing.xhtml">c</a><a href="https://laravel.com/docs/routing#sec-3">d</a>'
+            '<a href="#top">e</a>') in views
+
+    refnodes = [
+        {'level': 1, 'refuri': 'routing.xhtml', 'text': 'Routing'},
+        {'level': 2, 'refuri': 'routing.xhtml#sec-1', 'text': 'Section 1'},
+        {'level': 2, 'refuri': 'routing.xhtml#sec-3', 'text': 'Section 3'},
+        {'level': 1, 'refuri': 'guide/views.xhtml', 'text': 'Views'},
+        {'level': 2, 'refuri': 'guide/views.xhtml#top', 'text': 'Top'},
+    ]
+    splitter.update_refnodes(refnodes)
+    assert [(refnode['refuri'], refnode['text']) for refnode in refnodes] == [
+        ('routing.xhtml', 'Routing'),
+        ('routing-part2.xhtml', ''),
+        ('routing-part3.xhtml', ''),
+        ('routing.xhtml#sec-1', 'Section 1'),
+        ('routing-part3.xhtml#sec-3', 'Section 3'),
+        ('guide/views.xhtml', 'Views'),
+        ('guide/views.xhtml#top', 'Top'),
+    ]
+    assert all(refnode['level'] == 1 for refnode in refnodes[1:3])
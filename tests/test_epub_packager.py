@@ -0,0 +1,96 @@
+import os
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from epub_packager import Entry, build_date_time, write_epub
+
+DATE_TIME = (2024, 3, 1, 12, 30, 10)
+
+
+def _entries(tmp_path) -> list[Entry]:
+    image = tmp_path / 'logo.png'
+    image.write_bytes(b'\x89PNG' + b'\x00' * 4096)
+    entries = [
+        Entry('mimetype', b'application/epub+zip'),
+        Entry('META-INF/container.xml', b'<container>' + b'<rootfile/>' * 20 + b'</container>'),
+        Entry('_static/logo.png', str(image)),
+        # Random bytes do not deflate
+        Entry('_static/noise.txt', os.urandom(2048)),
+        Entry('_static/tiny.css', b'p{}'),
+        Entry('_static/forced.css', b'p{margin:0}' * 50, stored=True),
+        Entry('_static/font.woff2', b'\x00' * 2048, stored=False),
+        Entry('中文.xhtml', '路由'.encode('utf-8') * 500),
+    ]
+    # More entries than the window of one thread, so some are written while others are pending
+    entries.extend(Entry(f"chapter-{number:02}.xhtml", f"<p>{number}</p>".encode() * 100) for number in range(20))
+    return entries
+
+
+def test_writes_a_valid_epub(tmp_path):
+    entries = _entries(tmp_path)
+    path = str(tmp_path / 'book.epub')
+    stats = write_epub(path, entries, jobs=2, date_time=DATE_TIME)
+
+    with zipfile.ZipFile(path) as epub:
+        assert epub.testzip() is None
+        infos = epub.infolist()
+        assert [info.filename for info in infos] == [entry.name for entry in entries]
+        methods = {info.filename: info.compress_type for info in infos}
+        for entry in entries:
+            data = entry.source if isinstance(entry.source, bytes) else Path(entry.source).read_bytes()
+            assert epub.read(entry.name) == data
+    # The mimetype is the first entry, stored, with no extra field (EPUB OCF)
+    with open(path, 'rb') as f:
+        assert f.read(58)[30:] == b'mimetypeapplication/epub+zip'
+    assert infos[0].compress_type == zipfile.ZIP_STORED and infos[0].extra == b''
+
+    assert methods['_static/logo.png'] == zipfile.ZIP_STORED
+    # Incompressible text falls back to stored; so does a file too small to gain anything
+    assert methods['_static/noise.txt'] == zipfile.ZIP_STORED
+    assert methods['_static/tiny.css'] == zipfile.ZIP_STORED
+    assert methods['_static/forced.css'] == zipfile.ZIP_STORED
+    assert methods['_static/font.woff2'] == zipfile.ZIP_DEFLATED
+    assert methods['中文.xhtml'] == zipfile.ZIP_DEFLATED
+    assert methods['chapter-00.xhtml'] == zipfile.ZIP_DEFLATED
+    assert infos[-1].date_time == DATE_TIME
+    assert infos[0].external_attr == 0o100644 << 16
+
+    assert stats.entries == len(entries)
+    assert stats.stored == 5
+    assert stats.size_out == os.path.getsize(path)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+
+def test_identical_inputs_give_identical_archives(tmp_path):
+    entries = _entries(tmp_path)
+    first, second, third = (str(tmp_path / f"{name}.epub") for name in ('first', 'second', 'third'))
+    write_epub(first, entries, jobs=1, date_time=DATE_TIME)
+    # A file's mtime is not used when date_time is given
+    os.utime(tmp_path / 'logo.png', (0, 1_000_000_000))
+    write_epub(second, entries, jobs=4, date_time=DATE_TIME)
+    with open(first, 'rb') as f, open(second, 'rb') as g:
+        assert f.read() == g.read()
+
+    write_epub(third, entries, jobs=1, date_time=(2025, 1, 1, 0, 0, 0))
+    with open(first, 'rb') as f, open(third, 'rb') as g:
+        assert f.read() != g.read()
+
+    # Entries keep their own time, and times before 1980 are clamped
+    write_epub(third, [Entry('a.txt', b'a', date_time=(2001, 2, 3, 4, 5, 6)), Entry('b.txt', b'b')],
+               date_time=(1970, 1, 1, 0, 0, 0))
+    with zipfile.ZipFile(third) as epub:
+        assert [info.date_time for info in epub.infolist()] == [(2001, 2, 3, 4, 5, 6), (1980, 1, 1, 0, 0, 0)]
+
+
+def test_rejects_invalid_levels(tmp_path):
+    with pytest.raises(ValueError):
+        write_epub(str(tmp_path / 'book.epub'), [], level=10)
+
+
+def test_build_date_time(monkeypatch):
+    monkeypatch.delenv('SOURCE_DATE_EPOCH', raising=False)
+    assert build_date_time() is None
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1709296210')
+    assert build_date_time() == DATE_TIME
@@ -0,0 +1,214 @@
+import zipfile
+
+import pytest
+
+from processors.epub_validator import Container, Issue, SourceLocator, check_package, check_page, validate
+
+CONTAINER_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+    '  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>\n'
+    '</container>\n'
+)
+
+
+def _opf(items: dict[str, str], spine: list[str]) -> str:
+    manifest = ''.join(f'    <item id="{id}" href="{href}" media-type="application/xhtml+xml"/>\n'
+                       for id, href in items.items())
+    itemrefs = ''.join(f'    <itemref idref="{idref}"/>\n' for idref in spine)
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0">\n'
+            f'  <manifest>\n{manifest}  </manifest>\n'
+            f'  <spine>\n{itemrefs}  </spine>\n'
+            '</package>\n')
+
+
+def _page(body: str) -> str:
+    return ('<?xml version="1.0" encoding="utf-8"?>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>t</title></head><body>\n'
+            f'{body}\n'
+            '</body></html>\n')
+
+
+def _write_epub(path, files: dict[str, str]) -> str:
+    with zipfile.ZipFile(path, 'w') as epub:
+        epub.writestr('mimetype', 'application/epub+zip')
+        epub.writestr('META-INF/container.xml', CONTAINER_XML)
+        for name, text in files.items():
+            epub.writestr(name, text)
+    return str(path)
+
+
+@pytest.fixture
+def book(tmp_path):
+    """A small EPUB with one problem of every kind (the OPF is not at the default location)."""
+    return _write_epub(tmp_path / 'book.epub', {
+        'OEBPS/content.opf': _opf({'routing': 'text/routing.xhtml', 'views': 'text/views.xhtml',
+                                   'broken': 'text/broken.xhtml', 'gone': 'text/gone.xhtml'},
+                                  ['routing', 'views', 'ghost']),
+        'OEBPS/text/routing.xhtml': _page(
+            '<p><a href="views.xhtml#passing-data">ok</a> <a href="#basic-routing">ok</a></p>\n'
+            '<h2 id="basic-routing">Basic Routing</h2>\n'
+            '<p><a href="views.xhtml#sharing-data">anchor</a></p>\n'
+            '<p><a href="#missing">self</a> <a href="../images/logo.png">unlisted</a></p>\n'
+            '<p><a href="middleware.xhtml">file</a> <a href="https://laravel.com/docs#x">external</a></p>\n'
+            '<p><a href="broken.xhtml#anything">not checked</a></p>'),
+        'OEBPS/text/views.xhtml': _page(
+            '<h2 id="passing-data">Passing Data</h2>\n'
+            '<p><a name="legacy"></a></p>\n'
+            '<pre><span id="passing-data">code</span></pre>'),
+        'OEBPS/text/broken.xhtml': _page('<p>line one<br>line two</p>'),
+        'OEBPS/images/logo.png': 'png',
+        'OEBPS/stray.css': 'p {}',
+    })
+
+
+def test_check_page_reports_malformed_tags():
+    result = check_page('broken.xhtml', _page('<p>ok</p>\n<p class="lead">line one<br>line two</p>').encode())
+    assert not result.well_formed
+    [issue] = result.issues
+    assert (issue.line, issue.kind) == (4, 'xml')
+    assert issue.message == 'mismatched tag (column 39)'
+    assert issue.excerpt == '<p class="lead">line one<br>line two</p>'
+    # The nearest start tag with attributes first, then the whole line
+    assert issue.needles == ['<p class="lead">', '<p class="lead">line one<br>line two</p>']
+    assert not issue.in_code
+
+
+def test_check_page_collects_ids_links_and_duplicates():
+    result = check_page('text/views.xhtml', _page(
+        '<h2 id="intro">Intro</h2><p><a name="legacy"></a><a href="../routing.xhtml#top">x</a></p>\n'
+        '<pre><code><span id="intro">1</span></code></pre>\n'
+        '<img src="../_static/logo%20dark.png"/><a href="http://example.com/">y</a>').encode())
+    assert result.well_formed
+    assert result.ids == {'intro', 'legacy'}
+    assert result.links == [
+        (3, 'routing.xhtml', 'top', '../routing.xhtml#top'),
+        (5, '_static/logo dark.png', '', '../_static/logo%20dark.png'),
+    ]
+    [issue] = result.issues
+    assert (issue.line, issue.kind) == (4, 'duplicate_id')
+    assert issue.message == 'duplicate id "intro" (first defined on line 3)'
+    assert issue.needles == ['id="intro"']
+    assert issue.occurrence == 1
+    assert issue.in_code
+
+
+def test_check_package(book):
+    container = Container(book)
+    try:
+        pages = [name for name in container.names if name.endswith('.xhtml')]
+        results = {name: check_page(name, container.read(name)) for name in pages}
+        issues = check_package(container, results)
+    finally:
+        container.close()
+
+    assert [(issue.page, issue.line, issue.kind, issue.message) for issue in issues] == [
+        ('OEBPS/content.opf', 0, 'missing_file', 'manifest item "gone" points to missing OEBPS/text/gone.xhtml'),
+        ('OEBPS/content.opf', 0, 'spine', 'spine refers to unknown manifest item "ghost"'),
+        ('OEBPS/text/routing.xhtml', 5, 'dangling_href',
+         '"views.xhtml#sharing-data": no id "sharing-data" in OEBPS/text/views.xhtml'),
+        ('OEBPS/text/routing.xhtml', 6, 'dangling_href', '"#missing": no id "missing" in OEBPS/text/routing.xhtml'),
+        ('OEBPS/text/routing.xhtml', 6, 'missing_file',
+         '"../images/logo.png": OEBPS/images/logo.png is not listed in the manifest'),
+        ('OEBPS/text/routing.xhtml', 7, 'dangling_href',
+         '"middleware.xhtml": OEBPS/text/middleware.xhtml does not exist'),
+        ('OEBPS/stray.css', 0, 'unlisted_file', 'packaged but not listed in the manifest'),
+    ]
+    assert (issues[2].target, issues[2].anchor) == ('OEBPS/text/views.xhtml', 'sharing-data')
+
+
+def test_validate_reads_a_build_directory(book, tmp_path):
+    report = validate(book, jobs=2)
+    assert report.pages == 3
+    kinds = [issue.kind for issue in report.issues]
+    assert kinds.count('xml') == 1 and kinds.count('duplicate_id') == 1 and 'unlisted_file' in kinds
+
+    # The unpacked build output: files that are not packaged are not reported
+    outdir = tmp_path / 'epub'
+    with zipfile.ZipFile(book) as epub:
+        epub.extractall(outdir)
+    (outdir / '.buildinfo').write_text('x', encoding='utf-8')
+    directory_report = validate(str(outdir))
+    assert [str(issue) for issue in directory_report.issues] == [
+        str(issue) for issue in report.issues if issue.kind != 'unlisted_file']
+
+
+SOURCES = {
+    'images': (
+        '# Images\n'
+        '\n'
+        'The logo:\n'
+        '\n'
+        '<img src="https://laravel.com/img/logo.png">\n'
+        '\n'
+        '<div id="intro">Intro</div>\n'
+    ),
+    'routing': (
+        '# Routing\n'
+        '\n'
+        'See [data](/docs/{{version}}/views#passing-data) and [gone](/docs/{{version}}/views#gone).\n'
+    ),
+    'views': (
+        '# Views\n'
+        '\n'
+        '<a name="passing-data"></a>\n'
+        '## Passing Data\n'
+    ),
+}
+
+
+@pytest.fixture
+def locator(tmp_path):
+    source_dir = tmp_path / 'source'
+    source_dir.mkdir()
+    for document, content in SOURCES.items():
+        (source_dir / f"{document}.md").write_text(content, encoding='utf-8')
+    return SourceLocator(str(source_dir))
+
+
+def test_blames_the_first_stage_producing_the_needle(locator):
+    # Closed by rewrite_images: not in the Markdown as written
+    assert locator._blame('images', ['<img src="https://laravel.com/img/logo.png" />']) == (
+        5, 'image_handler.rewrite_images')
+    # In the Markdown itself
+    assert locator._blame('images', ['id="intro"']) == (7, None)
+    # A local path instead of the URL still matches the tag, in the source
+    assert locator._blame('images', ['<img src="_static/laravel/logo.png"/>']) == (5, None)
+    assert locator._blame('images', ['<section id="images">']) == (None, None)
+
+
+def test_locates_issues_in_the_source(locator):
+    issue = Issue('images.xhtml', 12, 'xml', 'mismatched tag',
+                  needles=['<img src="https://laravel.com/img/logo.png" />'])
+    locator.locate(issue)
+    assert (issue.source, issue.source_line, issue.processor) == ('images.md', 5, 'image_handler.rewrite_images')
+
+    # Not from a fragment of the Markdown: myst's conversion, or torchlight's inside code blocks
+    issue = Issue('images-part2.xhtml', 3, 'duplicate_id', 'duplicate id', needles=['<section id="images">'])
+    locator.locate(issue)
+    assert (issue.source, issue.source_line, issue.processor) == ('images.md', None, 'myst_parser')
+    issue = Issue('images.xhtml', 3, 'xml', 'mismatched tag', needles=['<span class="line">'], in_code=True)
+    locator.locate(issue)
+    assert issue.processor == 'torchlight'
+
+    # Pages without a Markdown document are not located
+    issue = Issue('genindex.xhtml', 3, 'xml', 'mismatched tag', needles=['id="intro"'])
+    locator.locate(issue)
+    assert issue.source is None
+
+
+def test_locates_dangling_anchors(locator):
+    # The Markdown link already points at a missing anchor: a problem of the source
+    issue = Issue('routing.xhtml', 9, 'dangling_href', '', target='views.xhtml', anchor='gone')
+    assert locator._locate_link(issue, 'routing')
+    assert (issue.source_line, issue.processor) == (3, None)
+
+    # The Markdown link is fine: the rewritten link is wrong
+    issue = Issue('routing.xhtml', 9, 'dangling_href', '', target='views.xhtml', anchor='passing-data')
+    locator.locate(issue)
+    assert (issue.source, issue.source_line, issue.processor) == ('routing.md', 3, 'link_handler.process_links')
+
+    # No such link in the Markdown: blamed like other issues
+    issue = Issue('routing.xhtml', 9, 'dangling_href', '', target='routing.xhtml', anchor='top')
+    assert not locator._locate_link(issue, 'routing')
@@ -0,0 +1,99 @@
+"""
+Subsetting of the embedded fonts with fontTools (skipped when it is not installed).
+
+The fixture tests/fixtures/fonts/subset-test.ttf is a small TrueType font with a square glyph
+for a few ASCII and CJK characters; regenerate it with:
+
+    python3 tests/test_font_subsetter.py --update
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(ROOT, 'tests', 'fixtures', 'fonts', 'subset-test.ttf')
+
+# Also run directly (--update), without conftest.py
+sys.path.insert(0, os.path.join(ROOT, 'sphinx_extensions'))
+
+import font_subsetter
+from font_subsetter import EmbeddedFont
+
+CHARACTERS = 'ABZ 中文字體繁簡'
+USED = 'A 中文'
+
+
+def build_fixture(path: str) -> None:
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    names = {character: f"uni{ord(character):04X}" for character in CHARACTERS}
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(['.notdef', *names.values()])
+    builder.setupCharacterMap({ord(character): name for character, name in names.items()})
+    glyphs, metrics = {}, {}
+    for name in ['.notdef', *names.values()]:
+        pen = TTGlyphPen(None)
+        if name != 'uni0020':
+            pen.moveTo((100, 0))
+            pen.lineTo((100, 700))
+            pen.lineTo((900, 700))
+            pen.lineTo((900, 0))
+            pen.closePath()
+        glyphs[name] = pen.glyph()
+        metrics[name] = (1000, 100)
+    builder.setupGlyf(glyphs)
+    builder.setupHorizontalMetrics(metrics)
+    builder.setupHorizontalHeader(ascent=880, descent=-120)
+    builder.setupNameTable({'familyName': 'Subset Test', 'styleName': 'Regular'})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.save(path)
+
+
+def _font() -> EmbeddedFont:
+    return EmbeddedFont('Subset Test', FIXTURE, 0, 'body', '', None)
+
+
+def test_keeps_only_the_requested_glyphs(tmp_path):
+    ttLib = pytest.importorskip('fontTools.ttLib')
+    output = str(tmp_path / 'subset.ttf')
+    font_subsetter.subset_font(FIXTURE, 0, USED, output)
+
+    with ttLib.TTFont(FIXTURE) as original, ttLib.TTFont(output) as subset:
+        assert set(original.getBestCmap()) == {ord(character) for character in CHARACTERS}
+        assert set(subset.getBestCmap()) == {ord(character) for character in USED}
+        assert len(subset.getGlyphOrder()) < len(original.getGlyphOrder())
+        # The CJK glyphs keep their outlines
+        assert subset['glyf'][subset.getBestCmap()[ord('中')]].numberOfContours == 1
+    assert os.path.getsize(output) < os.path.getsize(FIXTURE)
+
+
+def test_reuses_the_cached_subset(tmp_path, monkeypatch):
+    pytest.importorskip('fontTools')
+    cache_dir = str(tmp_path / 'cache')
+    cached = font_subsetter._cached_subset(_font(), USED, cache_dir)
+    with open(cached, 'rb') as f:
+        data = f.read()
+
+    def fail(*args):
+        raise AssertionError('subset again')
+
+    monkeypatch.setattr(font_subsetter, 'subset_font', fail)
+    assert font_subsetter._cached_subset(_font(), USED, cache_dir) == cached
+    with open(cached, 'rb') as f:
+        assert f.read() == data
+
+    # Other characters are another subset
+    with pytest.raises(AssertionError):
+        font_subsetter._cached_subset(_font(), USED + '字', cache_dir)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['--update']:
+        sys.exit(__doc__)
+    os.makedirs(os.path.dirname(FIXTURE), exist_ok=True)
+    build_fixture(FIXTURE)
+    print(f"Updated {FIXTURE}")
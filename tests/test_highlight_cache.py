@@ -0,0 +1,105 @@
+import os
+
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import PhpLexer
+
+from highlight_cache import STATS_DIRNAME, HighlightCache
+
+SOURCE = '$user = User::find(1);'
+
+
+class TorchlightFormatter(HtmlFormatter):
+    pass
+
+
+def _cache(tmp_path, max_bytes: int = 1024 * 1024, formatter_version: str = '1') -> HighlightCache:
+    return HighlightCache(str(tmp_path / 'cache'), max_bytes, formatter_version)
+
+
+def _key(cache: HighlightCache, source: str = SOURCE, lexer=None, formatter_class=HtmlFormatter,
+         formatter_args: dict | None = None, opts: dict | None = None) -> str:
+    args = {'style': 'friendly', 'nowrap': False} if formatter_args is None else formatter_args
+    return cache.key(source, 'php', lexer, formatter_class, args, opts, False, {'location': 'routing.md:3'})
+
+
+def test_key(tmp_path):
+    cache = _cache(tmp_path)
+    key = _key(cache)
+    assert key == _key(_cache(tmp_path))
+    # The formatter only emits class names: the style does not matter
+    assert _key(cache, formatter_args={'style': 'monokai', 'nowrap': False}) == key
+
+    assert _key(cache, source=SOURCE + '\n') != key
+    assert _key(cache, formatter_class=TorchlightFormatter) != key
+    assert _key(cache, formatter_args={'style': 'friendly', 'nowrap': True}) != key
+    assert _key(cache, opts={'startinline': True}) != key
+    assert _key(_cache(tmp_path, formatter_version='2')) != key
+    # Custom lexers are told apart by their options
+    plain = _key(cache, lexer=PhpLexer())
+    assert plain not in (key, _key(cache, lexer=PhpLexer(startinline=True)))
+    assert plain == _key(cache, lexer=PhpLexer())
+
+
+def test_get_and_put(tmp_path):
+    cache = _cache(tmp_path)
+    key = _key(cache)
+    assert cache.get(key) is None
+    cache.put(key, '<div class="highlight">路由</div>')
+    assert cache.get(key) == '<div class="highlight">路由</div>'
+    # Shared with the next build
+    assert _cache(tmp_path).get(key) == '<div class="highlight">路由</div>'
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not [name for _root, _dirs, files in os.walk(cache.cache_dir) for name in files if name.endswith('.part')]
+
+
+def test_evicts_the_least_recently_used_entries(tmp_path):
+    previous = _cache(tmp_path)
+    keys = [_key(previous, source=f"echo {number};") for number in range(4)]
+    for key in keys:
+        previous.put(key, 'x' * 100)
+    # Last used by earlier builds, keys[2] least recently
+    for age, key in zip((3000, 2000, 4000, 1000), keys):
+        mtime = previous.started - age
+        os.utime(previous._path(key), (mtime, mtime))
+    stale = os.path.join(previous.cache_dir, 'ab', 'interrupted.part')
+    os.makedirs(os.path.dirname(stale), exist_ok=True)
+    with open(stale, 'w') as f:
+        f.write('x' * 1000)
+    os.utime(stale, (previous.started - 10, previous.started - 10))
+
+    cache = _cache(tmp_path, max_bytes=200)
+    cache.get(keys[0])
+    assert cache.evict() == (2, 200)
+    assert [os.path.exists(cache._path(key)) for key in keys] == [True, False, False, True]
+    assert not os.path.exists(stale)
+
+    # Entries used by this build are kept over the limit
+    cache = _cache(tmp_path, max_bytes=0)
+    cache.get(keys[3])
+    assert cache.evict() == (1, 100)
+    assert [os.path.exists(cache._path(key)) for key in keys] == [False, False, False, True]
+
+
+def test_collects_the_stats_of_every_process(tmp_path):
+    cache = _cache(tmp_path)
+    key = _key(cache)
+    cache.put(key, 'x')
+    cache.get(key)
+    children = []
+    for lookups in ([key, key, 'missing'], ['missing']):
+        pid = os.fork()
+        if pid == 0:
+            # A parallel write process: starts counting from zero
+            try:
+                for lookup in lookups:
+                    cache.get(lookup)
+                cache.flush_stats()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    for pid in children:
+        os.waitpid(pid, 0)
+    cache.get('missing')
+
+    assert cache.collect_stats() == (3, 3)
+    assert os.listdir(os.path.join(cache.cache_dir, STATS_DIRNAME)) == []
@@ -0,0 +1,108 @@
+"""
+The image cache against the local stub server of the benchmarks (benchmarks/stub_server.py), which
+answers a matching If-None-Match with 304 and serves fixed content per path.
+"""
+
+import os
+import sys
+
+import pytest
+import requests
+
+from processors.image_cache import ImageCache, ImageCacheMiss
+from processors.image_handler import fetch_images
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from stub_server import image_bytes, stub_server
+
+IMAGE_SIZE = len(image_bytes('/a.png'))
+
+
+@pytest.fixture
+def server():
+    with stub_server() as server:
+        yield server
+
+
+@pytest.fixture
+def session():
+    with requests.Session() as session:
+        yield session
+
+
+def test_revalidates_cached_images(tmp_path, server, session):
+    url = f"{server.base_url}/img/logo.png"
+    cache = ImageCache(str(tmp_path))
+    entry = cache.get(session, url)
+    cache.save()
+    assert entry['ext'] == '.png' and entry['size'] == IMAGE_SIZE and entry['etag']
+    with open(cache.blob_path(entry['blob']), 'rb') as f:
+        assert f.read() == image_bytes('/img/logo.png')
+
+    # The next build sends the ETag back and gets a 304 without the content
+    cache = ImageCache(str(tmp_path))
+    assert cache.get(session, url)['blob'] == entry['blob']
+    assert (server.request_count, server.transfer_count) == (2, 1)
+
+
+def test_offline_mode_never_connects(tmp_path, server, session):
+    url = f"{server.base_url}/img/logo.png"
+    with pytest.raises(ImageCacheMiss):
+        ImageCache(str(tmp_path), offline=True).get(session, url)
+    assert server.request_count == 0
+
+    cache = ImageCache(str(tmp_path))
+    entry = cache.get(session, url)
+    cache.save()
+    assert ImageCache(str(tmp_path), offline=True).get(session, url)['blob'] == entry['blob']
+    assert server.request_count == 1
+
+    # A miss is reported and the image left as it is
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    missing = 'https://laravel.com/img/not-cached.png'
+    assert fetch_images([missing], str(output_dir), cache=ImageCache(str(tmp_path), offline=True)) == {}
+    assert os.listdir(output_dir) == []
+
+
+def test_evicts_the_least_recently_used_images(tmp_path, server, session, capsys):
+    urls = [f"{server.base_url}/{name}.png" for name in ('a', 'b', 'c')]
+    cache = ImageCache(str(tmp_path))
+    blobs = [cache.get(session, url)['blob'] for url in urls]
+    cache.save()
+    assert sorted(os.listdir(tmp_path / 'blobs')) == sorted(blobs)
+
+    # Room for two images: a was added first but used last, so b goes
+    cache = ImageCache(str(tmp_path), max_bytes=2 * IMAGE_SIZE)
+    cache.get(session, urls[0])
+    cache.save()
+    assert sorted(os.listdir(tmp_path / 'blobs')) == sorted([blobs[0], blobs[2]])
+    assert 'Evicted 1 cached images' in capsys.readouterr().out
+    cache = ImageCache(str(tmp_path))
+    assert sorted(cache._entries) == [urls[0], urls[2]]
+
+    # Images used by the current build are kept even over the limit
+    cache = ImageCache(str(tmp_path), max_bytes=0)
+    cache.get(session, urls[2])
+    cache.save()
+    assert os.listdir(tmp_path / 'blobs') == [blobs[2]]
+
+
+def test_names_exported_images_by_content(tmp_path, server, session):
+    cache = ImageCache(str(tmp_path / 'cache'))
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    # Same basename, different images
+    first = cache.export(cache.get(session, f"{server.base_url}/docs/11.x/logo.png"), str(output_dir))
+    second = cache.export(cache.get(session, f"{server.base_url}/docs/12.x/logo.png"), str(output_dir))
+    # Another URL of the same image
+    third = cache.export(cache.get(session, f"{server.base_url}/docs/12.x/logo.png?v=2"), str(output_dir))
+
+    assert first != second and second == third
+    assert first.endswith('.png') and second.endswith('.png')
+    assert sorted(os.listdir(output_dir)) == sorted([first, second])
+    assert (output_dir / first).read_bytes() == image_bytes('/docs/11.x/logo.png')
+    assert (output_dir / second).read_bytes() == image_bytes('/docs/12.x/logo.png')
+    assert len(os.listdir(tmp_path / 'cache' / 'blobs')) == 2
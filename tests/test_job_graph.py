@@ -0,0 +1,111 @@
+import operator
+
+import pytest
+
+from processors.job_graph import (Job, JobResult, _check_graph, _priorities, critical_path,
+                                  load_timings, run_jobs, save_timings)
+
+
+def _graph(*jobs: Job) -> dict[str, Job]:
+    return {job.name: job for job in jobs}
+
+
+# preprocess:12.x -> sphinx:12.x -> package:12.x, and the same for 11.x, with a shared fonts job
+JOBS = _graph(
+    Job('fonts', None, cost=1.0),
+    Job('preprocess:12.x', None, cost=2.0),
+    Job('sphinx:12.x', None, inputs=('preprocess:12.x',), deps=('fonts',), cost=10.0),
+    Job('package:12.x', None, inputs=('sphinx:12.x',), cost=1.0),
+    Job('preprocess:11.x', None, cost=2.0),
+    Job('sphinx:11.x', None, inputs=('preprocess:11.x',), deps=('fonts',), cost=5.0),
+)
+
+
+def test_check_graph_orders_dependencies_first():
+    order = _check_graph(JOBS)
+    assert sorted(order) == sorted(JOBS)
+    for name, job in JOBS.items():
+        assert all(order.index(dependency) < order.index(name) for dependency in job.requires)
+
+
+def test_check_graph_rejects_cycles_and_unknown_jobs():
+    with pytest.raises(ValueError, match=r"dependency cycle: a -> b -> c -> a"):
+        _check_graph(_graph(Job('a', None, deps=('b',)), Job('b', None, inputs=('c',)), Job('c', None, deps=('a',))))
+    with pytest.raises(ValueError, match=r"dependency cycle: a -> a"):
+        _check_graph(_graph(Job('a', None, deps=('a',))))
+    with pytest.raises(ValueError, match=r"job 'b' depends on unknown job 'missing'"):
+        _check_graph(_graph(Job('a', None, deps=('b',)), Job('b', None, inputs=('missing',))))
+
+
+def test_priorities_follow_the_longest_path_to_the_end():
+    order = _check_graph(JOBS)
+    priority = _priorities(JOBS, order, {})
+    assert priority['package:12.x'] == 1.0
+    assert priority['sphinx:12.x'] == 11.0
+    assert priority['preprocess:12.x'] == 13.0
+    assert priority['preprocess:11.x'] == 7.0
+    # The longest of the paths through the jobs depending on it
+    assert priority['fonts'] == 12.0
+
+    # Timings of the previous run replace the costs
+    priority = _priorities(JOBS, order, {'sphinx:11.x': 30.0, 'fonts': 0.5})
+    assert priority['preprocess:11.x'] == 32.0
+    assert priority['fonts'] == 30.5
+
+
+def _result(name: str, start: float, end: float, status: str = 'ok') -> JobResult:
+    return JobResult(name, status, start, end)
+
+
+def test_critical_path_follows_the_latest_dependencies():
+    results = {result.name: result for result in [
+        _result('fonts', 0.0, 4.0),
+        _result('preprocess:12.x', 0.0, 1.0),
+        _result('sphinx:12.x', 4.0, 9.0),
+        _result('package:12.x', 9.0, 9.5),
+        _result('preprocess:11.x', 1.0, 3.0),
+        _result('sphinx:11.x', 4.0, 10.0),
+    ]}
+    assert critical_path(JOBS, results) == ['fonts', 'sphinx:11.x']
+
+    # Skipped jobs never ran
+    results['sphinx:11.x'] = _result('sphinx:11.x', 0.0, 0.0, 'skipped')
+    results['fonts'] = _result('fonts', 0.0, 0.5)
+    assert critical_path(JOBS, results) == ['preprocess:12.x', 'sphinx:12.x', 'package:12.x']
+    assert critical_path(JOBS, {name: _result(name, 0, 0, 'skipped') for name in JOBS}) == []
+
+
+def test_skips_the_dependents_of_failed_jobs(tmp_path):
+    finished = []
+    report = run_jobs([
+        Job('sum', operator.add, (1, 2)),
+        Job('product', operator.mul, (10,), inputs=('sum',)),
+        Job('divide', operator.truediv, (1, 0)),
+        Job('negate', operator.neg, inputs=('divide',)),
+        Job('after', operator.abs, (-1,), deps=('negate', 'sum')),
+        Job('unrelated', operator.abs, (-5,)),
+    ], workers=2, log_dir=str(tmp_path / 'logs'), on_finish=lambda result: finished.append(result.name))
+
+    results = report.results
+    assert {name: result.status for name, result in results.items()} == {
+        'sum': 'ok', 'product': 'ok', 'divide': 'failed', 'negate': 'skipped', 'after': 'skipped', 'unrelated': 'ok',
+    }
+    assert results['product'].value == 30
+    assert results['unrelated'].value == 5
+    assert results['divide'].error == 'ZeroDivisionError: division by zero'
+    assert results['negate'].error == 'divide did not succeed'
+    assert results['after'].error == 'negate did not succeed'
+    assert sorted(result.name for result in report.failed) == ['after', 'divide', 'negate']
+    assert sorted(finished) == sorted(results)
+    assert finished.index('negate') > finished.index('divide')
+    assert results['product'].start >= results['sum'].end
+    assert (tmp_path / 'logs' / 'sum.log').exists()
+    # Ends with the job that finished last, following the dependencies that finished last
+    path = report.critical_path
+    assert results[path[-1]].end == max(result.end for result in results.values())
+    assert path in (['sum', 'product'], ['divide'], ['unrelated'])
+
+    # Only successful jobs are timed for the next run
+    save_timings(str(tmp_path), results)
+    assert set(load_timings(str(tmp_path))) == {'sum', 'product', 'unrelated'}
+    assert load_timings(str(tmp_path / 'missing')) == {}
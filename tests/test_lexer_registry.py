@@ -0,0 +1,99 @@
+import os
+import sys
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+import sphinx.highlighting
+from pygments.lexers import PhpLexer, TextLexer
+
+import lexer_registry
+from lexer_registry import LexerRegistry, register_lexers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ALIASES = {
+    'blade': 'html+php',
+    'env': 'ini',
+    'php-line': ('php', {'startinline': True}),
+    'broken': 'no-such-lexer',
+}
+
+
+@pytest.fixture
+def lexers(monkeypatch):
+    """An empty sphinx.highlighting.lexers, and no language registered by an earlier build."""
+    registered = {}
+    monkeypatch.setattr(sphinx.highlighting, 'lexers', registered)
+    monkeypatch.setattr(lexer_registry, 'lexers', registered)
+    monkeypatch.setattr(lexer_registry, '_registered', set())
+    return registered
+
+
+def _app(aliases: dict, highlight_options: dict | None = None):
+    return SimpleNamespace(config=SimpleNamespace(lexer_registry_aliases=aliases,
+                                                  highlight_options=highlight_options or {}))
+
+
+def test_resolves_aliases_with_options():
+    registry = LexerRegistry(ALIASES)
+    assert registry.resolve('blade') == ('html+php', {})
+    assert registry.resolve('php-line') == ('php', {'startinline': True})
+    # Not an alias: looked up as a Pygments name
+    assert registry.resolve('json') == ('json', {})
+    assert registry.resolve('antlers') is None
+    assert registry.resolve('broken') is None
+
+    lexer = registry.lexer('php-line')
+    assert isinstance(lexer, PhpLexer)
+    assert lexer.startinline
+    assert not registry.lexer('php').startinline
+    # Built once per lexer name and options
+    assert registry.lexer('php-line') is lexer
+    assert registry.lexer('antlers') is None
+
+
+def test_unknown_languages_fall_back_to_plain_text(lexers):
+    register_lexers(_app(ALIASES), {'routing': Counter({'blade': 2, 'antlers': 1, 'php': 1, 'python': 1})})
+    assert lexers['blade'].name == 'HTML+PHP'
+    assert type(lexers['antlers']) is TextLexer
+    # Sphinx resolves its own languages, and the ones it has lexer classes for
+    assert 'python' not in lexers
+    assert 'php' in lexers
+
+
+def test_leaves_highlight_options_to_sphinx(lexers):
+    register_lexers(_app({}, {'php': {'startinline': True}}), {'routing': Counter({'php': 1})})
+    assert 'php' not in lexers
+
+
+def test_reregisters_across_builds(lexers):
+    # A lexer from the configuration (e.g. app.add_lexer) is never replaced
+    lexers['custom'] = configured = TextLexer()
+
+    register_lexers(_app(ALIASES), {'routing': Counter({'blade': 1, 'custom': 1})})
+    assert lexers['blade'].name == 'HTML+PHP'
+    assert lexers['custom'] is configured
+
+    # The next build in the same process (watch mode) with an edited alias table
+    register_lexers(_app({'blade': ('php', {'startinline': True})}), {'routing': Counter({'blade': 1, 'custom': 1})})
+    assert isinstance(lexers['blade'], PhpLexer)
+    assert lexers['blade'].startinline
+    assert lexers['custom'] is configured
+
+
+def test_benchmark_highlights_with_the_registered_lexers(lexers, monkeypatch):
+    monkeypatch.setattr(sys, 'path', [os.path.join(ROOT, 'benchmarks'), *sys.path])
+    import bench_parallel_build
+
+    bench_parallel_build._init_highlighter(os.path.join(ROOT, 'template', '12.x'), 'friendly_grayscale',
+                                           {'blade', 'php-line', 'env', 'antlers'})
+    assert lexers['blade'].name == 'HTML+PHP'
+    assert lexers['php-line'].startinline
+    assert lexers['env'].name == 'INI'
+    assert type(lexers['antlers']) is not TextLexer  # an alias of the template ('html')
+    html = bench_parallel_build._highlighter.highlight_block('$user = 1;', 'php-line', opts={})
+    # Highlighted as PHP without the <?php tag, not as plain text
+    assert 'class="nv"' in html
+    # The template's configuration is imported again by other tests
+    sys.modules.pop('conf_common', None)
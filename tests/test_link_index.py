@@ -0,0 +1,147 @@
+"""
+The link index must report exactly the links myst cannot resolve: a small book is built with the
+template and the preprocess warnings are compared with Sphinx's myst.xref_missing warnings.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from processors.link_index import LinkIndex, build_link_index
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DOCUMENTS = {
+    'routing': (
+        '# Routing\n'
+        '\n'
+        '- [Basic Routing](#basic-routing)\n'
+        '- [Redirects](#redirect-routes)\n'
+        '- [Parameters](#route-parameters)\n'
+        '- [Deep](#optional-parameters)\n'
+        '\n'
+        '<a name="basic-routing"></a>\n'
+        '## Basic Routing\n'
+        '\n'
+        'See [views](/docs/{{version}}/views) and [data](/docs/{{version}}/views#passing-data-to-views).\n'
+        '\n'
+        '<a name="redirect-routes"></a>\n'
+        '### Redirect Routes\n'
+        '\n'
+        '<a name="route-parameters"></a>\n'
+        '## Parameters\n'
+        '\n'
+        '<a name="optional-parameters"></a>\n'
+        '##### Optional Parameters\n'
+        '\n'
+        '## Examples\n'
+        '\n'
+        '## Examples\n'
+        '\n'
+        '## Examples\n'
+        '\n'
+        '### The `Route::get` Method\n'
+        '\n'
+        '```php\n'
+        '## Not A Heading\n'
+        '[fenced](/docs/{{version}}/missing)\n'
+        '```\n'
+    ),
+    'views': (
+        '# Views\n'
+        '\n'
+        '## Passing Data to Views\n'
+        '\n'
+        '#### Sharing **Data** With [All](https://example.com) Views\n'
+        '\n'
+        '- [routing](/docs/{{version}}/routing#basic-routing)\n'
+        '- [redirects](/docs/{{version}}/routing#redirect-routes)\n'
+        '- [deep](/docs/{{version}}/routing#optional-parameters)\n'
+        '- [examples](/docs/{{version}}/routing#examples-1)\n'
+        '- [third example](/docs/{{version}}/routing#examples-2)\n'
+        '- [third example](/docs/{{version}}/routing#examples-1-2)\n'
+        '- [code](/docs/{{version}}/routing#the-routeget-method)\n'
+        '- [fenced](/docs/{{version}}/routing#not-a-heading)\n'
+        '- [sharing](#sharing-data-with-all-views)\n'
+        '- [nope](#nope)\n'
+        '- [missing page](/docs/{{version}}/missing)\n'
+    ),
+}
+
+
+def test_indexes_headings_up_to_the_anchor_depth():
+    index = build_link_index(DOCUMENTS, heading_anchors=4)
+    assert index.pages['routing'] == {
+        'routing', 'basic-routing', 'redirect-routes', 'parameters',
+        'examples', 'examples-1', 'examples-1-2', 'the-routeget-method',
+    }
+    assert index.pages['views'] == {'views', 'passing-data-to-views', 'sharing-data-with-all-views'}
+
+    shallow = build_link_index(DOCUMENTS, heading_anchors=2)
+    assert 'redirect-routes' not in shallow.pages['routing']
+    assert 'sharing-data-with-all-views' not in shallow.pages['views']
+
+
+def test_ignores_html_anchors():
+    index = LinkIndex(heading_anchors=0)
+    index.add('routing', DOCUMENTS['routing'])
+    assert index.pages['routing'] == set()
+    assert index.check('routing', 'basic-routing') == 'anchor'
+    assert index.check('routing') is None
+
+
+def test_reports_dangling_links():
+    index = build_link_index(DOCUMENTS, heading_anchors=4)
+    assert [str(link) for link in index.dangling()] == [
+        'routing.md:5: link to routing#route-parameters: anchor not found',
+        'routing.md:6: link to routing#optional-parameters: anchor not found',
+        'views.md:9: link to routing#optional-parameters: anchor not found',
+        'views.md:11: link to routing#examples-2: anchor not found',
+        'views.md:14: link to routing#not-a-heading: anchor not found',
+        'views.md:16: link to views#nope: anchor not found',
+        'views.md:17: link to missing: page not found',
+    ]
+
+
+# Sphinx reports the source path and line of every warning
+WARNING_PATTERN = re.compile(r'^(?P<path>[^:\s]+\.md):(?P<line>\d+): WARNING: (?P<message>.*)$')
+
+
+def _warnings(path: str, kind: str) -> set[tuple[str, int]]:
+    locations = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = WARNING_PATTERN.match(line.strip())
+            if match and kind in match['message']:
+                locations.add((os.path.basename(match['path']), int(match['line'])))
+    return locations
+
+
+@pytest.mark.parametrize('variant', ['grayscale'])
+def test_dangling_links_agree_with_sphinx(tmp_path, variant):
+    os.symlink(os.path.join(ROOT, 'sphinx_extensions'), tmp_path / 'sphinx_extensions')
+    os.symlink(os.path.join(ROOT, 'bin'), tmp_path / 'bin')
+    shutil.copytree(os.path.join(ROOT, 'template', '12.x'), tmp_path / 'book')
+    (tmp_path / 'source').mkdir()
+    for page, content in DOCUMENTS.items():
+        (tmp_path / 'source' / f"{page}.md").write_text(content, encoding='utf-8')
+
+    warnings = str(tmp_path / 'warnings.txt')
+    command = [
+        sys.executable, '-m', 'sphinx', '-q', '-b', 'epub', '--conf-dir', '.', '-w', warnings,
+        '-D', 'torchlight_cache_dir=',
+        '-D', 'image_optimizer_enabled=0',
+        '_source', str(tmp_path / 'build'),
+    ]
+    env = {**os.environ, 'SPHINX_CUSTOM_CONFIG': variant}
+    subprocess.run(command, cwd=tmp_path / 'book', env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    dangling = _warnings(warnings, '[preprocess.dangling_link]')
+    missing = _warnings(warnings, '[myst.xref_missing]')
+    assert len(dangling) == len(build_link_index(DOCUMENTS).dangling())
+    assert dangling == missing
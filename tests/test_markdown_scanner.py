@@ -0,0 +1,100 @@
+import io
+
+import pytest
+
+from processors import pipeline
+from processors.markdown_scanner import Fence, Prose, iter_lines, iter_segments, render, scan
+from processors.pipeline import run_pipeline, stream_pipeline
+
+DOCUMENT = (
+    '# Routing\n'
+    '\n'
+    'Inline ```code``` is not a fence.\n'
+    '\n'
+    '~~~php\n'
+    '```\n'
+    '$user = 1;\n'
+    '~~~\n'
+    '\n'
+    '- A list item:\n'
+    '\n'
+    '    ```shell\n'
+    '    php artisan route:list\n'
+    '    ```\n'
+    '\n'
+    '````md\n'
+    '```php\n'
+    'echo 1;\n'
+    '```\n'
+    '``````  \n'
+    'The end.\n'
+)
+
+
+def _fences(segments) -> list[Fence]:
+    return [segment for segment in segments if isinstance(segment, Fence)]
+
+
+def test_scan_and_render_round_trip():
+    segments = scan(DOCUMENT)
+    assert render(segments) == DOCUMENT
+    assert [type(segment) for segment in segments] == [Prose, Fence, Prose, Fence, Prose, Fence, Prose]
+    assert segments[0].text == '# Routing\n\nInline ```code``` is not a fence.\n\n'
+    assert segments[-1].text == 'The end.\n'
+
+
+def test_fence_markers():
+    tilde, indented, longer = _fences(scan(DOCUMENT))
+    # A backtick line does not close a ~~~ fence
+    assert (tilde.marker, tilde.language, tilde.body, tilde.closing) == ('~~~', 'php', '```\n$user = 1;\n', '~~~\n')
+    # A fence indented inside a list keeps its indentation
+    assert (indented.indent, indented.info, indented.body, indented.closing) == (
+        '    ', 'shell', '    php artisan route:list\n', '    ```\n')
+    # Only a closing fence at least as long as the opening one closes it
+    assert (longer.marker, longer.body, longer.closing) == ('````', '```php\necho 1;\n```\n', '``````  \n')
+
+
+def test_unclosed_fence_runs_to_the_end():
+    content = 'Text\n```php\necho 1;\n```js\n'
+    [prose, fence] = scan(content)
+    assert prose.text == 'Text\n'
+    # A fence line with an info string does not close the fence
+    assert (fence.body, fence.closing) == ('echo 1;\n```js\n', '')
+    assert render([prose, fence]) == content
+
+
+@pytest.mark.parametrize('content', ['Text\n```php\necho 1;\n```', '```\n', 'Text without newline', ''])
+def test_missing_trailing_newline(content):
+    segments = scan(content)
+    assert render(segments) == content
+    assert list(iter_lines(content)) == content.splitlines(keepends=True)
+    if content.startswith('```\n'):
+        assert segments == [Fence('', '```', '', '\n', '', '')]
+    if content.endswith('```'):
+        assert segments[-1].closing == '```'
+
+
+def test_prose_limit_splits_at_paragraph_ends():
+    paragraphs = ''.join(f"Paragraph {number} with a [link](/docs/{{{{version}}}}/views).\n\n" for number in range(20))
+    content = paragraphs + '```php\necho 1;\n```\n' + paragraphs
+    segments = list(iter_segments(iter_lines(content), prose_limit=100))
+    assert render(segments) == content
+    prose = [segment for segment in segments if isinstance(segment, Prose)]
+    assert len(prose) > 2
+    # Every piece ends with a paragraph
+    assert all(segment.text.endswith('\n\n') for segment in prose[:-1])
+    assert _fences(segments) == _fences(scan(content))
+
+
+def test_prose_limit_gives_the_same_output(monkeypatch):
+    paragraphs = ''.join(f"See [views {number}](/docs/{{{{version}}}}/views#passing-data) and "
+                         f'<img src="https://laravel.com/img/{number}.png">\n\n' for number in range(30))
+    content = paragraphs + '```diff\n+added\n```\n\n' + paragraphs + '```php\n$user = 1;\n```'
+    replacements = {'https://laravel.com/img/3.png': '_static/laravel/3.png'}
+    expected = run_pipeline(content, 'unused', replacements)
+
+    monkeypatch.setattr(pipeline, 'STREAM_PROSE_LIMIT', 200)
+    stats = {}
+    assert ''.join(stream_pipeline(io.StringIO(content), replacements, stats)) == expected
+    # Prose was handled in several pieces
+    assert stats['link_handler.process_links']['calls'] > 3
@@ -0,0 +1,46 @@
+"""
+Serial and parallel builds must produce the same book: a small generated corpus is built with the
+book template once with -j 1 and once with -j 2, and every output file is compared.
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from bench_parallel_build import compare_trees, sphinx_build
+from corpus import generate_corpus
+
+# More documents than Sphinx needs before it reads and writes in parallel
+FILES = 12
+
+
+@pytest.fixture(scope='module')
+def workspace(tmp_path_factory):
+    """Same layout as the project: book (the template), source, sphinx_extensions and bin."""
+    workspace = tmp_path_factory.mktemp('workspace')
+    os.symlink(os.path.join(ROOT, 'sphinx_extensions'), workspace / 'sphinx_extensions')
+    os.symlink(os.path.join(ROOT, 'bin'), workspace / 'bin')
+    shutil.copytree(os.path.join(ROOT, 'template', '12.x'), workspace / 'book')
+    # Images are left as remote URLs: nothing is fetched during the test
+    generate_corpus(str(workspace / 'source'), FILES, image_base='https://example.invalid')
+    with open(workspace / 'book' / 'conf_common.py', 'a', encoding='utf-8') as f:
+        f.write("\npreprocess_offline = True\n")
+    return workspace
+
+
+@pytest.mark.parametrize('variant', ['grayscale'])
+def test_serial_and_parallel_builds_are_identical(workspace, variant):
+    book_dir = str(workspace / 'book')
+    serial_dir = str(workspace / 'build' / 'serial')
+    parallel_dir = str(workspace / 'build' / 'parallel')
+
+    sphinx_build(book_dir, serial_dir, variant, '1')
+    sphinx_build(book_dir, parallel_dir, variant, '2')
+
+    assert any(name.endswith('.xhtml') for name in os.listdir(serial_dir))
+    assert compare_trees(serial_dir, parallel_dir) == []
@@ -0,0 +1,59 @@
+import os
+
+from preprocess import RawSources
+from processors.manifest import load_staged
+
+
+def _sources(tmp_path):
+    source_dir = tmp_path / 'source'
+    srcdir = tmp_path / '_source'
+    source_dir.mkdir()
+    srcdir.mkdir()
+    (source_dir / 'routing.md').write_text('# Routing\n', encoding='utf-8')
+    (source_dir / 'views.md').write_text('# Views\n', encoding='utf-8')
+    return source_dir, srcdir, RawSources(str(source_dir), str(tmp_path / 'static'))
+
+
+def test_stages_raw_documents(tmp_path):
+    source_dir, srcdir, raw_sources = _sources(tmp_path)
+    assert raw_sources.stage(str(srcdir)) == []
+    assert (srcdir / 'routing.md').read_text(encoding='utf-8') == '# Routing\n'
+    assert set(raw_sources.docs) == {'routing', 'views'}
+    assert set(load_staged(str(srcdir))) == {'routing.md', 'views.md'}
+
+
+def test_rewrites_only_changed_documents(tmp_path):
+    source_dir, srcdir, raw_sources = _sources(tmp_path)
+    raw_sources.stage(str(srcdir))
+    os.utime(srcdir / 'routing.md', (0, 0))
+    os.utime(srcdir / 'views.md', (0, 0))
+
+    (source_dir / 'views.md').write_text('# Views\n\nEdited\n', encoding='utf-8')
+    raw_sources.stage(str(srcdir))
+    # Sphinx re-reads the documents whose file is newer than the environment
+    assert os.path.getmtime(srcdir / 'routing.md') == 0
+    assert os.path.getmtime(srcdir / 'views.md') > 0
+    assert (srcdir / 'views.md').read_text(encoding='utf-8') == '# Views\n\nEdited\n'
+
+
+def test_removes_copies_of_deleted_documents(tmp_path):
+    source_dir, srcdir, raw_sources = _sources(tmp_path)
+    raw_sources.stage(str(srcdir))
+    (source_dir / 'views.md').unlink()
+    raw_sources.stage(str(srcdir))
+    assert not (srcdir / 'views.md').exists()
+    assert set(raw_sources.docs) == {'routing'}
+
+
+def test_leaves_files_it_did_not_write(tmp_path):
+    source_dir, srcdir, raw_sources = _sources(tmp_path)
+    # e.g. a copy written by preprocess_docs.py
+    (srcdir / 'views.md').write_text('# Views (preprocessed)\n', encoding='utf-8')
+    assert raw_sources.stage(str(srcdir)) == ['views']
+    assert (srcdir / 'views.md').read_text(encoding='utf-8') == '# Views (preprocessed)\n'
+    assert set(raw_sources.docs) == {'routing'}
+
+    # Nor removes them once the raw document is deleted
+    (source_dir / 'views.md').unlink()
+    raw_sources.stage(str(srcdir))
+    assert (srcdir / 'views.md').exists()
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import preprocess_docs
+from processors.manifest import MANIFEST_FILENAME
+from processors.pipeline import pipeline_version
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    source_dir = tmp_path / 'source'
+    output_dir = tmp_path / 'output'
+    source_dir.mkdir()
+    (source_dir / 'kept.md').write_text('# Kept\n\ntext\n', encoding='utf-8')
+    (source_dir / 'deleted.md').write_text('# Deleted\n', encoding='utf-8')
+    preprocess_docs.convert_content(str(source_dir), str(output_dir))
+    assert (output_dir / 'deleted.md').is_file()
+    (source_dir / 'deleted.md').unlink()
+    return source_dir, output_dir
+
+
+def _manifest(output_dir):
+    with open(output_dir / MANIFEST_FILENAME, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_removes_stale_output(dirs):
+    source_dir, output_dir = dirs
+    preprocess_docs.convert_content(str(source_dir), str(output_dir))
+    assert not (output_dir / 'deleted.md').exists()
+    assert set(_manifest(output_dir)['files']) == {'kept.md'}
+
+
+def test_removes_stale_output_with_force(dirs):
+    source_dir, output_dir = dirs
+    preprocess_docs.convert_content(str(source_dir), str(output_dir), force=True)
+    assert not (output_dir / 'deleted.md').exists()
+
+
+def test_removes_stale_output_when_fingerprint_changes(dirs):
+    """處理器版本或設定改變時清單失效，但其中的檔案仍要依舊清單移除。"""
+    source_dir, output_dir = dirs
+    manifest = _manifest(output_dir)
+    manifest['fingerprint'] = 'previous-pipeline'
+    with open(output_dir / MANIFEST_FILENAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+    preprocess_docs.convert_content(str(source_dir), str(output_dir))
+    assert not (output_dir / 'deleted.md').exists()
+    assert (output_dir / 'kept.md').is_file()
+    assert _manifest(output_dir)['fingerprint'] != 'previous-pipeline'
+
+
+def test_keeps_unmanaged_files(dirs):
+    """不在清單中的檔案 (例如手動加入的頁面) 不會被移除。"""
+    source_dir, output_dir = dirs
+    (output_dir / 'manual.md').write_text('# Manual\n', encoding='utf-8')
+    preprocess_docs.convert_content(str(source_dir), str(output_dir), force=True)
+    assert os.path.isfile(output_dir / 'manual.md')
+
+
+def test_unrelated_modules_do_not_invalidate_the_manifest(dirs, tmp_path, monkeypatch, capsys):
+    """只有處理器鏈執行的模組會影響版本，修改 epub_validator 等其他模組不需重新處理。"""
+    source_dir, output_dir = dirs
+    processors_dir = tmp_path / 'processors'
+    shutil.copytree(os.path.join(os.path.dirname(preprocess_docs.__file__), 'processors'), processors_dir)
+    monkeypatch.setattr(preprocess_docs, 'pipeline_version', lambda: pipeline_version(str(processors_dir)))
+    preprocess_docs.convert_content(str(source_dir), str(output_dir))
+
+    for name in ('epub_validator.py', 'job_graph.py', 'build_stamp.py', 'timing.py'):
+        with open(processors_dir / name, 'a', encoding='utf-8') as f:
+            f.write('\n# edited\n')
+    capsys.readouterr()
+    preprocess_docs.convert_content(str(source_dir), str(output_dir))
+    assert 'Total files processed: 0' in capsys.readouterr().out
+
+    with open(processors_dir / 'link_handler.py', 'a', encoding='utf-8') as f:
+        f.write('\n# edited\n')
+    preprocess_docs.convert_content(str(source_dir), str(output_dir))
+    assert 'Total files processed: 1' in capsys.readouterr().out
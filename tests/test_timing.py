@@ -0,0 +1,139 @@
+import io
+import os
+from functools import partial
+
+from build_report import BuildReport, _summarize
+from processors import timing
+from processors.image_handler import rewrite_images
+from processors.pipeline import pipeline_stages, run_pipeline, stream_pipeline
+from processors.timing import Stopwatch, handler_name, merge, record, slowest
+
+DOCUMENT = (
+    '# Routing\n'
+    '\n'
+    'See [views](/docs/{{version}}/views#passing-data) and <img src="https://laravel.com/img/logo.png">.\n'
+    '\n'
+    '```diff\n'
+    '+added\n'
+    '```\n'
+    '\n'
+    '```php\n'
+    '$user = 1;\n'
+    '```\n'
+)
+REPLACEMENTS = {'https://laravel.com/img/logo.png': '_static/laravel/logo.png'}
+
+
+def test_stopwatch_accumulates_laps(monkeypatch):
+    ticks = iter([0.0, 1.0, 3.0, 3.5])
+    monkeypatch.setattr(timing.time, 'perf_counter', lambda: next(ticks))
+    stopwatch = Stopwatch()
+    assert stopwatch.lap('scan') == 1.0
+    assert stopwatch.lap('process') == 2.0
+    assert stopwatch.lap('scan') == 0.5
+    assert stopwatch.stages == {'scan': 1.5, 'process': 2.0}
+
+
+def test_merge_and_slowest():
+    first, second = {}, {}
+    record(first, 'link_handler.process_links', 1.0, 10, 12)
+    record(first, 'link_handler.process_links', 0.5, 5, 5)
+    record(second, 'link_handler.process_links', 0.25, 1, 2)
+    record(second, 'diff_handler.convert_diff_fence', 2.0, 3, 4)
+
+    total = {}
+    merge(total, first)
+    merge(total, second)
+    assert total == {
+        'link_handler.process_links': {'calls': 3, 'seconds': 1.75, 'bytes_in': 16, 'bytes_out': 19},
+        'diff_handler.convert_diff_fence': {'calls': 1, 'seconds': 2.0, 'bytes_in': 3, 'bytes_out': 4},
+    }
+    # The inputs are left as they were
+    assert first['link_handler.process_links']['calls'] == 2
+
+    items = [{'name': name, 'seconds': seconds, 'bytes': size}
+             for name, seconds, size in (('a', 1.0, 30), ('b', 3.0, 10), ('c', 2.0, 20))]
+    assert [item['name'] for item in slowest(items)] == ['b', 'c', 'a']
+    assert [item['name'] for item in slowest(items, 2, key='bytes')] == ['a', 'c']
+
+
+def test_handler_name_of_bound_handlers():
+    assert handler_name(rewrite_images) == 'image_handler.rewrite_images'
+    assert handler_name(partial(rewrite_images, replacements={})) == 'image_handler.rewrite_images'
+
+
+def test_timing_does_not_change_the_output():
+    stats = {}
+    output = run_pipeline(DOCUMENT, 'unused', REPLACEMENTS, stats)
+    assert output == run_pipeline(DOCUMENT, 'unused', REPLACEMENTS)
+    assert '_static/laravel/logo.png' in output and '(views.md#passing-data)' in output
+    assert set(stats) == {
+        'markdown_scanner.scan', 'markdown_scanner.render', 'image_handler.rewrite_images',
+        'link_handler.process_links', 'diff_handler.convert_diff_fence', 'php_tag_handler.convert_php_fence',
+        'tab_handler.convert_tab_fence',
+    }
+    # Every fence handler runs on both fences, every prose handler on every prose segment
+    assert stats['diff_handler.convert_diff_fence']['calls'] == 2
+    assert stats['image_handler.rewrite_images']['calls'] == stats['link_handler.process_links']['calls']
+    assert stats['markdown_scanner.scan']['bytes_in'] == len(DOCUMENT.encode('utf-8'))
+    assert stats['markdown_scanner.render']['bytes_out'] == len(output.encode('utf-8'))
+
+    streamed = {}
+    assert ''.join(stream_pipeline(io.StringIO(DOCUMENT), REPLACEMENTS, streamed)) == output
+    assert set(streamed) == set(stats) - {'markdown_scanner.render'}
+    for name in streamed:
+        if name != 'markdown_scanner.scan':
+            assert streamed[name]['bytes_out'] == stats[name]['bytes_out']
+
+    # The stages used to blame a processor apply the same handlers in the same order
+    stages = list(pipeline_stages(DOCUMENT, REPLACEMENTS))
+    assert [name for name, _ in stages] == [
+        'source', 'image_handler.rewrite_images', 'link_handler.process_links', 'diff_handler.convert_diff_fence',
+        'php_tag_handler.convert_php_fence', 'tab_handler.convert_tab_fence',
+    ]
+    assert stages[-1][1] == output
+
+
+def test_build_report_merges_forked_processes(tmp_path):
+    path = tmp_path / 'build-report.json'
+    path.write_text('{}', encoding='utf-8')
+    report = BuildReport(str(path))
+    # The previous report is not packaged into the EPUB
+    assert not path.exists()
+
+    report.start_phase('read')
+    report.add({'kind': 'read', 'docname': 'routing', 'seconds': 1.0})
+    report.add({'kind': 'processors', 'docname': 'routing',
+                'processors': {'link_handler.process_links': {'calls': 1, 'seconds': 0.5, 'bytes_in': 1, 'bytes_out': 1}}})
+    pid = os.fork()
+    if pid == 0:
+        # A parallel reader: its records go to a file of its own
+        try:
+            report.add({'kind': 'read', 'docname': 'views', 'seconds': 2.0})
+            report.add({'kind': 'processors', 'docname': 'views',
+                        'processors': {'link_handler.process_links': {'calls': 2, 'seconds': 1.0,
+                                                                      'bytes_in': 2, 'bytes_out': 2}}})
+            report.add({'kind': 'block', 'docname': 'views', 'seconds': 0.25})
+            report._parts_file.close()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    report.add({'kind': 'write', 'docname': 'views', 'seconds': 0.5})
+    report.start_phase('write')
+    report.start_phase(None)
+    assert set(report.phases) == {'read', 'write'}
+
+    records = report.collect()
+    assert not os.path.exists(report.parts_dir)
+    assert len(records) == 6
+
+    documents, blocks, processors = _summarize(records)
+    assert documents['routing'] == {
+        'docname': 'routing', 'seconds': 1.0, 'read': 1.0,
+        'processors': {'link_handler.process_links': {'calls': 1, 'seconds': 0.5, 'bytes_in': 1, 'bytes_out': 1}},
+    }
+    assert documents['views']['read'] == 2.0
+    assert documents['views']['write'] == 0.5
+    assert documents['views']['seconds'] == 2.5
+    assert blocks == [{'kind': 'block', 'docname': 'views', 'seconds': 0.25}]
+    assert processors['link_handler.process_links'] == {'calls': 3, 'seconds': 1.5, 'bytes_in': 3, 'bytes_out': 3}
@@ -0,0 +1,39 @@
+import io
+
+from pygments.lexers import get_lexer_by_name
+
+from torchlight import CompactTorchlightHtmlFormatter, TorchlightHtmlFormatter
+
+UNCLOSED_ADD = '''$a = 1;
+$b = 2; // [tl! add:start]
+$c = 3;
+'''
+UNCLOSED_REMOVE = '''$a = 1; // [tl! remove:start]
+$b = 2;
+'''
+PLAIN = '''$d = 4;
+$e = 5;
+'''
+
+
+def _format(formatter, code: str) -> str:
+    out = io.StringIO()
+    formatter.format(get_lexer_by_name('php', startinline=True).get_tokens(code), out)
+    return out.getvalue()
+
+
+def _highlighted_lines(html: str) -> int:
+    return html.count('class="hll"') + html.count('class="dll"')
+
+
+def test_unclosed_range_does_not_leak_into_next_block():
+    for formatter_class in (TorchlightHtmlFormatter, CompactTorchlightHtmlFormatter):
+        for unclosed in (UNCLOSED_ADD, UNCLOSED_REMOVE):
+            # Sphinx may format several blocks with one instance (relaxed-mode retry)
+            formatter = formatter_class(style='friendly_grayscale')
+            first = _format(formatter, unclosed)
+            second = _format(formatter, PLAIN)
+
+            assert _highlighted_lines(first) == 2
+            assert _highlighted_lines(second) == 0
+            assert second == _format(formatter_class(style='friendly_grayscale'), PLAIN)
@@ -0,0 +1,79 @@
+"""
+Golden-file tests of TorchlightHtmlFormatter: the HTML of every fixture must stay byte-identical.
+
+Inputs are tests/fixtures/torchlight/<source>.txt, expected output <case>.html. The expected
+files were produced by the formatter as it was before its rewrite for speed; regenerate them
+only for an intended change of the markup:
+
+    python3 tests/test_torchlight_golden.py --update
+"""
+
+import io
+import os
+import sys
+
+import pytest
+from pygments.lexers import get_lexer_by_name
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures', 'torchlight')
+
+# Also run directly (--update), without conftest.py
+sys.path.insert(0, os.path.join(ROOT, 'sphinx_extensions'))
+
+from torchlight import TorchlightHtmlFormatter
+
+STYLE = 'friendly_grayscale'
+
+# case -> (source fixture, Pygments lexer name, lexer options, formatter options)
+CASES = {
+    # [tl! add] and an [tl! add:start] / [tl! add:end] range, docblock
+    'php': ('php', 'php', {}, {}),
+    # emphasize-lines on top of the tags
+    'php_hl_lines': ('php', 'php', {}, {'hl_lines': [2, 3, 20]}),
+    # Line numbers of several widths (padding inside the linenos span)
+    'php_linenostart': ('php', 'php', {}, {'linenostart': 95}),
+    # [tl! remove] and an [tl! remove:start] / [tl! remove:end] range
+    'php_line': ('php_line', 'php', {'startinline': True}, {}),
+    # Stray [tl! add:end], two tags on a line, tab indentation, unclosed [tl! remove:start]
+    'javascript': ('javascript', 'javascript', {}, {}),
+    'js': ('js', 'javascript', {}, {}),
+    'json': ('json', 'json', {}, {}),
+    'blade': ('blade', 'html+php', {}, {}),
+    'shell': ('shell', 'bash', {}, {}),
+    'env': ('env', 'ini', {}, {}),
+    # Leading spaces in docstring (sd) spans, whitespace (w) spans
+    'python': ('python', 'python', {}, {}),
+    'yaml': ('yaml', 'yaml', {}, {}),
+    'diff': ('diff', 'diff', {}, {}),
+}
+
+
+def render(case: str) -> str:
+    source, lexer_name, lexer_options, formatter_options = CASES[case]
+    with open(os.path.join(FIXTURES, f'{source}.txt'), encoding='utf-8') as f:
+        code = f.read()
+    lexer = get_lexer_by_name(lexer_name, **lexer_options)
+    out = io.StringIO()
+    TorchlightHtmlFormatter(style=STYLE, **formatter_options).format(lexer.get_tokens(code), out)
+    return out.getvalue()
+
+
+def expected_path(case: str) -> str:
+    return os.path.join(FIXTURES, f'{case}.html')
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_matches_golden_file(case):
+    with open(expected_path(case), encoding='utf-8', newline='') as f:
+        expected = f.read()
+    assert render(case) == expected
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['--update']:
+        sys.exit(__doc__)
+    for case in sorted(CASES):
+        with open(expected_path(case), 'w', encoding='utf-8', newline='') as f:
+            f.write(render(case))
+        print(f"Updated {expected_path(case)}")